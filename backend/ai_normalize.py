@@ -1,19 +1,55 @@
-import subprocess
-import json
-
-def normalize_ingredients(ingredient_list):
-    # ถ้ามีสารเยอะมาก (>20) ให้ข้ามเพื่อความเร็ว
-    if len(ingredient_list) > 50:
-        print("⚠️ สารมีจำนวนมาก - ข้าม normalize")
-        return [
-            {
-                "original": ing,
-                "corrected": ing,
-                "confidence": "ต่ำ"
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from inci_normalizer import normalize_with_dictionary
+from llm_client import LLMTimeout
+from llm_scheduler import get_scheduler
+from result_cache import get_normalize_memo
+
+# โมเดลที่ใช้ normalize (อยู่ใน key ของ memo - เปลี่ยนโมเดลแล้วจะถามใหม่)
+NORMALIZE_MODEL = config.LLM_MODEL
+
+# JSON schema ของคำตอบ (ส่งเป็น format ให้ server บังคับรูปแบบคำตอบ)
+NORMALIZE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "original": {"type": "string"},
+                    "corrected": {"type": "string"},
+                    "confidence": {"type": "string", "enum": ["สูง", "กลาง", "ต่ำ"]}
+                },
+                "required": ["original", "corrected", "confidence"]
             }
-            for ing in ingredient_list
-        ]
-    
+        }
+    },
+    "required": ["results"]
+}
+
+# thread ที่ส่ง chunk ให้ LLM พร้อมกัน (ใช้ร่วมกันทุก request ใน process)
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+
+def memo_key(ingredient):
+    """key ของชื่อสารใน memo - ตัวพิมพ์/ช่องว่างไม่มีผล"""
+    return f"normalize:{NORMALIZE_MODEL}|{' '.join(ingredient.upper().split())}"
+
+
+def _uncorrected(ingredient):
+    return {"original": ingredient, "corrected": ingredient, "confidence": "ต่ำ"}
+
+
+def _ask_llm(ingredient_list, timeout):
+    """
+    ถาม LLM ให้แก้ชื่อสารทั้งรายการใน prompt เดียว
+    คืน list ผลจาก LLM หรือ None ถ้า LLM ตอบไม่ได้ / ไม่เป็น JSON / เกินเวลา
+    """
     ingredients_text = "\n".join(ingredient_list)
 
     prompt = f"""
@@ -37,51 +73,235 @@ Input คือรายการชื่อสารที่อ่านจ
 Input: "Salicylic 0id"
 Output: {{"original": "Salicylic 0id", "corrected": "Salicylic Acid", "confidence": "สูง"}}
 
-ตอบเป็น JSON Array เท่านั้น:
-[
-  {{
-    "original": "ชื่อเดิม",
-    "corrected": "ชื่อที่แก้แล้ว",
-    "confidence": "สูง | กลาง | ต่ำ"
-  }}
-]
+ตอบเป็น JSON object ที่มี key "results" เป็น array เท่านั้น:
+{{
+  "results": [
+    {{
+      "original": "ชื่อเดิม",
+      "corrected": "ชื่อที่แก้แล้ว",
+      "confidence": "สูง | กลาง | ต่ำ"
+    }}
+  ]
+}}
 """
 
-    print("⏳ รอ AI normalize... )")
-    
     try:
-        result = subprocess.run(
-            ["ollama", "run", "scb10x/llama3.1-typhoon2-8b-instruct"],
-            input=prompt,
-            text=True,
-            capture_output=True,
-            encoding="utf-8",
-            timeout=1800  # เพิ่ม timeout 60 วินาที
-        )
+        # บังคับให้ server ตอบเป็น JSON ตาม schema (ไม่ต้องหา JSON จากข้อความเอง)
+        parsed = get_scheduler().generate(prompt, format=NORMALIZE_SCHEMA, timeout=timeout)
+        results = parsed.get("results") if isinstance(parsed, dict) else parsed
+        if not isinstance(results, list):
+            print(f"❌ AI ตอบไม่ตรงรูปแบบ: {str(parsed)[:200]}")
+            return None
+        return results
 
-        output = result.stdout.strip()
-        
-        # หา JSON array จากผลลัพธ์
-        try:
-            parsed = json.loads(output)
-            print("✅ Normalize สำเร็จ")
-            return parsed
-        except json.JSONDecodeError as e:
-            print(f"❌ AI ตอบไม่เป็น JSON: {e}")
-            print("Raw:", output[:200])
-            raise  # ส่ง error ต่อไป
-            
-    except subprocess.TimeoutExpired:
-        print("❌ AI Normalize timeout")
-        raise
+    except LLMTimeout:
+        print(f"❌ AI Normalize timeout ({timeout}s)")
+        return None
     except Exception as e:
         print(f"❌ Normalize error: {e}")
-        # Fallback: คืนค่าเดิม
-        return [
-            {
-                "original": ing,
-                "corrected": ing,
-                "confidence": "ต่ำ"
-            }
-            for ing in ingredient_list
-        ]
\ No newline at end of file
+        return None
+
+
+def _match_results(ingredient_list, llm_results):
+    """จับคู่ผลจาก LLM กลับกับชื่อเดิม (ถ้า LLM ไม่ได้คืน original ตรงกัน ใช้ตามลำดับ) - ที่จับคู่ไม่ได้เป็น None"""
+    by_original = {
+        str(item.get("original", "")).strip().upper(): item
+        for item in llm_results if isinstance(item, dict)
+    }
+    matched = []
+    for i, ing in enumerate(ingredient_list):
+        item = by_original.get(ing.strip().upper())
+        if item is None and len(llm_results) == len(ingredient_list) and isinstance(llm_results[i], dict):
+            item = llm_results[i]
+        if item is not None and not item.get("corrected"):
+            item = None
+        matched.append(item)
+    return matched
+
+
+def _get_chunk_pool():
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            _chunk_pool = ThreadPoolExecutor(
+                max_workers=max(1, config.NORMALIZE_CONCURRENCY),
+                thread_name_prefix="normalize"
+            )
+        return _chunk_pool
+
+
+def _chunk_timeout(deadline):
+    """เวลาที่ให้ chunk ถัดไป (วินาที) - ไม่เกิน NORMALIZE_CHUNK_TIMEOUT และเวลาที่เหลือของ request"""
+    if deadline is None:
+        return config.NORMALIZE_CHUNK_TIMEOUT
+    return min(config.NORMALIZE_CHUNK_TIMEOUT, deadline - time.monotonic())
+
+
+def _normalize_chunk(chunk, deadline=None):
+    """
+    normalize 1 chunk - ถ้า LLM ตอบไม่ได้หรือตอบไม่ครบ ถามใหม่เฉพาะชื่อที่ยังไม่ได้คำตอบ
+    (ไม่ถามซ้ำเมื่อหมดเวลาของ request แล้ว)
+
+    Returns:
+        ({ชื่อ: ผลจาก LLM}, จำนวนครั้งที่ถามซ้ำ, หมดเวลาของ request ก่อนได้คำตอบครบหรือไม่)
+        ชื่อที่ยังไม่ได้คำตอบไม่อยู่ใน dict
+    """
+    answers = {}
+    pending = chunk
+    retries = 0
+    for attempt in range(1 + config.NORMALIZE_CHUNK_RETRIES):
+        if attempt:
+            retries += 1
+            print(f"🔁 normalize ใหม่ {len(pending)} รายการ (ครั้งที่ {attempt + 1})")
+        timeout = _chunk_timeout(deadline)
+        if timeout < 1:
+            break
+        llm_results = _ask_llm(pending, timeout)
+        if llm_results is not None:
+            for ing, item in zip(pending, _match_results(pending, llm_results)):
+                if item is not None:
+                    answers[ing] = item
+        pending = [ing for ing in pending if ing not in answers]
+        if not pending:
+            break
+    out_of_time = bool(pending) and deadline is not None and _chunk_timeout(deadline) < 1
+    return answers, retries, out_of_time
+
+
+def normalize_ingredients(ingredient_list, stats=None, deadline=None, use_llm=True):
+    """
+    แก้ชื่อสารจาก OCR ด้วย LLM
+
+    ดู memo ก่อน (ชื่อที่เคยถาม LLM แล้ว ใช้ร่วมกันทุก request/worker)
+    ชื่อที่ไม่มีใน memo แบ่งเป็น chunk ละ NORMALIZE_CHUNK_SIZE ชื่อ ส่งให้ LLM พร้อมกัน
+    (ไม่เกิน NORMALIZE_CONCURRENCY) แต่ละ chunk ตรวจ/ถามซ้ำ/fallback แยกกัน
+    แล้วเก็บคำตอบลง memo
+
+    deadline: เวลาสิ้นสุดของ request (time.monotonic()) - แต่ละ chunk ได้ไม่เกินเวลาที่เหลือ
+    use_llm=False: ใช้เฉพาะ memo ชื่อที่ไม่มีใน memo ใช้ชื่อเดิม
+
+    Returns:
+        [{"original", "corrected", "confidence"}, ...] เรียงตาม ingredient_list
+        (stats ถ้าส่งมา จะได้ "memo_hits", "sent_to_llm", "llm_chunks", "llm_retries", "llm_failed", "llm_skipped",
+         "llm_timed_out" = จำนวนใน llm_failed ที่ไม่ได้คำตอบเพราะหมดเวลาของ request)
+    """
+    memo = get_normalize_memo()
+    results = {}
+    misses = []
+    for ing in dict.fromkeys(ingredient_list):
+        cached = memo.get(memo_key(ing))
+        if cached is not None:
+            results[ing] = dict(cached, original=ing)
+        else:
+            misses.append(ing)
+
+    memo_hits = len(results)
+    if memo_hits:
+        print(f"⚡ ใช้ผล normalize จาก memo {memo_hits} รายการ")
+
+    skipped = 0
+    if not use_llm:
+        skipped = len(misses)
+        for ing in misses:
+            results[ing] = _uncorrected(ing)
+        misses = []
+
+    size = max(1, config.NORMALIZE_CHUNK_SIZE)
+    chunks = [misses[i:i + size] for i in range(0, len(misses), size)]
+    retries = failed = timed_out = 0
+    if chunks:
+        print(f"⏳ รอ AI normalize {len(misses)} รายการ ({len(chunks)} chunk)...")
+        pool = _get_chunk_pool()
+        answered = pool.map(_normalize_chunk, chunks, [deadline] * len(chunks))
+        for chunk, (answers, chunk_retries, out_of_time) in zip(chunks, answered):
+            retries += chunk_retries
+            for ing in chunk:
+                item = answers.get(ing)
+                if item is None:
+                    # Fallback: คืนค่าเดิม (ไม่เก็บลง memo - ครั้งหน้าถามใหม่)
+                    failed += 1
+                    timed_out += out_of_time
+                    results[ing] = _uncorrected(ing)
+                    continue
+                answer = {"corrected": str(item["corrected"]), "confidence": item.get("confidence", "ต่ำ")}
+                memo.set(memo_key(ing), answer)
+                results[ing] = dict(answer, original=ing)
+        print(f"✅ Normalize สำเร็จ {len(misses) - failed}/{len(misses)} รายการ")
+
+    if stats is not None:
+        stats.update(
+            memo_hits=memo_hits,
+            sent_to_llm=len(misses),
+            llm_chunks=len(chunks),
+            llm_retries=retries,
+            llm_failed=failed,
+            llm_skipped=skipped,
+            llm_timed_out=timed_out
+        )
+    return [results[ing] for ing in ingredient_list]
+
+
+# เวลาเฉลี่ยที่ LLM ใช้ normalize ต่อ 1 สาร (ปรับตามเวลาที่วัดได้จริงทุกครั้งที่เรียก)
+_llm_seconds_per_item = config.NORMALIZE_LLM_SECONDS_PER_ITEM
+
+
+def _record_llm_time(seconds, count):
+    """เก็บเวลาเฉลี่ยที่ LLM ใช้ต่อ 1 สาร (ใช้ประมาณเวลาที่พจนานุกรมช่วยประหยัดได้)"""
+    global _llm_seconds_per_item
+    per_item = seconds / count
+    _llm_seconds_per_item = 0.8 * _llm_seconds_per_item + 0.2 * per_item
+
+
+def normalize_low_confidence(ingredient_list, confidences, min_confidence, deadline=None, use_llm=True):
+    """
+    normalize เฉพาะสารที่ OCR อ่านได้ไม่มั่นใจ (confidence < min_confidence หรือ None)
+    สารที่ OCR มั่นใจแล้วใช้ชื่อเดิมโดยไม่ต้องรอ LLM
+    สารที่ไม่มั่นใจลองแก้ด้วยพจนานุกรม INCI ก่อน - ที่เหลือไปที่ normalize_ingredients (memo แล้วจึง LLM)
+    deadline / use_llm ส่งต่อให้ normalize_ingredients
+
+    Returns:
+        (ผลลัพธ์เรียงตาม ingredient_list ในรูปแบบเดียวกับ normalize_ingredients,
+         สถิติ {"total", "ocr_confident", "dictionary", "memo_hits", "sent_to_llm", ...})
+    """
+    low = [
+        ing for ing, conf in zip(ingredient_list, confidences)
+        if conf is None or conf < min_confidence
+    ]
+
+    start = time.perf_counter()
+    dictionary_results = normalize_with_dictionary(low)
+    dictionary_seconds = time.perf_counter() - start
+    unresolved = [ing for ing in low if ing not in dictionary_results]
+    print(f"🎯 OCR มั่นใจ {len(ingredient_list) - len(low)} รายการ, "
+          f"พจนานุกรมแก้ได้ {len(dictionary_results)} รายการ - เหลือ normalize {len(unresolved)} รายการ")
+
+    llm_stats = {"memo_hits": 0, "sent_to_llm": 0, "llm_chunks": 0, "llm_retries": 0, "llm_failed": 0,
+                 "llm_skipped": 0, "llm_timed_out": 0}
+    low_results = dict(dictionary_results)
+    if unresolved:
+        start = time.perf_counter()
+        llm_results = normalize_ingredients(unresolved, llm_stats, deadline=deadline, use_llm=use_llm)
+        if llm_stats["sent_to_llm"]:
+            _record_llm_time(time.perf_counter() - start, llm_stats["sent_to_llm"])
+        low_results.update(zip(unresolved, llm_results))
+
+    results = []
+    for ing in ingredient_list:
+        if ing in low_results:
+            results.append(low_results[ing])
+        else:
+            results.append({"original": ing, "corrected": ing, "confidence": "สูง"})
+
+    stats = {
+        "total": len(ingredient_list),
+        "ocr_confident": len(ingredient_list) - len(low),
+        "dictionary": len(dictionary_results),
+        **llm_stats,
+        "dictionary_hit_rate": round(len(dictionary_results) / len(low), 3) if low else 0.0,
+        "dictionary_ms": round(1000 * dictionary_seconds, 2),
+        # เวลาที่ LLM จะใช้กับสารที่พจนานุกรม/memo แก้ได้ (ประมาณจากเวลาเฉลี่ยต่อสารที่วัดได้)
+        "llm_seconds_saved": round(
+            (len(dictionary_results) + llm_stats["memo_hits"]) * _llm_seconds_per_item - dictionary_seconds, 2
+        )
+    }
+    return results, stats
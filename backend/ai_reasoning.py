@@ -1,8 +1,33 @@
-import subprocess
+import hashlib
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 # import json
 
-def analyze_each_allergen(normalized_ingredients, matching_allergens):
+import config
+from explanation_store import ExplanationStore
+from llm_client import LLMTimeout
+from llm_scheduler import get_scheduler
+from result_cache import get_explanation_cache
+
+
+def explanation_name(ingredient):
+    """ชื่อสารในรูปแบบมาตรฐานที่ใช้เป็น key ของ cache คำอธิบาย (ตัวพิมพ์ใหญ่, ช่องว่างเดียว)"""
+    return " ".join(str(ingredient).upper().split())
+
+
+def explanation_key(ingredient):
+    return f"explain:{EXPLANATION_VERSION}|{explanation_name(ingredient)}"
+
+_SECTION_SPLIT_RE = re.compile(r'\n---+\n')
+
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+
+def analyze_each_allergen(normalized_ingredients, matching_allergens, on_section=None, deadline=None,
+                          use_llm=True, cancel=None, priority="interactive"):
     """
     ให้ AI วิเคราะห์แต่ละสารที่ user แพ้อย่างละเอียด
     
@@ -10,6 +35,12 @@ def analyze_each_allergen(normalized_ingredients, matching_allergens):
         normalized_ingredients: รายการส่วนผสมทั้งหมด (เรียงตามความเข้มข้น)
         matching_allergens: รายการสารที่ตรวจพบว่า user แพ้
             [{"allergen": "ชื่อที่ user พิมพ์", "ingredient": "ชื่อจริง", ...}]
+        on_section: ฟังก์ชัน (ผลของ 1 สาร) ที่ถูกเรียกทันทีที่วิเคราะห์สารนั้นเสร็จ
+            (ไม่ต้องรอสารอื่น - ใช้ส่งผลให้ client ทีละสาร)
+        deadline: เวลาสิ้นสุดของ request (time.monotonic()) - AI ต้องตอบให้เสร็จก่อนเวลานี้
+        use_llm: False = ไม่ถาม AI (ใช้คำอธิบายจาก cache สารที่ไม่มีใช้ fallback)
+        cancel: CancelToken - ยกเลิกแล้ว request ที่ค้างอยู่หยุดทันที (สารที่เหลือเป็น fallback)
+        priority: ลำดับความสำคัญในคิว LLM ("background" สำหรับงานที่อาจถูกทิ้ง)
     
     Returns:
         dict: {
@@ -78,51 +109,347 @@ def analyze_each_allergen(normalized_ingredients, matching_allergens):
         #         "user_input": match["allergen"]
         #     })
     
-    # สร้าง Prompt สำหรับ AI
-    prompt = create_analysis_prompt(allergen_details, normalized_ingredients)
-    
-    print("⏳ กำลังรอ AI วิเคราะห์...")
-    
-    try:
-        result = subprocess.run(
-            ["ollama", "run", "scb10x/llama3.1-typhoon2-8b-instruct"],
-            input=prompt,
-            text=True,
-            capture_output=True,
-            encoding="utf-8",
-            timeout=1500  # 5 นาที
-        )
-        
-        ai_output = result.stdout.strip()
-        
-        print("✅ AI ตอบกลับมาแล้ว")
-        print(ai_output)  # เพิ่มบรรทัดนี้
-        
-        # Parse AI output
-        analyzed = parse_ai_output(ai_output, allergen_details)
-        
+    # คำอธิบายของสารไม่ขึ้นกับผลิตภัณฑ์/ผู้ใช้ - ใช้จากคลังที่คำนวณไว้ล่วงหน้า/cache ได้
+    # ถาม AI เฉพาะสารที่ยังไม่มี
+    store = get_explanation_store()
+    cache = get_explanation_cache()
+    cached = {}
+    missing = []
+    precomputed = 0
+    for item in allergen_details:
+        name = explanation_name(item["ingredient"])
+        if name in cached or any(explanation_name(m["ingredient"]) == name for m in missing):
+            continue
+        entry = store.get(name)
+        if entry is not None:
+            precomputed += 1
+        else:
+            entry = cache.get(explanation_key(name))
+        if entry is not None:
+            cached[name] = entry
+        else:
+            missing.append(item)
+
+    stats = {
+        "explanations_precomputed": precomputed,
+        "explanations_cached": len(cached) - precomputed,
+        "sent_to_llm": len(missing)
+    }
+
+    def emit(entry):
+        if on_section is not None:
+            try:
+                on_section(entry)
+            except Exception as e:
+                print(f"⚠️ ส่งผลวิเคราะห์ '{entry.get('ingredient')}' ไม่สำเร็จ: {e}")
+
+    for entry in merge_analysis(allergen_details, cached, []):
+        emit(entry)
+
+    if not missing:
+        print(f"⚡ ใช้คำอธิบายจาก cache ทั้งหมด ({len(cached)} สาร) - ไม่ต้องรอ AI")
+        analyzed = merge_analysis(allergen_details, cached, [])
         return {
             "status": "success",
-            "raw_output": ai_output,
-            "analyzed_allergens": analyzed
+            "raw_output": format_analysis(analyzed),
+            "analyzed_allergens": analyzed,
+            "stats": stats
         }
-        
-    except subprocess.TimeoutExpired:
-        print("❌ AI Timeout")
+
+    if not use_llm:
+        print(f"⏭️ ข้ามการวิเคราะห์ด้วย AI ({len(missing)} สาร) - ใช้ fallback")
+        stats.update(sent_to_llm=0, llm_skipped=len(missing))
+        fallback = create_fallback_analysis(missing)
+        for entry in fallback:
+            emit(entry)
+        analyzed = merge_analysis(allergen_details, cached, fallback)
         return {
-            "status": "error",
-            "raw_output": "AI ตอบช้าเกินไป กรุณาลองใหม่อีกครั้ง",
-            "analyzed_allergens": create_fallback_analysis(allergen_details)
+            "status": "success",
+            "raw_output": format_analysis(analyzed),
+            "analyzed_allergens": analyzed,
+            "stats": stats
         }
-        
-    except Exception as e:
-        print(f"❌ AI Error: {e}")
+
+    print(f"⏳ กำลังรอ AI วิเคราะห์... ({len(missing)} สาร, จาก cache {len(cached)} สาร, "
+          f"โหมด {config.ANALYSIS_MODE})")
+
+    llm_deadline = time.monotonic() + config.ANALYSIS_TIMEOUT
+    if deadline is not None:
+        llm_deadline = min(llm_deadline, deadline)
+
+    if config.ANALYSIS_MODE == "stream":
+        parsed, confirmed, ai_output, error = _analyze_streaming(missing, normalized_ingredients, emit, llm_deadline,
+                                                                 cancel, priority)
+    else:
+        parsed, confirmed, ai_output, error = _analyze_parallel(missing, normalized_ingredients, emit, llm_deadline,
+                                                                cancel, priority)
+
+    # เก็บลง cache เฉพาะคำตอบที่รู้แน่ว่าเป็นของสารไหน (ชื่อตรงกัน) - ที่จับคู่จากชื่อที่คล้ายกันใช้แสดงผลเท่านั้น
+    store_explanations(cache, missing, confirmed)
+    analyzed = merge_analysis(allergen_details, cached, parsed)
+    stats["llm_failed"] = sum(1 for entry in parsed if entry.get("fallback"))
+
+    if error is not None and stats["llm_failed"] == len(missing):
+        # ไม่ได้คำตอบจาก AI เลย
         return {
             "status": "error",
-            "raw_output": f"เกิดข้อผิดพลาด: {str(e)}",
-            "analyzed_allergens": create_fallback_analysis(allergen_details)
+            "raw_output": error,
+            "analyzed_allergens": analyzed,
+            "stats": stats
         }
 
+    return {
+        "status": "success",
+        "raw_output": ai_output if not cached and config.ANALYSIS_MODE == "stream" else format_analysis(analyzed),
+        "analyzed_allergens": analyzed,
+        "stats": stats
+    }
+
+
+def _error_message(error):
+    if isinstance(error, LLMTimeout):
+        print("❌ AI Timeout")
+        return "AI ตอบช้าเกินไป กรุณาลองใหม่อีกครั้ง"
+    print(f"❌ AI Error: {error}")
+    return f"เกิดข้อผิดพลาด: {str(error)}"
+
+
+def _get_analysis_pool():
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            _analysis_pool = ThreadPoolExecutor(
+                max_workers=max(1, config.ANALYSIS_CONCURRENCY),
+                thread_name_prefix="analysis"
+            )
+        return _analysis_pool
+
+
+def _analyze_one(item, normalized_ingredients, deadline, cancel=None, priority="interactive"):
+    """
+    วิเคราะห์สาร 1 ตัวด้วย request ของตัวเอง
+    Returns: (ผลของสารนั้น, ชื่อตรงกับที่ขอหรือไม่, ข้อความจาก AI, ข้อความ error หรือ None)
+    ล้มเหลวได้ผล fallback ของสารนี้เท่านั้น
+    """
+    prompt = create_analysis_prompt([item], normalized_ingredients)
+    try:
+        ai_output = get_scheduler().generate(prompt, priority=priority, deadline=deadline, cancel=cancel).strip()
+    except Exception as e:
+        return create_fallback_analysis([item])[0], False, "", _error_message(e)
+
+    sections = [entry for entry in map(parse_section, _SECTION_SPLIT_RE.split(ai_output)) if entry]
+    # ถามทีละสาร - ถ้าชื่อใน section ไม่ตรง (เช่น AI แปลชื่อ) แต่มี section เดียวก็เป็นของสารนี้
+    name = explanation_name(item["ingredient"])
+    entry = _find_exact(sections, name)
+    confirmed = entry is not None or len(sections) == 1
+    if entry is None:
+        entry = sections[0] if len(sections) == 1 else _find_parsed(sections, name)
+    if entry is None:
+        print(f"⚠️ Parse คำตอบของ {item['ingredient']} ไม่สำเร็จ ใช้ fallback")
+        return create_fallback_analysis([item])[0], False, ai_output, None
+    return dict(entry, ingredient=item["ingredient"]), confirmed, ai_output, None
+
+
+def _analyze_parallel(missing, normalized_ingredients, emit, deadline, cancel=None, priority="interactive"):
+    """
+    ส่งแต่ละสารเป็น request แยก พร้อมกันไม่เกิน ANALYSIS_CONCURRENCY request
+    ส่งผลแต่ละสารทันทีที่เสร็จ - สารที่ AI ตอบผิดรูปแบบ/ล้มเหลวไม่กระทบสารอื่น
+    """
+    pool = _get_analysis_pool()
+    futures = {
+        pool.submit(_analyze_one, item, normalized_ingredients, deadline, cancel, priority): i
+        for i, item in enumerate(missing)
+    }
+    results = [None] * len(missing)
+    confirmed = [False] * len(missing)
+    outputs = [""] * len(missing)
+    error = None
+    for future in as_completed(futures):
+        i = futures[future]
+        results[i], confirmed[i], outputs[i], item_error = future.result()
+        error = error or item_error
+        emit(results[i])
+    print("✅ AI ตอบกลับมาแล้ว")
+    return (results, [entry for entry, ok in zip(results, confirmed) if ok],
+            "\n---\n".join(o for o in outputs if o), error)
+
+
+def iter_sections(tokens):
+    """
+    รวม token จาก LLM แล้ว yield ทีละ section (คั่นด้วยบรรทัด ---) ทันทีที่ section นั้นจบ
+    section สุดท้ายถูก yield เมื่อ token หมด
+    """
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        if "\n" not in token:
+            continue  # บรรทัดคั่นจบด้วยขึ้นบรรทัดใหม่เสมอ
+        parts = _SECTION_SPLIT_RE.split(buffer)
+        buffer = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part
+    if buffer.strip():
+        yield buffer
+
+
+def _analyze_streaming(missing, normalized_ingredients, emit, deadline, cancel=None, priority="interactive"):
+    """
+    ส่งทุกสารใน request เดียวแบบ stream แล้ว parse ทีละ section ระหว่างที่ AI ยังตอบอยู่
+    ถ้าขาดกลางคัน (timeout/error) ใช้ section ที่ได้แล้ว ที่เหลือเป็น fallback
+    section ที่จับคู่กับสารที่ขอได้ใช้ชื่อสารตามที่ขอ (เหมือนโหมด parallel) - AI อาจเขียนชื่อต่างไปเล็กน้อย
+    Returns: (ผลทุกสาร, ผลที่ชื่อตรงกับที่ขอ, ข้อความจาก AI, ข้อความ error หรือ None)
+    """
+    prompt = create_analysis_prompt(missing, normalized_ingredients)
+    received = []
+    parsed = []
+    confirmed = []
+    answered = set()
+    error = None
+    try:
+        tokens = get_scheduler().stream(prompt, priority=priority, deadline=deadline, cancel=cancel)
+        for section in iter_sections(_record(tokens, received)):
+            entry = parse_section(section)
+            if entry is not None:
+                name = explanation_name(entry["ingredient"])
+                item = _find_parsed([m for m in missing if id(m) not in answered], name) if name else None
+                if item is not None:
+                    answered.add(id(item))
+                    exact = explanation_name(item["ingredient"]) == name
+                    entry = dict(entry, ingredient=item["ingredient"])
+                    if exact:
+                        confirmed.append(entry)
+                parsed.append(entry)
+                emit(entry)
+        print("✅ AI ตอบกลับมาแล้ว")
+    except Exception as e:
+        error = _error_message(e)
+
+    ai_output = "".join(received).strip()
+    if not parsed and error is None:
+        print("⚠️ Parse AI output ไม่สำเร็จ ใช้ fallback")
+    # ถามสารเดียวแล้วได้ section เดียว - เป็นของสารนี้แม้ชื่อไม่ตรง (เหมือน _analyze_one)
+    if len(missing) == 1 and len(parsed) == 1 and answered and not confirmed:
+        confirmed.append(parsed[0])
+
+    # สารที่ไม่มี section ที่จับคู่ได้ใช้ fallback - ทุกสารที่ขอมีผลในชื่อของตัวเอง
+    for item in missing:
+        if _find_exact(parsed, explanation_name(item["ingredient"])) is None:
+            entry = create_fallback_analysis([item])[0]
+            parsed.append(entry)
+            emit(entry)
+    return parsed, confirmed, ai_output, error
+
+
+def _record(tokens, received):
+    for token in tokens:
+        received.append(token)
+        yield token
+
+
+def _find_exact(parsed, name):
+    """ส่วนที่ parse ได้ที่ชื่อตรงกับ name (แบบ explanation_name)"""
+    for entry in parsed:
+        if explanation_name(entry["ingredient"]) == name:
+            return entry
+    return None
+
+
+def _find_parsed(parsed, name):
+    """
+    ส่วนที่ parse ได้ของสาร name (ชื่อตรงกันก่อน แล้วค่อยดูชื่อที่มีอีกชื่ออยู่ข้างใน)
+    ใช้จับคู่เพื่อแสดงผลเท่านั้น - ชื่อที่มีอีกชื่ออยู่ข้างในอาจเป็นคนละสาร (BENZOATE / SODIUM BENZOATE)
+    """
+    entry = _find_exact(parsed, name)
+    if entry is not None:
+        return entry
+    for entry in parsed:
+        other = explanation_name(entry["ingredient"])
+        if other and (other in name or name in other):
+            return entry
+    return None
+
+
+def match_explanations(requested, parsed):
+    """
+    {ชื่อสาร: {description, alternatives}} ของสารที่ขอและ AI ตอบครบ (ไม่รวมผล fallback) - ใช้เก็บลง cache/คลัง
+    จับคู่เฉพาะชื่อที่ตรงกัน (หรือขอสารเดียวแล้วได้ section เดียว) - ไม่ใช้ชื่อที่คล้ายกันแบบ _find_parsed
+    เพราะคำอธิบายที่เก็บผิดสารจะถูกใช้ซ้ำทุกครั้งที่เจอสารนั้น
+    """
+    matched = {}
+    for item in requested:
+        name = explanation_name(item["ingredient"])
+        entry = _find_exact(parsed, name)
+        if entry is None and len(requested) == 1 and len(parsed) == 1:
+            entry = parsed[0]
+        if entry is None or entry.get("fallback") or entry["description"] == "ไม่ทราบ":
+            continue
+        matched[name] = {
+            "description": entry["description"],
+            "alternatives": entry["alternatives"]
+        }
+    return matched
+
+
+def store_explanations(cache, requested, parsed):
+    """เก็บคำอธิบายของสารที่ AI ตอบครบลง cache"""
+    for name, entry in match_explanations(requested, parsed).items():
+        cache.set(explanation_key(name), entry)
+
+
+def explain_ingredients(ingredients, timeout=None, priority="batch"):
+    """
+    ถาม AI คำอธิบายของสารหลายตัวใน prompt เดียว (ใช้โดย precompute_explanations.py)
+    ใช้ priority "batch" - request ของผู้ใช้ที่รออยู่ได้คิวก่อน (รวมถึง server ที่รันแยก process
+    ถ้าใช้ ALLERGUARD_LLM_SLOTS_DIR เดียวกันบนเครื่องเดียวกัน)
+
+    Returns:
+        {ชื่อสาร: {description, alternatives}} เฉพาะสารที่ AI ตอบครบใน section ที่ชื่อตรงกัน
+        (ผลนี้ถูกเก็บลงคลัง - section ที่ชื่อแค่คล้ายกันอาจเป็นของสารอื่นใน prompt เดียวกัน)
+    """
+    details = [{"ingredient": ing, "user_input": ing} for ing in ingredients]
+    prompt = create_analysis_prompt(details, [])
+    ai_output = get_scheduler().generate(
+        prompt, priority=priority, timeout=timeout or config.ANALYSIS_TIMEOUT
+    ).strip()
+    return match_explanations(details, parse_ai_output(ai_output, details))
+
+
+def merge_analysis(allergen_details, cached, parsed):
+    """
+    รวมคำอธิบายจาก cache กับผลที่ AI เพิ่งตอบ เรียงตามลำดับสารที่ตรวจพบ
+    (ส่วนที่ AI ตอบแต่จับคู่กับสารใดไม่ได้ต่อท้ายไว้เหมือนเดิม)
+    """
+    analyzed = []
+    used = set()
+    seen = set()
+    for item in allergen_details:
+        name = explanation_name(item["ingredient"])
+        if name in seen:
+            continue
+        seen.add(name)
+        if name in cached:
+            analyzed.append(dict(cached[name], ingredient=item["ingredient"]))
+            continue
+        entry = _find_parsed([p for p in parsed if id(p) not in used], name)
+        if entry is not None:
+            used.add(id(entry))
+            analyzed.append(entry)
+    analyzed.extend(p for p in parsed if id(p) not in used)
+    return analyzed
+
+
+def format_analysis(analyzed):
+    """สร้างข้อความผลวิเคราะห์ในรูปแบบเดียวกับที่ AI ตอบ (ใช้เมื่อมีคำอธิบายจาก cache)"""
+    sections = []
+    for entry in analyzed:
+        alternatives = "\n".join(f"   - {alt}" for alt in entry.get("alternatives", []))
+        sections.append(
+            f"{entry['ingredient']}\n1. คำอธิบาย:\n{entry.get('description', 'ไม่ทราบ')}\n\n"
+            f"2. สารทางเลือกที่ปลอดภัยกว่า:\n{alternatives}"
+        )
+    return "---\n" + "\n---\n".join(sections) + "\n---" if sections else ""
+
 
 def create_analysis_prompt(allergen_details, all_ingredients):
     
@@ -166,39 +493,43 @@ def create_analysis_prompt(allergen_details, all_ingredients):
     
     return prompt
 
-def parse_ai_output(ai_output, allergen_details):
-    analyzed = []
-    sections = re.split(r'\n---+\n', ai_output)
+def parse_section(section):
+    """แยกชื่อสาร คำอธิบาย และสารทางเลือกจากคำตอบของ AI 1 section (None ถ้าไม่พบชื่อสาร)"""
+    if not section.strip():
+        return None
     
-    for section in sections:
-        if not section.strip():
-            continue
-        
-        name_match = re.search(r'^\s*([A-Z][A-Z\s\-\/\(\)0-9]+)', section, re.MULTILINE)
-        if not name_match:
-            continue
-        
-        ingredient_name = name_match.group(1).strip()
-        
-        # ดึงคำอธิบาย
-        desc_match = re.search(r'คำอธิบาย:\s*(.*?)(?=\d+\.|---|\Z)', section, re.DOTALL)
-        description = desc_match.group(1).strip() if desc_match else "ไม่ทราบ"
-        
-        # ดึงสารทางเลือก
-        alt_section = re.search(r'สารทางเลือก.*?:(.*?)(?=---|\Z)', section, re.DOTALL)
-        alternatives = []
-        if alt_section:
-            alternatives = [
-                s.strip().lstrip('- ') 
-                for s in alt_section.group(1).split('\n') 
-                if s.strip().startswith('-')
-            ]
-        
-        analyzed.append({
-            "ingredient": ingredient_name,
-            "description": description,   # เปลี่ยนจาก symptoms
-            "alternatives": alternatives
-        })
+    name_match = re.search(r'^\s*([A-Z][A-Z \t\-\/\(\)0-9]+)', section, re.MULTILINE)
+    if not name_match:
+        return None
+    
+    ingredient_name = name_match.group(1).strip()
+    
+    # ดึงคำอธิบาย
+    desc_match = re.search(r'คำอธิบาย:\s*(.*?)(?=\d+\.|---|\Z)', section, re.DOTALL)
+    description = desc_match.group(1).strip() if desc_match else "ไม่ทราบ"
+    
+    # ดึงสารทางเลือก
+    alt_section = re.search(r'สารทางเลือก.*?:(.*?)(?=---|\Z)', section, re.DOTALL)
+    alternatives = []
+    if alt_section:
+        alternatives = [
+            s.strip().lstrip('- ') 
+            for s in alt_section.group(1).split('\n') 
+            if s.strip().startswith('-')
+        ]
+    
+    return {
+        "ingredient": ingredient_name,
+        "description": description,   # เปลี่ยนจาก symptoms
+        "alternatives": alternatives
+    }
+
+
+def parse_ai_output(ai_output, allergen_details):
+    analyzed = [
+        entry for entry in map(parse_section, _SECTION_SPLIT_RE.split(ai_output))
+        if entry is not None
+    ]
     
     if not analyzed:
         print("⚠️ Parse AI output ไม่สำเร็จ ใช้ fallback")
@@ -213,11 +544,34 @@ def create_fallback_analysis(allergen_details):
         fallback.append({
             "ingredient": item["ingredient"],
             "description": "ไม่สามารถวิเคราะห์ได้ ควรปรึกษาแพทย์ผิวหนัง",
-            "alternatives": ["ปรึกษาแพทย์เพื่อหาสารทางเลือก"]
+            "alternatives": ["ปรึกษาแพทย์เพื่อหาสารทางเลือก"],
+            "fallback": True
         })
     return fallback
 
 
+# version ของ cache คำอธิบาย - เปลี่ยนเมื่อแก้ prompt หรือเปลี่ยนโมเดล (คำอธิบายเก่าจะไม่ถูกใช้อีก)
+EXPLANATION_VERSION = hashlib.sha256(
+    (create_analysis_prompt([{"ingredient": "{ingredient}"}], []) + "|" + config.LLM_MODEL).encode("utf-8")
+).hexdigest()[:12]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_explanation_store():
+    """คลังคำอธิบายที่คำนวณไว้ล่วงหน้า (โหลดครั้งเดียวต่อ process - ไม่มีไฟล์ = คลังว่าง)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            start = time.perf_counter()
+            _store = ExplanationStore.load(config.EXPLANATION_STORE_PATH, EXPLANATION_VERSION)
+            if len(_store):
+                print(f"📖 โหลดคลังคำอธิบาย {len(_store)} สาร ({time.perf_counter() - start:.2f}s)")
+        return _store
+
+
 # ฟังก์ชันเก่าสำหรับ backward compatibility
 def process_with_ai(normalized_ingredients, user_allergies, detected_allergens):
     """
@@ -1,14 +1,81 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Header, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
 import json
+import math
 import os
+import config
 from pipeline import run_pipeline
+from ocr_backends import warm_up as warm_up_ocr
+from worker_pool import PipelinePool, QueueFullError
+from jobs import JobStore, stream_job_events
+from result_cache import get_cache, get_explanation_cache, get_normalize_memo
+import inci_normalizer
+from ai_reasoning import get_explanation_store
+from llm_scheduler import get_scheduler
+from fuzzy_batch import get_profile_cache
+from ingredient_index import get_ingredient_index
 
 app = FastAPI()
 
+# Worker pool สำหรับรัน pipeline (OCR + LLM ใช้เวลานาน ห้ามรันใน event loop)
+# แต่ละ worker โหลด OCR engine ครั้งเดียวตอนเริ่ม แล้วใช้ซ้ำทุก request
+pipeline_pool = PipelinePool.from_config(initializer=warm_up_ocr)
+
+# งานวิเคราะห์แบบ async (POST /jobs)
+job_store = JobStore()
+
+
+class UploadLimitMiddleware:
+    """
+    จำกัดขนาด request body ระหว่างรับข้อมูล
+    - Content-Length เกิน → ตอบ 413 ทันทีโดยไม่อ่าน body (ไม่ใช่ตัวเลข/ติดลบ → 400)
+    - ไม่มี Content-Length (chunked) → นับ bytes ที่รับจริง เกินเมื่อไหร่หยุดทันที
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                length = int(content_length)
+            except ValueError:
+                length = -1
+            if length < 0:
+                response = JSONResponse(status_code=400, content={"detail": "Content-Length ไม่ถูกต้อง"})
+                return await response(scope, receive, send)
+            if length > self.max_bytes:
+                response = JSONResponse(status_code=413, content={"detail": upload_too_large_message()})
+                return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=upload_too_large_message())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def upload_too_large_message():
+    return f"ไฟล์ใหญ่เกินไป (สูงสุด {config.MAX_UPLOAD_MB} MB)"
+
+
+# ขนาด multipart ส่วนเกิน (boundary, field allergies) ที่ยอมให้นอกเหนือจากตัวไฟล์
+app.add_middleware(UploadLimitMiddleware, max_bytes=config.MAX_UPLOAD_BYTES + 64 * 1024)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -93,13 +160,18 @@ mv index.html static/</pre>
 
 
 @app.post("/analyze-label")
-async def analyze_label(file: UploadFile = File(...), allergies: str = Form("[]")):
+async def analyze_label(
+    file: UploadFile = File(...),
+    allergies: str = Form("[]"),
+    x_allerguard_deadline: str = Header(None)
+):
     """
     Endpoint สำหรับวิเคราะห์ฉลากเครื่องสำอาง
     
     รับ:
         - file: ไฟล์ภาพฉลาก
         - allergies: JSON array ของสารที่แพ้
+        - header X-AllerGUARD-Deadline (ไม่บังคับ): เวลาสูงสุดที่รอได้ (วินาที)
     
     ตอบกลับ:
         - ingredients: รายการส่วนผสมที่พบ
@@ -109,35 +181,31 @@ async def analyze_label(file: UploadFile = File(...), allergies: str = Form("[]"
     print("🔵 เริ่มต้น analyze_label endpoint")
     print(f"📎 ไฟล์ที่อัปโหลด: {file.filename}")
     
-    # บันทึกไฟล์ชั่วคราว
-    temp_path = f"temp_{file.filename}"
+    # อ่านไฟล์เข้าหน่วยความจำ (ไม่เขียนไฟล์ชั่วคราว - pipeline decode จาก bytes โดยตรง)
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        print(f"💾 บันทึกไฟล์ชั่วคราวที่: {temp_path}")
+        image_bytes = await read_upload(file)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error saving file: {e}")
+        print(f"❌ Error reading file: {e}")
         return {
-            "error": f"Failed to save file: {str(e)}",
+            "error": f"Failed to read file: {str(e)}",
             "ingredients": [],
             "analysis": {
                 "risky_ingredients": [],
-                "summary": "ไม่สามารถบันทึกไฟล์ได้"
+                "summary": "ไม่สามารถอ่านไฟล์ได้"
             }
         }
 
-    # Parse allergies
-    try:
-        allergy_list = json.loads(allergies)
-        print(f"🔴 สารที่แพ้: {allergy_list}")
-    except Exception as e:
-        print(f"⚠️ Error parsing allergies: {e}")
-        allergy_list = []
+    allergy_list = parse_allergies(allergies)
     
-    # เรียก AI pipeline
+    # เรียก AI pipeline (รันใน worker pool ไม่ให้ block request อื่น)
     print("🤖 เริ่มเรียก AI pipeline...")
     try:
-        result = run_pipeline(temp_path, allergy_list)
+        result = await pipeline_pool.run(
+            run_pipeline, image_bytes, allergy_list,
+            time_budget=parse_time_budget(x_allerguard_deadline)
+        )
         print("✅ Pipeline เสร็จสมบูรณ์")
         
         # แปลง format ให้ตรงกับที่ frontend ต้องการ
@@ -145,6 +213,10 @@ async def analyze_label(file: UploadFile = File(...), allergies: str = Form("[]"
         
         print(f"📊 Response: {json.dumps(response, indent=2, ensure_ascii=False)}")
         
+    except QueueFullError as e:
+        print("⚠️ คิวเต็ม - ตอบ 503")
+        response = busy_response(e.retry_after)
+        
     except Exception as e:
         print(f"❌ Error ใน pipeline: {e}")
         import traceback
@@ -159,18 +231,166 @@ async def analyze_label(file: UploadFile = File(...), allergies: str = Form("[]"
             }
         }
     
-    # ลบไฟล์ชั่วคราว
-    try:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            print(f"🗑️ ลบไฟล์ชั่วคราว: {temp_path}")
-    except Exception as e:
-        print(f"⚠️ ไม่สามารถลบไฟล์ชั่วคราว: {e}")
-    
     print("="*70 + "\n")
     return response
 
 
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    allergies: str = Form("[]"),
+    x_allerguard_deadline: str = Header(None)
+):
+    """
+    สร้างงานวิเคราะห์ฉลากแบบ async - ตอบกลับ job_id ทันทีโดยไม่รอ pipeline
+    (header X-AllerGUARD-Deadline กำหนดเวลาสูงสุดของงานได้ เหมือน /analyze-label)
+
+    ติดตามผลได้ที่:
+        - GET /jobs/{job_id}: สถานะ + event ทั้งหมด + ผลลัพธ์ (เมื่อเสร็จ)
+        - GET /jobs/{job_id}/events: Server-Sent Events ของแต่ละขั้นตอน
+    """
+    job = job_store.create()
+    print(f"🆕 สร้างงาน {job.id} ({file.filename})")
+
+    try:
+        image_bytes = await read_upload(file)
+    except HTTPException:
+        job_store.discard(job.id)
+        raise
+    except Exception as e:
+        print(f"❌ Error reading file: {e}")
+        job_store.discard(job.id)
+        return JSONResponse(status_code=500, content={"error": f"Failed to read file: {str(e)}"})
+
+    allergy_list = parse_allergies(allergies)
+
+    try:
+        future = pipeline_pool.submit(
+            run_pipeline, image_bytes, allergy_list,
+            on_progress=job.add_event,
+            time_budget=parse_time_budget(x_allerguard_deadline)
+        )
+    except QueueFullError as e:
+        print("⚠️ คิวเต็ม - ตอบ 503")
+        job_store.discard(job.id)
+        return busy_response(e.retry_after)
+
+    future.add_done_callback(lambda f: finish_job(job, f))
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }
+
+
+def finish_job(job, future):
+    """เรียกเมื่อ pipeline ของงานเสร็จ (สำเร็จหรือล้มเหลว)"""
+    if future.cancelled():
+        job.fail("งานถูกยกเลิก")
+        return
+
+    error = future.exception()
+    if error is not None:
+        print(f"❌ งาน {job.id} ล้มเหลว: {error}")
+        job.fail(str(error))
+        return
+
+    job.finish(convert_to_frontend_format(future.result()))
+    print(f"✅ งาน {job.id} เสร็จสมบูรณ์")
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """สถานะงาน + event ทั้งหมด + ผลลัพธ์ (ถ้าเสร็จแล้ว)"""
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Stream ความคืบหน้าของงานแบบ Server-Sent Events (รองรับ Last-Event-ID)"""
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+
+    try:
+        last_event_id = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        last_event_id = 0
+
+    return StreamingResponse(
+        stream_job_events(job, last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # ปิด buffering ของ nginx
+        }
+    )
+
+
+async def read_upload(file, chunk_size=1024 * 1024):
+    """อ่านไฟล์ที่อัปโหลดเป็น bytes ทีละ chunk - เกินขนาดสูงสุดหยุดทันที (413)"""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > config.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=upload_too_large_message())
+        chunks.append(chunk)
+
+    print(f"📥 รับไฟล์ {size / 1024:.0f} KB")
+    return b"".join(chunks)
+
+
+def parse_allergies(allergies):
+    """แปลง JSON array ของสารที่แพ้ (ถ้าผิดรูปแบบ คืน list ว่าง)"""
+    try:
+        allergy_list = json.loads(allergies)
+        print(f"🔴 สารที่แพ้: {allergy_list}")
+        return allergy_list
+    except Exception as e:
+        print(f"⚠️ Error parsing allergies: {e}")
+        return []
+
+
+def parse_time_budget(value):
+    """
+    เวลาสูงสุดของ request จาก header (วินาที) - ไม่ส่ง/ผิดรูปแบบใช้ REQUEST_DEADLINE
+    ขอให้ยาวกว่า REQUEST_DEADLINE ไม่ได้ (ไม่ให้ request เดียวครอง worker นานเกินกำหนด)
+    """
+    limit = config.REQUEST_DEADLINE
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return limit
+    if not math.isfinite(budget) or budget <= 0:  # "nan"/"inf" แปลงเป็น float ได้
+        return limit
+    return min(budget, limit) if limit else budget
+
+
+def busy_response(retry_after):
+    """ตอบ 503 + Retry-After เมื่อคิวงานเต็ม"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+        content={
+            "error": "Server is busy, please retry later",
+            "ingredients": [],
+            "analysis": {
+                "risky_ingredients": [],
+                "summary": "ระบบกำลังประมวลผลงานจำนวนมาก กรุณาลองใหม่อีกครั้ง"
+            }
+        }
+    )
+
+
 def convert_to_frontend_format(pipeline_result):
     """
     แปลงผลลัพธ์จาก pipeline ให้ตรงกับ format ที่ frontend ต้องการ
@@ -224,7 +444,9 @@ def convert_to_frontend_format(pipeline_result):
         "analysis": {
             "risky_ingredients": risky_ingredients,
             "summary": summary.strip()
-        }
+        },
+        "metrics": pipeline_result.get("metrics", {}),
+        "degraded_stages": pipeline_result.get("degraded_stages", [])
     }
 
 
@@ -259,6 +481,36 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """สถิติของ worker pool (ใช้ปรับจำนวน worker / ขนาดคิว), คิว LLM, cache, พจนานุกรม INCI, memo ของ normalize,
+    คำอธิบายสาร, profile สารที่แพ้ที่ compile ไว้ และ trigram index ของชื่อส่วนผสม"""
+    return {
+        "pipeline_pool": pipeline_pool.stats(),
+        "llm": get_scheduler().stats(),
+        "cache": get_cache().stats(),
+        "inci_normalizer": inci_normalizer.stats(),
+        "normalize_memo": get_normalize_memo().stats(),
+        "explanation_cache": get_explanation_cache().stats(),
+        "explanation_store": get_explanation_store().stats(),
+        "allergy_profiles": get_profile_cache().stats(),
+        "ingredient_index": get_ingredient_index().stats()
+    }
+
+
+@app.on_event("startup")
+def warm_up_pool():
+    pipeline_pool.warm_up()
+    get_explanation_store()
+    if config.INGREDIENT_INDEX:
+        get_ingredient_index()
+
+
+@app.on_event("shutdown")
+def shutdown_pool():
+    pipeline_pool.shutdown()
+
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -0,0 +1,252 @@
+import os
+import tempfile
+
+
+def _env_int(name, default):
+    """อ่านค่า int จาก environment variable (ถ้าไม่ได้ตั้งหรือผิดรูปแบบ ใช้ค่า default)"""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_str(name, default):
+    return os.environ.get(name, default).strip().lower()
+
+
+# =============================================================================
+# Worker pool สำหรับรัน pipeline (OCR + LLM) นอก event loop
+# =============================================================================
+# "thread" หรือ "process"
+PIPELINE_EXECUTOR = _env_str("ALLERGUARD_EXECUTOR", "thread")
+
+# จำนวน worker ที่รัน pipeline พร้อมกันได้
+PIPELINE_WORKERS = _env_int("ALLERGUARD_WORKERS", 2)
+
+# จำนวนงานที่รอคิวได้ (ไม่นับงานที่กำลังรันอยู่) เกินนี้ตอบ 503 ทันที
+PIPELINE_QUEUE_SIZE = _env_int("ALLERGUARD_QUEUE_SIZE", 8)
+
+# ค่า Retry-After (วินาที) ที่ส่งกลับเมื่อคิวเต็ม
+PIPELINE_RETRY_AFTER = _env_int("ALLERGUARD_RETRY_AFTER", 30)
+
+# =============================================================================
+# Job API (POST /jobs + SSE)
+# =============================================================================
+# เก็บงานที่เสร็จแล้วไว้กี่วินาที
+JOB_TTL = _env_int("ALLERGUARD_JOB_TTL", 3600)
+
+# จำนวนงานสูงสุดที่เก็บไว้ในหน่วยความจำ
+JOB_MAX = _env_int("ALLERGUARD_JOB_MAX", 500)
+
+# ส่ง keep-alive ใน SSE ทุกกี่วินาที (กัน proxy ตัด connection ที่เงียบนาน)
+SSE_HEARTBEAT = _env_int("ALLERGUARD_SSE_HEARTBEAT", 15)
+
+# =============================================================================
+# Cache ผลลัพธ์ pipeline (OCR / ส่วนผสม / ผลวิเคราะห์)
+# =============================================================================
+# "memory" (ต่อ process), "sqlite" (ใช้ร่วมกันหลาย worker) หรือ "off"
+CACHE_BACKEND = _env_str("ALLERGUARD_CACHE", "memory")
+
+# ไฟล์ SQLite (ใช้เมื่อ CACHE_BACKEND = "sqlite")
+CACHE_PATH = os.environ.get("ALLERGUARD_CACHE_PATH", "allerguard_cache.db")
+
+# จำนวนรายการสูงสุด (เกินนี้ลบรายการที่ใช้ล่าสุดนานที่สุด)
+CACHE_MAX_ENTRIES = _env_int("ALLERGUARD_CACHE_MAX_ENTRIES", 2000)
+
+# อายุของแต่ละรายการ (วินาที) - 0 = ไม่หมดอายุ
+CACHE_TTL = _env_int("ALLERGUARD_CACHE_TTL", 7 * 24 * 3600)
+
+# วัด RSS สูงสุดของ worker process ระหว่างแต่ละ request (อ่าน RSS เป็นระยะ) แล้วส่งกลับใน metrics
+# (เป็นค่าของทั้ง process - ตรงกับ request เฉพาะเมื่อ worker process รันงานทีละ 1 งาน)
+TRACK_MEMORY = _env_int("ALLERGUARD_TRACK_MEMORY", 0) == 1
+
+# =============================================================================
+# Deadline ต่อ request
+# =============================================================================
+# เวลาสูงสุดที่ pipeline 1 request ใช้ได้ (วินาที, 0 = ไม่จำกัด) - client ขอให้สั้นกว่านี้ได้ด้วย
+# header X-AllerGUARD-Deadline (วินาที) แต่ขอให้ยาวกว่านี้ไม่ได้
+REQUEST_DEADLINE = _env_int("ALLERGUARD_REQUEST_DEADLINE", 300)
+
+# เวลาที่ต้องเหลืออย่างน้อย (วินาที) ถึงจะถาม LLM ในขั้นนั้น - ไม่พอจะข้าม LLM
+# (normalize: ใช้ชื่อจาก OCR/พจนานุกรม/memo, วิเคราะห์: ใช้คำอธิบายจาก cache หรือ fallback)
+NORMALIZE_MIN_BUDGET = _env_int("ALLERGUARD_NORMALIZE_MIN_BUDGET", 20)
+ANALYSIS_MIN_BUDGET = _env_int("ALLERGUARD_ANALYSIS_MIN_BUDGET", 30)
+
+# =============================================================================
+# LLM server (Ollama HTTP API)
+# =============================================================================
+LLM_URL = os.environ.get("ALLERGUARD_LLM_URL", "http://127.0.0.1:11434")
+LLM_MODEL = os.environ.get("ALLERGUARD_LLM_MODEL", "scb10x/llama3.1-typhoon2-8b-instruct")
+
+# ให้ server เก็บโมเดลไว้ใน memory หลัง request นานเท่าไร ("30m", "-1" = ตลอด) - ไม่ต้องโหลดใหม่ทุกครั้ง
+LLM_KEEP_ALIVE = os.environ.get("ALLERGUARD_LLM_KEEP_ALIVE", "30m")
+if LLM_KEEP_ALIVE.lstrip("-").isdigit():
+    LLM_KEEP_ALIVE = int(LLM_KEEP_ALIVE)
+
+# จำนวน connection (keep-alive) ที่เก็บไว้ใช้ซ้ำ และเวลาสูงสุดต่อ request ที่ไม่ได้กำหนดเอง (วินาที)
+LLM_POOL_SIZE = _env_int("ALLERGUARD_LLM_POOL_SIZE", 4)
+LLM_TIMEOUT = _env_int("ALLERGUARD_LLM_TIMEOUT", 300)
+
+# จำนวน generation พร้อมกันสูงสุด (ควรเท่ากับ OLLAMA_NUM_PARALLEL ของ server)
+# นับรวมทุก process ที่ใช้ LLM_SLOTS_DIR เดียวกัน (worker แบบ process, precompute_explanations.py)
+# request ที่เกินรอคิวตามความสำคัญ: ผู้ใช้ที่รออยู่ก่อน งาน background/batch
+LLM_MAX_CONCURRENT = _env_int("ALLERGUARD_LLM_MAX_CONCURRENT", 4)
+
+# directory ของไฟล์ lock ที่ทำให้จำนวน generation และลำดับความสำคัญใช้ร่วมกันทุก process บนเครื่องนี้
+# "" = จำกัดแยกแต่ละ process (บน Windows จำกัดแยกเสมอ)
+LLM_SLOTS_DIR = os.environ.get("ALLERGUARD_LLM_SLOTS_DIR",
+                               os.path.join(tempfile.gettempdir(), "allerguard-llm-slots"))
+
+
+# =============================================================================
+# Normalize (LLM)
+# =============================================================================
+# ส่งให้ LLM normalize เฉพาะสารที่ OCR มั่นใจต่ำกว่านี้ (0-100)
+# สารที่ทุกคำมี confidence ถึงเกณฑ์ใช้ชื่อจาก OCR ได้เลย - ตั้ง 101 เพื่อ normalize ทุกรายการ
+NORMALIZE_MIN_CONFIDENCE = _env_int("ALLERGUARD_NORMALIZE_MIN_CONFIDENCE", 90)
+
+# แก้ชื่อสารด้วยพจนานุกรม INCI ในเครื่องก่อน (1) - ส่งให้ LLM เฉพาะสารที่พจนานุกรมแก้ไม่ได้
+INCI_NORMALIZE = _env_int("ALLERGUARD_INCI_NORMALIZE", 1) == 1
+
+# ไฟล์รายชื่อ INCI และระยะแก้คำสูงสุดต่อคำ (จำนวนตัวอักษรที่เพิ่ม/ลบ/แทน/สลับ)
+INCI_NAMES_PATH = os.environ.get(
+    "ALLERGUARD_INCI_NAMES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "inci_names.txt")
+)
+INCI_MAX_EDIT_DISTANCE = _env_int("ALLERGUARD_INCI_MAX_EDIT_DISTANCE", 2)
+
+# memo ผล normalize ของ LLM (ชื่อจาก OCR → ชื่อที่แก้แล้ว) ใช้ร่วมกันทุก request
+# "sqlite" (ใช้ร่วมกันหลาย worker/process และอยู่ข้ามการ restart), "memory" หรือ "off"
+NORMALIZE_MEMO = _env_str("ALLERGUARD_NORMALIZE_MEMO", "sqlite")
+NORMALIZE_MEMO_PATH = os.environ.get("ALLERGUARD_NORMALIZE_MEMO_PATH", "allerguard_normalize.db")
+
+# จำนวนชื่อสูงสุดใน memo (เกินนี้ลบชื่อที่ใช้ล่าสุดนานที่สุด) และอายุ (วินาที, 0 = ไม่หมดอายุ)
+NORMALIZE_MEMO_MAX_ENTRIES = _env_int("ALLERGUARD_NORMALIZE_MEMO_MAX_ENTRIES", 100000)
+NORMALIZE_MEMO_TTL = _env_int("ALLERGUARD_NORMALIZE_MEMO_TTL", 0)
+
+# แบ่งชื่อที่ต้องถาม LLM เป็น chunk ละกี่ชื่อ และส่งพร้อมกันได้กี่ chunk
+# (Ollama ต้องตั้ง OLLAMA_NUM_PARALLEL ให้รับหลาย request พร้อมกันได้ ไม่งั้นจะต่อคิวกัน)
+NORMALIZE_CHUNK_SIZE = _env_int("ALLERGUARD_NORMALIZE_CHUNK_SIZE", 12)
+NORMALIZE_CONCURRENCY = _env_int("ALLERGUARD_NORMALIZE_CONCURRENCY", 3)
+
+# เวลาสูงสุดต่อ chunk (วินาที) และจำนวนครั้งที่ถามซ้ำเมื่อ chunk ล้มเหลว/ตอบไม่ครบ
+NORMALIZE_CHUNK_TIMEOUT = _env_int("ALLERGUARD_NORMALIZE_CHUNK_TIMEOUT", 180)
+NORMALIZE_CHUNK_RETRIES = _env_int("ALLERGUARD_NORMALIZE_CHUNK_RETRIES", 1)
+
+# เวลาที่ LLM ใช้ normalize ต่อ 1 สาร (วินาที) ใช้ประมาณเวลาที่ประหยัดได้ก่อนมีค่าที่วัดจริง
+NORMALIZE_LLM_SECONDS_PER_ITEM = float(os.environ.get("ALLERGUARD_NORMALIZE_LLM_SECONDS_PER_ITEM", 1.0))
+
+# =============================================================================
+# จับคู่สารที่แพ้ (fuzzy_matcher)
+# =============================================================================
+# "auto" (ใช้ "batch" ถ้าติดตั้ง rapidfuzz ไว้), "batch" (คำนวณทุกคู่ของฉลากเป็น matrix ครั้งเดียว)
+# หรือ "loop" (fuzzy_match ทีละคู่) - ผลเหมือนกันทุกกรณี
+FUZZY_ENGINE = _env_str("ALLERGUARD_FUZZY_ENGINE", "auto")
+
+# "batch": จำนวนรายการสารที่แพ้ (ของ user ต่างๆ) ที่เก็บแบบ compile แล้วไว้ในหน่วยความจำ
+ALLERGY_PROFILE_CACHE_SIZE = _env_int("ALLERGUARD_ALLERGY_PROFILE_CACHE_SIZE", 256)
+
+# trigram index ของชื่อส่วนผสมที่รู้จัก (พจนานุกรม INCI + ALLERGEN_DB + ชื่อจากฉลากที่สแกน) (1/0)
+# profile ที่ compile แล้วดึงชื่อที่อาจตรงกับสารที่แพ้แต่ละตัวจาก index และจำผลของชื่อที่เคยคำนวณแล้ว
+INGREDIENT_INDEX = _env_int("ALLERGUARD_INGREDIENT_INDEX", 1) == 1
+
+# จำนวนชื่อสูงสุดใน index (ชื่อจากฉลากที่เกินนี้ไม่ถูกเพิ่ม)
+INGREDIENT_INDEX_MAX_NAMES = _env_int("ALLERGUARD_INGREDIENT_INDEX_MAX_NAMES", 100000)
+
+# =============================================================================
+# วิเคราะห์สารที่แพ้ (LLM)
+# =============================================================================
+# เวลาสูงสุดของการวิเคราะห์สารที่แพ้ (วินาที)
+ANALYSIS_TIMEOUT = _env_int("ALLERGUARD_ANALYSIS_TIMEOUT", 1500)
+
+# "parallel": ถามแยก request ละสาร (พร้อมกันไม่เกิน ANALYSIS_CONCURRENCY) - สารที่ตอบผิดรูปแบบไม่กระทบสารอื่น
+# "stream":   ถามทุกสารใน request เดียว แล้ว parse ทีละสารระหว่างที่ AI ยังตอบอยู่
+# ทั้งสองโหมดส่งผลแต่ละสารให้ client (event "analysis_partial") ทันทีที่สารนั้นเสร็จ
+ANALYSIS_MODE = _env_str("ALLERGUARD_ANALYSIS_MODE", "parallel")
+ANALYSIS_CONCURRENCY = _env_int("ALLERGUARD_ANALYSIS_CONCURRENCY", 3)
+
+# เริ่มวิเคราะห์สารที่ชื่อดิบจาก OCR ตรงกับสารที่แพ้อยู่แล้ว ระหว่างที่ normalize ยังทำงาน (1)
+# แล้วตรวจอีกครั้งหลัง normalize - ใช้เฉพาะ match ที่คะแนนถึง SPECULATIVE_MIN_SCORE (0-1)
+SPECULATIVE_ANALYSIS = _env_int("ALLERGUARD_SPECULATIVE_ANALYSIS", 1) == 1
+SPECULATIVE_MIN_SCORE = float(os.environ.get("ALLERGUARD_SPECULATIVE_MIN_SCORE", 0.9))
+
+# cache คำอธิบาย/สารทางเลือกต่อสาร (ไม่ขึ้นกับผลิตภัณฑ์หรือผู้ใช้) - ถาม LLM เฉพาะสารที่ยังไม่มีใน cache
+# "sqlite" (ใช้ร่วมกันหลาย worker/process และอยู่ข้ามการ restart), "memory" หรือ "off"
+EXPLANATION_CACHE = _env_str("ALLERGUARD_EXPLANATION_CACHE", "sqlite")
+EXPLANATION_CACHE_PATH = os.environ.get("ALLERGUARD_EXPLANATION_CACHE_PATH", "allerguard_explanations.db")
+
+# จำนวนสารสูงสุดใน cache (เกินนี้ลบสารที่ใช้ล่าสุดนานที่สุด) และอายุ (วินาที, 0 = ไม่หมดอายุ)
+EXPLANATION_CACHE_MAX_ENTRIES = _env_int("ALLERGUARD_EXPLANATION_CACHE_MAX_ENTRIES", 20000)
+EXPLANATION_CACHE_TTL = _env_int("ALLERGUARD_EXPLANATION_CACHE_TTL", 0)
+
+# คลังคำอธิบายที่คำนวณไว้ล่วงหน้า (python precompute_explanations.py) - ใช้ก่อน cache และ LLM
+EXPLANATION_STORE_PATH = os.environ.get(
+    "ALLERGUARD_EXPLANATION_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "explanations.json")
+)
+
+# =============================================================================
+# Upload
+# =============================================================================
+# ขนาดไฟล์ภาพสูงสุดที่รับ (MB) - ตรวจระหว่างรับข้อมูล ไม่ต้องรอรับครบทั้งไฟล์
+MAX_UPLOAD_MB = _env_int("ALLERGUARD_MAX_UPLOAD_MB", 15)
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+
+# =============================================================================
+# OCR
+# =============================================================================
+# backend ที่ใช้: "tesseract", "easyocr" หรือ "ensemble" (เร็วก่อน ช้าเมื่อผลไม่ดีพอ)
+OCR_BACKEND = _env_str("ALLERGUARD_OCR_BACKEND", "tesseract")
+
+# ensemble: backend เร็ว/ช้า และเกณฑ์ที่ต้องรัน backend ช้าเพิ่ม
+OCR_ENSEMBLE_FAST = _env_str("ALLERGUARD_OCR_ENSEMBLE_FAST", "tesseract")
+OCR_ENSEMBLE_SLOW = _env_str("ALLERGUARD_OCR_ENSEMBLE_SLOW", "easyocr")
+OCR_ENSEMBLE_MIN_INGREDIENTS = _env_int("ALLERGUARD_OCR_ENSEMBLE_MIN_INGREDIENTS", 3)
+OCR_ENSEMBLE_MIN_CONFIDENCE = _env_int("ALLERGUARD_OCR_ENSEMBLE_MIN_CONFIDENCE", 60)
+
+# EasyOCR ใช้ GPU หรือไม่ (1/0)
+EASYOCR_GPU = _env_int("ALLERGUARD_EASYOCR_GPU", 0) == 1
+
+# path ของโปรแกรม tesseract (ว่าง = หาจาก PATH)
+# Windows เช่น C:\Program Files\Tesseract-OCR\tesseract.exe
+TESSERACT_CMD = os.environ.get("ALLERGUARD_TESSERACT_CMD", "")
+if not TESSERACT_CMD and os.name == "nt" and os.path.exists(r"C:\Program Files\Tesseract-OCR\tesseract.exe"):
+    TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+# "auto" (ใช้ tesserocr ถ้าติดตั้งไว้), "tesserocr" หรือ "pytesseract"
+OCR_ENGINE = _env_str("ALLERGUARD_OCR_ENGINE", "auto")
+
+# โฟลเดอร์ tessdata (ว่าง = ใช้ค่า default ของ Tesseract / TESSDATA_PREFIX)
+TESSDATA_PATH = os.environ.get("ALLERGUARD_TESSDATA", "")
+
+# "two_pass" (หาบริเวณส่วนผสมจากภาพย่อก่อน แล้ว OCR เฉพาะบริเวณนั้น), "full" (OCR ทั้งภาพ)
+# หรือ "tiled" (OCR ทั้งภาพโดยแบ่งแถบ OCR พร้อมกันหลาย core)
+OCR_MODE = _env_str("ALLERGUARD_OCR_MODE", "two_pass")
+
+# เลือกขนาดภาพที่ใช้ OCR จากความสูงตัวอักษร (1) หรือขยาย OCR_MAX_SCALE เท่าเสมอ (0)
+OCR_ADAPTIVE_SCALE = _env_int("ALLERGUARD_OCR_ADAPTIVE_SCALE", 1) == 1
+
+# ความสูงตัวอักษรเป้าหมาย (pixel) และช่วง scale ที่ยอมให้ย่อ/ขยาย
+OCR_TARGET_TEXT_HEIGHT = _env_int("ALLERGUARD_OCR_TARGET_TEXT_HEIGHT", 30)
+OCR_MIN_SCALE = float(os.environ.get("ALLERGUARD_OCR_MIN_SCALE", 0.5))
+OCR_MAX_SCALE = float(os.environ.get("ALLERGUARD_OCR_MAX_SCALE", 2.0))
+
+# ด้านที่ยาวที่สุดของภาพย่อที่ใช้หาบริเวณส่วนผสม (pixel)
+OCR_LOCATE_MAX_SIDE = _env_int("ALLERGUARD_OCR_LOCATE_MAX_SIDE", 1600)
+
+# โหมด "tiled": จำนวนแถบที่แบ่ง และจำนวน process ที่ OCR พร้อมกัน (0 = เท่าจำนวน CPU)
+OCR_STRIPS = _env_int("ALLERGUARD_OCR_STRIPS", 0)
+OCR_STRIP_WORKERS = _env_int("ALLERGUARD_OCR_STRIP_WORKERS", 0)
+
+# ความสูงขั้นต่ำของแต่ละแถบ และส่วนที่ซ้อนกันเมื่อหาแถวว่างสำหรับตัดไม่เจอ (pixel)
+OCR_MIN_STRIP_HEIGHT = _env_int("ALLERGUARD_OCR_MIN_STRIP_HEIGHT", 300)
+OCR_STRIP_OVERLAP = _env_int("ALLERGUARD_OCR_STRIP_OVERLAP", 60)
+
+# =============================================================================
+# ดึงส่วนผสม (ingredient_extractor)
+# =============================================================================
+# ไฟล์กฎแก้ OCR errors / stop words / junk words
+OCR_RULES_PATH = os.environ.get(
+    "ALLERGUARD_OCR_RULES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ocr_rules.json")
+)
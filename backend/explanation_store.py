@@ -0,0 +1,86 @@
+"""
+คลังคำอธิบายสารที่คำนวณไว้ล่วงหน้า (สร้างด้วย precompute_explanations.py)
+
+ไฟล์ JSON แบบกระชับ:
+    {"version": "...", "model": "...", "created": 1700000000,
+     "entries": {"SALICYLIC ACID": ["คำอธิบาย", ["สารทางเลือก", ...]], ...}}
+
+server โหลดทั้งไฟล์ครั้งเดียวตอน start (อ่านอย่างเดียว) - version ไม่ตรงกับ prompt/โมเดลที่ใช้อยู่
+จะไม่ถูกใช้ (ต้องรัน precompute ใหม่)
+"""
+import json
+import os
+import threading
+import time
+
+
+class ExplanationStore:
+    """คำอธิบาย/สารทางเลือกต่อสาร (key = ชื่อสารแบบ explanation_name)"""
+
+    def __init__(self, version, model=None, entries=None, created=None):
+        self.version = version
+        self.model = model
+        self.created = created
+        self._entries = dict(entries or {})
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    @classmethod
+    def load(cls, path, version):
+        """
+        โหลดจากไฟล์ - ไม่มีไฟล์ หรือ version ไม่ตรง คืน store ว่าง
+        (version=None = ใช้ version ในไฟล์)
+        """
+        if not path or not os.path.exists(path):
+            return cls(version)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if version is not None and data.get("version") != version:
+            print(f"⚠️ คลังคำอธิบาย {path} เป็น version {data.get('version')} "
+                  f"(ปัจจุบัน {version}) - ไม่ใช้ ต้องรัน precompute_explanations.py ใหม่")
+            return cls(version)
+        return cls(data.get("version"), data.get("model"), data.get("entries"), data.get("created"))
+
+    def save(self, path):
+        """เขียนทั้งไฟล์แบบ atomic (เขียนไฟล์ชั่วคราวแล้ว rename) - ถูกหยุดกลางคันไฟล์เดิมไม่เสีย"""
+        with self._lock:
+            data = {
+                "version": self.version,
+                "model": self.model,
+                "created": self.created or int(time.time()),
+                "entries": dict(sorted(self._entries.items()))
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        with self._lock:
+            self.lookups += 1
+            self.hits += entry is not None
+        if entry is None:
+            return None
+        return {"description": entry[0], "alternatives": list(entry[1])}
+
+    def add(self, name, entry):
+        with self._lock:
+            self._entries[name] = [entry["description"], list(entry["alternatives"])]
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0
+            }
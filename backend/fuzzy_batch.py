@@ -0,0 +1,540 @@
+"""
+จับคู่สารที่แพ้กับส่วนผสมทั้งฉลากในครั้งเดียว - ผล (match/score/reason) เหมือน fuzzy_match ทีละคู่ทุกกรณี
+
+เตรียมทั้งสองฝั่งครั้งเดียว (ตัวพิมพ์ใหญ่, รูปเอกพจน์, แยกคำ, รวมชื่อ/คำที่ซ้ำกัน) แล้วคำนวณแต่ละเงื่อนไขของ
+fuzzy_match เป็น matrix (สารที่แพ้ x ส่วนผสม) แล้วเลือกเงื่อนไขแรกที่ผ่านของแต่ละคู่ด้วย np.select
+
+ความคล้ายแบบ SequenceMatcher: คัดคู่ด้วย rapidfuzz.process.cdist (C) ก่อน - ratio ของ rapidfuzz (LCS)
+ไม่ต่ำกว่า ratio ของ SequenceMatcher เสมอ คู่ที่ rapidfuzz ได้ต่ำกว่าเกณฑ์จึงไม่ผ่านแน่นอน
+เหลือเฉพาะคู่ที่ผ่านเกณฑ์ที่ต้องคำนวณ SequenceMatcher จริง (คะแนนจึงตรงกับ fuzzy_match ทุกตัว)
+
+CompiledAllergyProfile: เตรียมฝั่งสารที่แพ้ของ user ไว้ครั้งเดียว (ใช้ซ้ำทุกฉลาก, cache ตาม hash ของรายการ)
+พร้อม index bigram - ส่วนผสมที่มี bigram ร่วมกับสารที่แพ้น้อยกว่าขั้นต่ำที่ทุกเงื่อนไขต้องการ (q-gram lemma)
+ไม่มีทางตรงกันได้ จึงถูกตัดออกก่อนคำนวณ matrix
+ถ้ามี ingredient_index (trigram ของชื่อส่วนผสมที่รู้จัก): ดึง candidates ของสารที่แพ้แต่ละตัวจาก index ครั้งเดียวต่อ profile
+ชื่อที่ index รู้จักคำนวณเฉพาะคู่นั้น และจำผลไว้ (ฉลากถัดไปที่มีชื่อเดิมไม่ต้องคำนวณอีก)
+
+    profile = get_profile(user_allergies)
+    for allergen, ingredient, score, reason in profile.match(ingredients, threshold=0.85): ...
+"""
+import hashlib
+import json
+import math
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+import config
+from fuzzy_matcher import COMMON_WORDS, singular
+from ingredient_index import get_ingredient_index
+from result_cache import MemoryCache
+
+# ระยะเผื่อตอนคัดคู่ด้วย rapidfuzz (คะแนน 0-100 แบบ float32) - เผื่อมากไปแค่ต้องคำนวณจริงเพิ่ม
+_CUTOFF_MARGIN = 1e-3
+
+# เงื่อนไขของ fuzzy_match ตามลำดับ (0 = ไม่ตรง)
+EXACT, PREFIX, CONTAINED, WORD_PART, SIMILAR, WORDS = range(1, 7)
+
+
+def available():
+    return process is not None
+
+
+def _unique_upper(values):
+    """(ชื่อตัวพิมพ์ใหญ่ที่ไม่ซ้ำกัน, index ของแต่ละค่าในรายชื่อนั้น)"""
+    index = {}
+    inverse = [index.setdefault(v.upper().strip(), len(index)) for v in values]
+    return list(index), inverse
+
+
+class _Allergens:
+    """ฝั่งสารที่แพ้ที่เตรียมแล้ว (ชื่อไม่ซ้ำกัน)"""
+
+    def __init__(self, names):
+        self.names = names
+        self.singular = [singular(n) for n in names]
+        self.lengths = np.array([len(n) for n in names], dtype=np.int64)
+        self.singular_lengths = np.array([len(s) for s in self.singular], dtype=np.int64)
+        self.words = [n.split() for n in names]
+        self.n_words = np.array([len(w) for w in self.words], dtype=np.int64)
+
+        # เงื่อนไข 5: allergen คำเดียวที่ไม่ใช่คำทั่วไป / allergen หลายคำที่มีคำเฉพาะ
+        self.single = [a for a, words in enumerate(self.words) if len(words) == 1 and names[a] not in COMMON_WORDS]
+        self.multi = [a for a, words in enumerate(self.words)
+                      if len(words) > 1 and any(w not in COMMON_WORDS for w in words)]
+
+        # คำของ allergen หลายคำ (ไม่ซ้ำกัน) และจำนวนครั้งที่แต่ละ allergen ใช้คำนั้น (ทุกคำ / เฉพาะคำเฉพาะ)
+        vocabulary = {}
+        counts, specific = [], []
+        for a in self.multi:
+            for word in self.words[a]:
+                counts.append((a, vocabulary.setdefault(word, len(vocabulary))))
+                if word not in COMMON_WORDS:
+                    specific.append(counts[-1])
+        self.multi_words = list(vocabulary)
+        self.word_weights = self._weights(counts)
+        self.specific_weights = self._weights(specific)
+
+    def _weights(self, pairs):
+        weights = np.zeros((len(self.names), len(self.multi_words)), dtype=np.float32)
+        np.add.at(weights, tuple(np.array(pairs, dtype=np.int64).reshape(-1, 2).T), 1)
+        return weights
+
+
+class _Ingredients:
+    """
+    ฝั่งส่วนผสมที่เตรียมแล้ว (ชื่อไม่ซ้ำกัน) - คำของทุกชื่อรวมเป็นคำศัพท์ที่ไม่ซ้ำกัน (words)
+    ตำแหน่งคำเก็บแบบแบน: คำที่ p คือ words[flat_word[p]] ของส่วนผสม flat_ingredient[p] (เรียงตามลำดับในชื่อ)
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.lengths = np.array([len(n) for n in names], dtype=np.int64)
+        vocabulary, flat_word, flat_ingredient = {}, [], []
+        for i, name in enumerate(names):
+            for word in name.split():
+                flat_word.append(vocabulary.setdefault(word, len(vocabulary)))
+                flat_ingredient.append(i)
+        self.words = list(vocabulary)
+        self.word_singular = [singular(w) for w in self.words]
+        self.word_lengths = np.array([len(w) for w in self.words], dtype=np.int64)
+        self.word_singular_lengths = np.array([len(s) for s in self.word_singular], dtype=np.int64)
+        self.flat_word = np.array(flat_word, dtype=np.int64)
+        self.flat_ingredient = np.array(flat_ingredient, dtype=np.int64)
+        # in_name[คำ, ส่วนผสม] = ชื่อนั้นมีคำนี้
+        self.in_name = np.zeros((len(self.words), len(names)), dtype=np.float32)
+        self.in_name[self.flat_word, self.flat_ingredient] = 1
+
+
+def _contains(needles, haystacks, mask):
+    """matrix [needle, haystack] = needle อยู่ใน haystack หรือไม่ (ตรวจเฉพาะช่องที่ mask เป็น True)"""
+    found = np.zeros(mask.shape, dtype=bool)
+    rows, cols = np.nonzero(mask)
+    if rows.size:
+        found[rows, cols] = [needles[r] in haystacks[c] for r, c in zip(rows.tolist(), cols.tolist())]
+    return found
+
+
+def _similar(queries, choices, threshold, mask=None):
+    """{(query, choice): ratio} ของคู่ที่ SequenceMatcher ratio >= threshold (เฉพาะช่องที่ mask เป็น True)"""
+    if not queries or not choices:
+        return {}
+    scores = process.cdist(queries, choices, scorer=fuzz.ratio, processor=None)
+    passed = scores >= threshold * 100 - _CUTOFF_MARGIN
+    if mask is not None:
+        passed &= mask
+    rows, cols = np.nonzero(passed)
+    similar = {}
+    for q, c in zip(rows.tolist(), cols.tolist()):
+        ratio = SequenceMatcher(None, queries[q], choices[c]).ratio()
+        if ratio >= threshold:
+            similar[q, c] = ratio
+    return similar
+
+
+def _first_word(word_hits, ingredients):
+    """
+    word_hits: matrix [สารที่แพ้, คำ] ว่าคำนั้นผ่านเงื่อนไขหรือไม่
+    คืน matrix [สารที่แพ้, ส่วนผสม] ของตำแหน่งแบน (flat) ของคำแรกในชื่อที่ผ่าน (ไม่มี = จำนวนตำแหน่งทั้งหมด)
+    """
+    total = ingredients.flat_word.size
+    first = np.full((word_hits.shape[0], len(ingredients.names)), total, dtype=np.int64)
+    rows, positions = np.nonzero(word_hits[:, ingredients.flat_word])
+    np.minimum.at(first, (rows, ingredients.flat_ingredient[positions]), positions)
+    return first
+
+
+def _word_part(allergens, ingredients, word_mask):
+    """
+    เงื่อนไข 3.5 (ชื่อที่พิมพ์อยู่ในคำหนึ่งของชื่อสาร) ระดับคำ: matrix [สารที่แพ้, คำ] ของรูปแบบแรกที่ผ่าน
+    (0-3 = allergen/allergen เอกพจน์ x คำ/คำเอกพจน์ ตามลำดับที่ fuzzy_match ลอง, -1 = ไม่ผ่าน)
+    """
+    forms = [
+        (allergens.names, allergens.lengths, ingredients.words, ingredients.word_lengths),
+        (allergens.names, allergens.lengths, ingredients.word_singular, ingredients.word_singular_lengths),
+        (allergens.singular, allergens.singular_lengths, ingredients.words, ingredients.word_lengths),
+        (allergens.singular, allergens.singular_lengths, ingredients.word_singular, ingredients.word_singular_lengths),
+    ]
+    code = np.full((len(allergens.names), len(ingredients.words)), -1, dtype=np.int8)
+    long_enough = (allergens.lengths >= 5)[:, None] & word_mask   # ต้องพิมพ์อย่างน้อย 5 ตัวอักษร
+    for form, (needles, needle_lengths, words, word_lengths) in enumerate(forms):
+        n_len, w_len = needle_lengths[:, None], word_lengths[None, :]
+        mask = long_enough & (code < 0) & (n_len <= w_len) & (2 * n_len >= w_len)
+        code[_contains(needles, words, mask)] = form
+    return code
+
+
+def _word_counts(allergens, ingredients, threshold):
+    """
+    เงื่อนไข 5 (allergen หลายคำ): matrix [สารที่แพ้, ส่วนผสม] ของ (จำนวนคำที่ตรง, จำนวนคำเฉพาะที่ตรง)
+    คำของ allergen ตรงถ้าคล้ายกับคำใดคำหนึ่งในชื่อสาร
+    """
+    shape = (len(allergens.names), len(ingredients.names))
+    if not allergens.multi or not ingredients.words:
+        return np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+
+    similar = np.zeros((len(allergens.multi_words), len(ingredients.words)), dtype=np.float32)
+    for (w, v) in _similar(allergens.multi_words, ingredients.words, threshold):
+        similar[w, v] = 1
+    word_found = (similar @ ingredients.in_name > 0).astype(np.float32)   # [คำของ allergen, ส่วนผสม]
+    return ((allergens.word_weights @ word_found).astype(np.int64),
+            (allergens.specific_weights @ word_found).astype(np.int64))
+
+
+def _match_unique(allergens, ingredients, threshold, candidates=None):
+    """
+    {(allergen, ingredient): (score, reason)} ของคู่ที่ตรงกัน (index ของชื่อที่ไม่ซ้ำกัน)
+    candidates: matrix [สารที่แพ้, ส่วนผสม] ของคู่ที่อาจตรงกัน (None = ทุกคู่) - คู่อื่นไม่ถูกตรวจ
+    """
+    if not allergens.names or not ingredients.names:
+        return {}
+    shape = (len(allergens.names), len(ingredients.names))
+    if candidates is None:
+        candidates = np.ones(shape, dtype=bool)
+        word_mask = np.ones((shape[0], len(ingredients.words)), dtype=bool)
+    else:
+        # คำที่อยู่ในส่วนผสมที่อาจตรงกับ allergen นั้น
+        word_mask = candidates.astype(np.float32) @ ingredients.in_name.T > 0
+    a_len = allergens.lengths[:, None]
+    i_len = ingredients.lengths[None, :]
+
+    exact = np.zeros(shape, dtype=bool)
+    for a, name in enumerate(allergens.names):
+        i = ingredients.index.get(name)
+        if i is not None:
+            exact[a, i] = True
+    prefix = _contains(allergens.names, ingredients.names,
+                       candidates & (a_len <= i_len) & (2 * a_len >= i_len))
+    contained = _contains(ingredients.names, allergens.names,
+                          (candidates & (i_len <= a_len) & (2 * i_len >= a_len)).T).T
+
+    part_code = _word_part(allergens, ingredients, word_mask)
+    part_first = _first_word(part_code >= 0, ingredients)
+    word_part = part_first < ingredients.flat_word.size
+
+    similarity = _similar(allergens.names, ingredients.names, threshold, candidates)
+    similar = np.zeros(shape, dtype=bool)
+    if similarity:
+        similar[tuple(np.array(list(similarity)).T)] = True
+
+    # เงื่อนไข 5: allergen คำเดียว (ที่ไม่ใช่คำทั่วไป) คล้ายกับคำใดคำหนึ่งในชื่อสาร
+    single = allergens.single
+    word_similarity = {(single[q], w): ratio for (q, w), ratio
+                       in _similar([allergens.names[a] for a in single], ingredients.words, threshold,
+                                   word_mask[single]).items()}
+    word_hits = np.zeros((shape[0], len(ingredients.words)), dtype=bool)
+    if word_similarity:
+        word_hits[tuple(np.array(list(word_similarity)).T)] = True
+    word_first = _first_word(word_hits, ingredients)
+
+    matching, specific = _word_counts(allergens, ingredients, threshold)
+    n_words = allergens.n_words[:, None]
+    words = (word_first < ingredients.flat_word.size) | ((specific > 0) & (2 * matching >= n_words))
+
+    rule = np.select([exact, prefix, contained, word_part, similar, words],
+                     [EXACT, PREFIX, CONTAINED, WORD_PART, SIMILAR, WORDS], 0)
+
+    matches = {}
+    for a, i in zip(*(x.tolist() for x in np.nonzero(rule))):
+        allergen, ingredient = allergens.names[a], ingredients.names[i]
+        kind = rule[a, i]
+        if kind == EXACT:
+            matches[a, i] = (1.0, "ตรงทุกตัวอักษร")
+        elif kind == PREFIX:
+            matches[a, i] = (len(allergen) / len(ingredient),
+                             f"พิมพ์ไม่ครบ (พิมพ์ {len(allergen)}/{len(ingredient)} ตัว)")
+        elif kind == CONTAINED:
+            matches[a, i] = (len(ingredient) / len(allergen), "ชื่อสารมีคำที่คุณพิมพ์")
+        elif kind == WORD_PART:
+            w = int(ingredients.flat_word[part_first[a, i]])
+            form = int(part_code[a, w])
+            allergen_form = allergens.singular[a] if form >= 2 else allergen
+            word_form = ingredients.word_singular[w] if form % 2 else ingredients.words[w]
+            matches[a, i] = (len(allergen_form) / len(word_form),
+                             f"พบคำว่า '{allergen_form}' ในส่วนของ '{ingredients.words[w]}'")
+        elif kind == SIMILAR:
+            score = similarity[a, i]
+            matches[a, i] = (score, f"คล้ายกัน {int(score*100)}% (อาจพิมพ์ผิด)")
+        elif word_first[a, i] < ingredients.flat_word.size:
+            w = int(ingredients.flat_word[word_first[a, i]])
+            score = word_similarity[a, w]
+            matches[a, i] = (score, f"ตรงกับคำ '{ingredients.words[w]}' ในชื่อสาร ({int(score*100)}%)")
+        else:
+            n, m = int(n_words[a, 0]), int(matching[a, i])
+            matches[a, i] = (m / n, f"ตรง {m}/{n} คำ")
+    return matches
+
+
+def _expand(matches, allergen_ids, ingredient_ids):
+    """ผลของชื่อที่ไม่ซ้ำกัน → (index ใน allergens, index ใน ingredients, score, reason) ตามรายการเดิม"""
+    if not matches:
+        return []
+    by_allergen = {}
+    for (a, i), result in matches.items():
+        by_allergen.setdefault(a, {})[i] = result
+    positions = {}
+    for position, i in enumerate(ingredient_ids):
+        positions.setdefault(i, []).append(position)
+
+    pairs = []
+    for a_position, a in enumerate(allergen_ids):
+        found = by_allergen.get(a)
+        if not found:
+            continue
+        hits = sorted((position, i) for i in found for position in positions[i])
+        pairs.extend((a_position, position, *found[i]) for position, i in hits)
+    return pairs
+
+
+def match_pairs(allergens, ingredients, threshold=0.75):
+    """
+    ทุกคู่ที่ fuzzy_match(allergen, ingredient, threshold) ตรงกัน (คำนวณทุกคู่ ไม่ตัดด้วย index)
+    คืน list ของ (index ใน allergens, index ใน ingredients, score, reason) เรียงตาม allergen แล้ว ingredient
+    """
+    allergen_names, allergen_ids = _unique_upper(allergens)
+    ingredient_names, ingredient_ids = _unique_upper(ingredients)
+    matches = _match_unique(_Allergens(allergen_names), _Ingredients(ingredient_names), threshold)
+    return _expand(matches, allergen_ids, ingredient_ids)
+
+
+# id ของ bigram (ใช้ร่วมกันทั้ง process) - index ของ profile ใช้ id เป็นตำแหน่งใน array แทน dict
+_gram_ids = {}
+_gram_ids_lock = threading.Lock()
+
+
+@lru_cache(maxsize=65536)
+def _bigrams(text):
+    """
+    (id ของ bigram, จำนวนครั้ง) ของชื่อ เป็น array
+    (cache - ชื่อส่วนผสมเดิมซ้ำกันมากระหว่างฉลาก, ห้ามแก้ค่าที่คืน)
+    """
+    counts = Counter(text[i:i + 2] for i in range(len(text) - 1))
+    with _gram_ids_lock:
+        ids = [_gram_ids.setdefault(gram, len(_gram_ids)) for gram in counts]
+    return np.array(ids, dtype=np.int64), np.array(list(counts.values()), dtype=np.int64)
+
+
+def _word_bound(length, threshold):
+    """
+    จำนวน bigram ร่วมขั้นต่ำระหว่างคำยาว length กับชื่อสารที่มีคำใดคำหนึ่งคล้ายกัน >= threshold
+    (ค่าต่ำสุดของทุกความยาวคำที่ยังคล้ายได้ - ไม่มีความยาวไหนคล้ายได้ = ตัดทิ้งทั้งหมด)
+    """
+    bound = math.inf
+    for other in range(1, int(length * 2 / threshold) + 2):
+        if 2 * min(length, other) >= threshold * (length + other) - 1e-9:
+            bound = min(bound, _shared_bound(length, other, threshold))
+    return bound
+
+
+def _shared_bound(length, other, threshold):
+    """
+    q-gram lemma: สตริงที่ต่างกัน d ครั้ง (เพิ่ม/ลบ 1 ตัว) มี bigram ร่วมกันอย่างน้อย max(ความยาว) - 1 - 2d
+    ratio >= threshold ⇒ d <= (1 - threshold) * (ความยาวรวม) (LCS ของ SequenceMatcher ไม่เกิน LCS จริง)
+    """
+    distance = np.floor((1 - threshold) * (length + other) + 1e-9)
+    return np.maximum(length, other) - 1 - 2 * distance
+
+
+class CompiledAllergyProfile:
+    """
+    รายการสารที่แพ้ของ user ที่เตรียมไว้แล้ว - match() ให้ผลเหมือน fuzzy_match ทุกคู่ (ตามลำดับ allergen แล้ว ingredient)
+
+    index: bigram ของชื่อเต็มของแต่ละ allergen (แถว 0..A-1) และของคำเฉพาะของ allergen หลายคำ (แถวถัดไป)
+    เก็บเป็น matrix 0/1 แยกตามจำนวนครั้ง (levels[c][แถว, bigram] = มี bigram นั้นอย่างน้อย c+1 ครั้ง)
+    bigram ร่วม (นับซ้ำ) ของทุกแถวกับทุกส่วนผสม = ผลรวมของ levels[c] @ (ส่วนผสม >= c+1) ทุก c
+
+    ingredient_index: TrigramIndex ของชื่อส่วนผสมที่รู้จัก (None = ไม่ใช้)
+    """
+
+    def __init__(self, allergies, ingredient_index=None):
+        self.allergies = list(allergies)
+        self.ingredient_index = ingredient_index
+        self._known = {}         # threshold -> _index_state
+        self._known_lock = threading.Lock()
+        names, self._allergen_ids = _unique_upper(self.allergies)
+        self._allergens = _Allergens(names)
+
+        keys = list(names)
+        self._word_keys = []     # (allergen, แถวใน index) ของคำเฉพาะ
+        for a in self._allergens.multi:
+            for word in dict.fromkeys(self._allergens.words[a]):
+                if word not in COMMON_WORDS:
+                    self._word_keys.append((a, len(keys)))
+                    keys.append(word)
+        self._key_lengths = np.array([len(k) for k in keys], dtype=np.int64)
+
+        grams = [_bigrams(k) for k in keys]
+        ids = np.unique(np.concatenate([g for g, _ in grams] or [np.zeros(0, dtype=np.int64)]))
+        self._columns = np.full(int(ids.max(initial=-1)) + 1, -1, dtype=np.int64)   # id ของ bigram -> คอลัมน์
+        self._columns[ids] = np.arange(ids.size)
+        self._n_columns = ids.size
+        counts = self._counts(grams)
+        self._levels = [(counts >= c).astype(np.float32) for c in range(1, int(counts.max(initial=0)) + 1)]
+        self._bounds = {}
+
+    def __len__(self):
+        return len(self.allergies)
+
+    def _word_bounds(self, threshold):
+        """bound ของเงื่อนไข 5 ต่อแถวของ index (cache ตาม threshold)"""
+        bounds = self._bounds.get(threshold)
+        if bounds is None:
+            bounds = self._bounds[threshold] = np.array(
+                [_word_bound(int(length), threshold) for length in self._key_lengths], dtype=np.float64)
+        return bounds
+
+    def _counts(self, grams):
+        """matrix [ชื่อ, คอลัมน์ bigram ของ index] ของจำนวนครั้ง (bigram ที่ไม่มีใน index ไม่นับ)"""
+        counts = np.zeros((len(grams), self._n_columns), dtype=np.int64)
+        if not grams or not self._n_columns:
+            return counts
+        rows = np.repeat(np.arange(len(grams)), [ids.size for ids, _ in grams])
+        ids = np.concatenate([ids for ids, _ in grams])
+        values = np.concatenate([values for _, values in grams])
+        known = ids < self._columns.size
+        columns = np.full(ids.size, -1, dtype=np.int64)
+        columns[known] = self._columns[ids[known]]
+        found = columns >= 0
+        counts[rows[found], columns[found]] = values[found]
+        return counts
+
+    def _shared(self, names):
+        """matrix [แถวของ index, ส่วนผสม] ของจำนวน bigram ร่วม (นับซ้ำ)"""
+        counts = self._counts([_bigrams(name) for name in names])
+        shared = np.zeros((len(self._key_lengths), len(names)), dtype=np.float32)
+        for c, level in enumerate(self._levels, start=1):
+            shared += level @ (counts >= c).T.astype(np.float32)
+        return shared
+
+    def candidates(self, names, threshold):
+        """
+        matrix [สารที่แพ้, ส่วนผสม] ของคู่ที่อาจตรงกัน (False = ไม่ผ่านเงื่อนไขใดของ fuzzy_match แน่นอน)
+        names: ชื่อส่วนผสมตัวพิมพ์ใหญ่ที่ไม่ซ้ำกัน
+        """
+        allergens = self._allergens
+        A = len(allergens.names)
+        if threshold <= 0:
+            return np.ones((A, len(names)), dtype=bool)
+
+        shared = self._shared(names)
+        s = shared[:A]
+        a_len = allergens.lengths[:, None]
+        i_len = np.array([len(n) for n in names], dtype=np.int64)[None, :]
+        word_bounds = self._word_bounds(threshold)
+
+        candidate = (a_len <= i_len) & (i_len <= 2 * a_len) & (s >= a_len - 1)           # เงื่อนไข 1-2
+        candidate |= (i_len <= a_len) & (a_len <= 2 * i_len) & (s >= i_len - 1)          # เงื่อนไข 3
+        candidate |= (a_len >= 5) & (s >= allergens.singular_lengths[:, None] - 1)       # เงื่อนไข 3.5
+        candidate |= s >= _shared_bound(a_len, i_len, threshold)                         # เงื่อนไข 4
+        single = allergens.single
+        candidate[single] |= s[single] >= word_bounds[single][:, None]                   # เงื่อนไข 5 (คำเดียว)
+        for a, row in self._word_keys:                                                   # เงื่อนไข 5 (หลายคำ)
+            candidate[a] |= shared[row] >= word_bounds[row]
+        return candidate
+
+    def _index_state(self, threshold):
+        """
+        ข้อมูลจาก ingredient_index ต่อ threshold (สร้างครั้งแรกที่ใช้):
+        (จำนวนชื่อใน index ตอนนั้น, {id ชื่อ: [สารที่แพ้ที่อาจตรง]} จาก TrigramIndex.candidates ของแต่ละสารที่แพ้,
+         {id ชื่อ: [(สารที่แพ้, (score, reason))]} ผลของชื่อที่เคยคำนวณแล้ว)
+        """
+        with self._known_lock:
+            state = self._known.get(threshold)
+            if state is None:
+                index = self.ingredient_index
+                size = len(index)
+                allergens_of = {}
+                for a, name in enumerate(self._allergens.names):
+                    for name_id in index.candidates(name, threshold).tolist():
+                        if name_id < size:      # ชื่อที่ถูกเพิ่มระหว่างนี้นับเป็นชื่อที่ไม่รู้จัก
+                            allergens_of.setdefault(name_id, []).append(a)
+                state = self._known[threshold] = (size, allergens_of, {})
+            return state
+
+    def match_pairs(self, ingredients, threshold=0.75):
+        """
+        เหมือน match_pairs(self.allergies, ingredients, threshold) แต่คำนวณเฉพาะคู่ที่ผ่าน index
+        (ชื่อที่ ingredient_index รู้จักใช้ candidates ของ index และผลที่เคยคำนวณแล้ว, ชื่ออื่นใช้ index bigram)
+        """
+        names, ingredient_ids = _unique_upper(ingredients)
+        if not names or not self._allergens.names:
+            return []
+        candidates = np.zeros((len(self._allergens.names), len(names)), dtype=bool)
+        matches = {}
+        unknown = list(range(len(names)))
+        pending = {}             # ชื่อที่รู้จักแต่ยังไม่เคยคำนวณ: ตำแหน่ง -> id ใน index
+        if self.ingredient_index is not None and threshold > 0:
+            size, allergens_of, known = self._index_state(threshold)
+            unknown = []
+            for i, name in enumerate(names):
+                name_id = self.ingredient_index.id(name)
+                if name_id is None or name_id >= size:
+                    unknown.append(i)
+                elif name_id in known:
+                    matches.update(((a, i), result) for a, result in known[name_id])
+                else:
+                    pending[i] = name_id
+                    candidates[allergens_of.get(name_id, []), i] = True
+        if unknown:
+            candidates[:, unknown] = self.candidates([names[i] for i in unknown], threshold)
+
+        columns = np.flatnonzero(candidates.any(axis=0)).tolist()
+        if columns:
+            subset = _match_unique(self._allergens, _Ingredients([names[i] for i in columns]), threshold,
+                                   candidates[:, columns])
+            matches.update(((a, columns[i]), result) for (a, i), result in subset.items())
+        if pending:
+            found = {}
+            for (a, i), result in matches.items():
+                if i in pending:
+                    found.setdefault(i, []).append((a, result))
+            for i, name_id in pending.items():
+                known[name_id] = found.get(i, [])
+        return _expand(matches, self._allergen_ids, ingredient_ids)
+
+    def match(self, ingredients, threshold=0.75):
+        """(allergen, ingredient, score, reason) ของทุกคู่ที่ตรงกัน เรียงตาม allergen แล้ว ingredient"""
+        ingredients = list(ingredients)
+        return [(self.allergies[a], ingredients[i], score, reason)
+                for a, i, score, reason in self.match_pairs(ingredients, threshold)]
+
+
+def profile_key(allergies):
+    """key ของรายการสารที่แพ้ตามที่ user กรอก (ลำดับมีผลกับผลลัพธ์ จึงไม่เรียง/รวมตัวพิมพ์แบบ allergy_profile_key)"""
+    data = json.dumps([str(a) for a in allergies], ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_profile_cache():
+    """cache ของ CompiledAllergyProfile (ในหน่วยความจำ - สร้างครั้งเดียวต่อ process)"""
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            _profiles = MemoryCache(max_entries=config.ALLERGY_PROFILE_CACHE_SIZE)
+        return _profiles
+
+
+def get_profile(allergies):
+    """CompiledAllergyProfile ของรายการสารที่แพ้ - user ที่ใช้รายการเดิมซ้ำไม่ต้องสร้างใหม่"""
+    allergies = list(allergies)
+    cache = get_profile_cache()
+    key = f"profile:{profile_key(allergies)}"
+    profile = cache.get(key)
+    if profile is None:
+        index = get_ingredient_index() if config.INGREDIENT_INDEX else None
+        profile = CompiledAllergyProfile(allergies, ingredient_index=index)
+        cache.set(key, profile)
+    return profile
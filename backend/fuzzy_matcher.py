@@ -1,5 +1,21 @@
 from difflib import SequenceMatcher
 
+import config
+
+# คำทั่วไปที่ไม่ควรใช้จับคู่ (ACID, GLYCOL, EXTRACT, OIL, WATER, etc.)
+COMMON_WORDS = frozenset({'ACID', 'GLYCOL', 'EXTRACT', 'OIL', 'WATER', 'AQUA', 'BUTTER',
+                          'OXIDE', 'CHLORIDE', 'SULFATE', 'ACETATE'})
+
+
+def singular(word):
+    """รูปเอกพจน์อย่างง่าย (ลบ ES/S ท้าย)"""
+    if word.endswith('ES'):
+        return word[:-2]
+    if word.endswith('S'):
+        return word[:-1]
+    return word
+
+
 def fuzzy_match(user_allergen, ingredient_name, threshold=0.75):
     """
     เปรียบเทียบชื่อสาร 2 ชื่อด้วย fuzzy matching
@@ -18,17 +34,7 @@ def fuzzy_match(user_allergen, ingredient_name, threshold=0.75):
     ingredient_upper = ingredient_name.upper().strip()
     
     # จัดการพหูพจน์ (ลบ S/ES ท้าย)
-    allergen_singular = allergen_upper
-    if allergen_upper.endswith('ES'):
-        allergen_singular = allergen_upper[:-2]
-    elif allergen_upper.endswith('S'):
-        allergen_singular = allergen_upper[:-1]
-    
-    ingredient_singular = ingredient_upper
-    if ingredient_upper.endswith('ES'):
-        ingredient_singular = ingredient_upper[:-2]
-    elif ingredient_upper.endswith('S'):
-        ingredient_singular = ingredient_upper[:-1]
+    allergen_singular = singular(allergen_upper)
     
     # เงื่อนไข 1: ตรงทุกตัวอักษร (Exact Match)
     if allergen_upper == ingredient_upper:
@@ -63,11 +69,7 @@ def fuzzy_match(user_allergen, ingredient_name, threshold=0.75):
     if len(allergen_upper) >= 5:  # ต้องพิมพ์อย่างน้อย 5 ตัวอักษร
         for word in ingredient_upper.split():
             # ลองทั้ง word ปกติและ singular form ของ word
-            word_singular = word
-            if word.endswith('ES'):
-                word_singular = word[:-2]
-            elif word.endswith('S'):
-                word_singular = word[:-1]
+            word_singular = singular(word)
             
             # เช็คทั้ง allergen_upper และ allergen_singular กับ word และ word_singular
             for allergen_form in [allergen_upper, allergen_singular]:
@@ -95,13 +97,8 @@ def fuzzy_match(user_allergen, ingredient_name, threshold=0.75):
     allergen_words = allergen_upper.split()
     ingredient_words = ingredient_upper.split()
     
-    # กรองคำทั่วไปที่ไม่ควรใช้จับคู่ (ACID, GLYCOL, EXTRACT, OIL, WATER, etc.)
-    COMMON_WORDS = {'ACID', 'GLYCOL', 'EXTRACT', 'OIL', 'WATER', 'AQUA', 'BUTTER', 
-                    'OXIDE', 'CHLORIDE', 'SULFATE', 'ACETATE'}
-    
     # กรองคำทั่วไปออก
     allergen_specific = [w for w in allergen_words if w not in COMMON_WORDS]
-    ingredient_specific = [w for w in ingredient_words if w not in COMMON_WORDS]
     
     # ถ้า user พิมพ์ 1 คำ ให้เช็คว่าตรงกับคำไหนใน ingredient ไหม
     if len(allergen_words) == 1:
@@ -153,30 +150,77 @@ def fuzzy_match(user_allergen, ingredient_name, threshold=0.75):
     }
 
 
+def _use_batch():
+    """ใช้ fuzzy_batch (profile ที่ compile ไว้ + matrix ทั้งฉลากครั้งเดียว) หรือ fuzzy_match ทีละคู่ ตาม config.FUZZY_ENGINE"""
+    import fuzzy_batch
+    engine = config.FUZZY_ENGINE
+    if engine == "auto":
+        return fuzzy_batch.available()
+    if engine == "batch" and not fuzzy_batch.available():
+        raise RuntimeError("❌ ไม่ได้ติดตั้ง rapidfuzz (pip install rapidfuzz)")
+    return engine == "batch"
+
+
+def _matched_pairs(user_allergies, normalized_ingredients, threshold):
+    """(allergen, ingredient, score, reason) ของทุกคู่ที่ fuzzy_match ตรงกัน เรียงตาม allergen แล้ว ingredient"""
+    if _use_batch():
+        from fuzzy_batch import get_profile
+        yield from get_profile(user_allergies).match(normalized_ingredients, threshold)
+        return
+
+    for allergen in user_allergies:
+        for ingredient in normalized_ingredients:
+            result = fuzzy_match(allergen, ingredient, threshold=threshold)
+            if result["match"]:
+                yield allergen, ingredient, result["score"], result["reason"]
+
+
 def find_matching_allergens(user_allergies, normalized_ingredients):
     matches = []
     matched_ingredients = set()  # เพิ่มตรงนี้
     
-    for allergen in user_allergies:
-        for ingredient in normalized_ingredients:
-            result = fuzzy_match(allergen, ingredient, threshold=0.85)
+    pairs = _matched_pairs(list(user_allergies), list(normalized_ingredients), threshold=0.85)
+    for allergen, ingredient, score, reason in pairs:
+        # ถ้าสารนี้ถูก match ไปแล้ว ข้ามได้เลย
+        if ingredient in matched_ingredients:
+            continue
             
-            if result["match"]:
-                # ถ้าสารนี้ถูก match ไปแล้ว ข้ามได้เลย
-                if ingredient in matched_ingredients:
-                    continue
-                    
-                matched_ingredients.add(ingredient)  # เพิ่มตรงนี้
-                matches.append({
-                    "allergen": allergen,
-                    "ingredient": ingredient,
-                    "match_score": result["score"],
-                    "reason": result["reason"]
-                })
-                print(f"✅ Match: '{allergen}' → '{ingredient}' ({result['reason']})")
+        matched_ingredients.add(ingredient)  # เพิ่มตรงนี้
+        matches.append({
+            "allergen": allergen,
+            "ingredient": ingredient,
+            "match_score": score,
+            "reason": reason
+        })
+        print(f"✅ Match: '{allergen}' → '{ingredient}' ({reason})")
     
     return matches
 
+def find_exact_allergens(user_allergies, ingredient):
+    """
+    เช็คแบบเร็วเฉพาะกรณีที่แน่นอน: ชื่อตรงกันทุกตัว หรือชื่อสารที่แพ้อยู่ในชื่อสารเป็นคำเต็ม
+    (เช่น "MILK" ใน "MILK POWDER") ใช้แจ้งผลได้ทันทีระหว่างที่ยัง OCR / normalize อยู่
+    """
+    ingredient_words = f" {' '.join(ingredient.upper().split())} "
+    matches = []
+    for allergen in user_allergies:
+        allergen_upper = " ".join(allergen.upper().split())
+        if not allergen_upper:
+            continue
+        if ingredient_words.strip() == allergen_upper:
+            reason = "ตรงทุกตัวอักษร"
+        elif f" {allergen_upper} " in ingredient_words:
+            reason = f"ตรงกับคำ '{allergen_upper}' ในชื่อสาร"
+        else:
+            continue
+        matches.append({
+            "allergen": allergen,
+            "ingredient": ingredient,
+            "match_score": 1.0,
+            "reason": reason
+        })
+    return matches
+
 # ทดสอบ
 if __name__ == "__main__":
     # Test cases
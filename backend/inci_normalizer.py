@@ -0,0 +1,292 @@
+"""
+Normalize ชื่อสารจาก OCR ด้วยพจนานุกรม INCI ในเครื่อง (ไม่ต้องเรียก LLM)
+
+ใช้ index แบบ SymSpell (symmetric delete): ตอนโหลดสร้างคำที่ลบตัวอักษรออก 1-2 ตัวของทุกคำ
+ในพจนานุกรมไว้ล่วงหน้า ตอนค้นหาแค่สร้างคำที่ลบตัวอักษรของคำจาก OCR แล้วเปิด dict
+- เวลาค้นหาไม่ขึ้นกับขนาดพจนานุกรม
+
+แก้ทีละคำ แล้วตรวจว่าทั้งวลีเป็นชื่อ (หรือส่วนต้นของชื่อ) ที่มีอยู่จริงในพจนานุกรม
+เช่น "Salicylic 0id" → "SALICYLIC ACID" แต่ "Salicylic Oil" ไม่มีในพจนานุกรม จึงไม่แก้
+"""
+import re
+import threading
+import time
+
+import config
+
+_TOKEN_RE = re.compile(r"[A-Z0-9]+")
+
+# ตัวอักษร/ตัวเลขที่ OCR อ่านสลับกันบ่อย
+_DIGIT_TO_LETTER = str.maketrans("015836", "OISBBG")
+_LETTER_TO_DIGIT = str.maketrans("OILSBZ", "011582")
+
+# จำนวนตัวเลือกต่อคำที่นำไปประกอบเป็นวลี
+_CANDIDATES_PER_WORD = 6
+
+
+def tokenize(text):
+    """แยกชื่อสารเป็นคำ (ตัวพิมพ์ใหญ่, ตัดเครื่องหมาย) เช่น "PEG-40 Castor Oil" → ("PEG", "40", "CASTOR", "OIL")"""
+    return tuple(_TOKEN_RE.findall(text.upper()))
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Damerau-Levenshtein (optimal string alignment) ระหว่าง a กับ b
+    คืน max_distance + 1 ทันทีเมื่อเกิน max_distance แน่นอนแล้ว
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, max_distance):
+    """คำทั้งหมดที่ได้จากการลบตัวอักษรออกไม่เกิน max_distance ตัว (รวมคำเดิม)"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+class SymSpellIndex:
+    """
+    index คำสำหรับหาคำที่ใกล้ที่สุด (edit distance ≤ max_distance)
+
+    เก็บเฉพาะ deletes ของ prefix_length ตัวแรกของคำ (แบบ SymSpell) - index เล็กลงมาก
+    แล้วตรวจระยะจริงของทั้งคำอีกครั้งตอนค้นหา
+    """
+
+    def __init__(self, words, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = dict(words)  # คำ -> จำนวนครั้งที่พบในพจนานุกรม (ใช้ตัดสินเมื่อระยะเท่ากัน)
+        self._deletes = {}
+        for word in self.words:
+            for variant in _deletes(word[:prefix_length], max_distance):
+                self._deletes.setdefault(variant, []).append(word)
+
+    def lookup(self, term, max_distance=None):
+        """คำในพจนานุกรมที่ห่างจาก term ไม่เกิน max_distance: [(คำ, ระยะ), ...] เรียงจากใกล้สุด"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if term in self.words:
+            if max_distance == 0:
+                return [(term, 0)]
+        elif max_distance == 0:
+            return []
+
+        found = {}
+        for variant in _deletes(term[:self.prefix_length], max_distance):
+            for word in self._deletes.get(variant, ()):
+                if word not in found:
+                    found[word] = edit_distance(term, word, max_distance)
+
+        matches = [(word, d) for word, d in found.items() if d <= max_distance]
+        matches.sort(key=lambda item: (item[1], -self.words[item[0]], item[0]))
+        return matches
+
+
+def load_names(path=None):
+    """โหลดรายชื่อ INCI (1 ชื่อต่อบรรทัด, บรรทัดที่ขึ้นต้นด้วย # เป็นคำอธิบาย)"""
+    path = path or config.INCI_NAMES_PATH
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+class INCINormalizer:
+    """
+    แก้ชื่อสารจาก OCR ให้ตรงกับชื่อในพจนานุกรม INCI
+
+    normalize(ชื่อจาก OCR) คืน {"original", "corrected", "confidence", "distance"}
+    หรือ None ถ้าแก้ไม่ได้อย่างมั่นใจ (ให้ LLM ทำต่อ)
+    """
+
+    def __init__(self, names, max_distance=2, max_error_rate=0.2):
+        self.max_error_rate = max_error_rate
+        self.names = {}      # คำของชื่อ (tuple) -> ชื่อเต็ม
+        self.prefixes = {}   # คำต้นของชื่อ (tuple) -> จำนวนชื่อที่ขึ้นต้นแบบนี้
+        self.compact = {}    # ชื่อที่ตัดช่องว่างออก -> คำของชื่อ (OCR มักอ่านช่องว่างหาย/เกิน)
+        counts = {}
+        for name in names:
+            tokens = tokenize(name)
+            if not tokens or tokens in self.names:
+                continue
+            self.names[tokens] = " ".join(name.upper().split())
+            self.compact.setdefault("".join(tokens), tokens)
+            for i in range(1, len(tokens) + 1):
+                self.prefixes[tokens[:i]] = self.prefixes.get(tokens[:i], 0) + 1
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+
+        # ตัวเลข (เช่น 40 ใน PEG-40) ต้องตรงเป๊ะ - index เฉพาะคำที่มีตัวอักษร
+        self.index = SymSpellIndex(
+            {w: n for w, n in counts.items() if not w.isdigit()}, max_distance=max_distance
+        )
+        self.vocabulary = counts
+
+    def _word_candidates(self, word):
+        """คำในพจนานุกรมที่ word น่าจะเป็น: [(คำ, ระยะ), ...]"""
+        if word in self.vocabulary:
+            return [(word, 0)]
+
+        # ตัวเลขปนตัวอักษร: ลองแปลงตัวที่ OCR อ่านสลับกัน (0id → OID, 4O → 40)
+        variants = {word}
+        if any(ch.isdigit() for ch in word):
+            variants.add(word.translate(_DIGIT_TO_LETTER))
+            variants.add(word.translate(_LETTER_TO_DIGIT))
+
+        best = {}
+        for variant in variants:
+            if variant.isdigit():
+                if variant in self.vocabulary:
+                    best[variant] = 1
+                continue
+            allowed = 1 if len(variant) <= 2 else self.index.max_distance
+            for candidate, d in self.index.lookup(variant, allowed):
+                # การแปลงตัวเลข→ตัวอักษรนับเป็นการแก้ 1 ครั้ง
+                d = max(d, 1) if variant != word else d
+                if d < best.get(candidate, d + 1):
+                    best[candidate] = d
+        ranked = sorted(best.items(), key=lambda item: (item[1], -self.vocabulary[item[0]]))
+        return ranked[:_CANDIDATES_PER_WORD]
+
+    def _best_phrase(self, words):
+        """
+        ประกอบคำที่แก้แล้วเป็นวลีที่มีในพจนานุกรม (ตัดทิ้งทันทีเมื่อส่วนต้นไม่ตรงกับชื่อใดเลย)
+        คืน (คำของวลี, ระยะรวม) ที่ระยะรวมน้อยที่สุด หรือ None
+        """
+        candidates = [self._word_candidates(word) for word in words]
+        if not all(candidates):
+            return None
+
+        best = None
+        stack = [((), 0)]
+        while stack:
+            prefix, distance = stack.pop()
+            if best is not None and distance > best[1]:
+                continue
+            i = len(prefix)
+            if i == len(words):
+                exact = prefix in self.names
+                rank = (distance, not exact)
+                if best is None or rank < best[2]:
+                    best = (prefix, distance, rank)
+                continue
+            for candidate, d in candidates[i]:
+                extended = prefix + (candidate,)
+                if extended in self.prefixes:
+                    stack.append((extended, distance + d))
+        return best and best[:2]
+
+    def normalize(self, text):
+        words = tokenize(text)
+        if not words:
+            return None
+
+        found = self._best_phrase(words)
+        if found is None:
+            # คำติดกัน/แยกผิดที่ เช่น "SODIUMHYALURONATE" หรือ "HYALU RONIC ACID"
+            tokens = self.compact.get("".join(words))
+            if tokens is None:
+                return None
+            found = (tokens, 1)
+
+        tokens, distance = found
+        exact = tokens in self.names
+        # ส่วนต้นของชื่อที่มีคำเดียว (เช่น "SODIUM") ยังไม่พอจะบอกว่าเป็นสารอะไร
+        if not exact and len(tokens) < 2:
+            return None
+
+        length = sum(len(w) for w in words)
+        if distance > max(1, length * self.max_error_rate):
+            return None
+
+        return {
+            "original": text,
+            "corrected": self.names[tokens] if exact else " ".join(tokens),
+            "confidence": "สูง",
+            "distance": distance
+        }
+
+
+class _NormalizerStats:
+    """สถิติรวมของ process (แสดงใน /metrics)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def record(self, lookups, hits, seconds):
+        with self._lock:
+            self.lookups += lookups
+            self.hits += hits
+            self.seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "avg_lookup_ms": round(1000 * self.seconds / self.lookups, 3) if self.lookups else 0.0
+            }
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+_stats = _NormalizerStats()
+
+
+def get_normalizer():
+    """INCINormalizer ที่ใช้ร่วมกันทั้ง process (โหลดพจนานุกรมและสร้าง index ครั้งเดียว)"""
+    global _normalizer
+    with _normalizer_lock:
+        if _normalizer is None:
+            start = time.perf_counter()
+            names = load_names()
+            _normalizer = INCINormalizer(names, max_distance=config.INCI_MAX_EDIT_DISTANCE)
+            print(f"📖 โหลดพจนานุกรม INCI {len(_normalizer.names)} ชื่อ "
+                  f"({time.perf_counter() - start:.2f}s)")
+        return _normalizer
+
+
+def normalize_with_dictionary(ingredient_list):
+    """
+    แก้ชื่อสารด้วยพจนานุกรม INCI
+
+    Returns:
+        {ชื่อเดิม: ผลลัพธ์} เฉพาะสารที่แก้ได้อย่างมั่นใจ (รูปแบบเดียวกับ normalize_ingredients)
+    """
+    if not config.INCI_NORMALIZE or not ingredient_list:
+        return {}
+
+    normalizer = get_normalizer()
+    start = time.perf_counter()
+    resolved = {}
+    for ing in ingredient_list:
+        result = normalizer.normalize(ing)
+        if result is not None:
+            resolved[ing] = result
+    _stats.record(len(ingredient_list), len(resolved), time.perf_counter() - start)
+    return resolved
+
+
+def stats():
+    return _stats.snapshot()
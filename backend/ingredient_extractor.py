@@ -1,100 +1,35 @@
 import re
 
+from ocr_rules import CorrectionEngine, keyword_regex, load_rules
+
+# กฎทั้งหมดโหลดจาก data/ocr_rules.json และ compile ครั้งเดียวตอน import
+_RULES = load_rules()
+
+# แก้คำที่ OCR อ่านผิดบ่อย / ลบขยะ
+OCR_FIXES = CorrectionEngine.from_rules(_RULES["ocr_fixes"])
+
+# รวมคำที่ถูกตัดบรรทัด, ชื่อสารที่ถูกแยก และอักษรไทยที่แยกช่องว่าง
+TEXT_JOINS = CorrectionEngine.from_rules(_RULES["joins"])
+
 def fix_common_ocr_errors(text: str) -> str:
-    """แก้ไขข้อผิดพลาดทั่วไปจาก OCR"""
-    
-    # แก้คำที่ OCR อ่านผิดบ่อย - ทำก่อนทุกอย่าง
-    replacements = {
-        # ACID ที่ถูกอ่านผิด
-        r'\bpid\b': 'ACID',
-        r'\b0\s*ได\s*acid\b': 'SALICYLIC ACID',
-        r'\b0\s*ได\b': 'SALICYLIC',
-        r'\'Acid\b': 'ACID',  # 'Acid → ACID
-        
-        # GLYCOL ที่ถูกอ่านผิด
-        r'\bwool\b': 'GLYCOL',
-        r'\bCapryly\s+wool\b': 'CAPRYLYL GLYCOL',
-        r'\bCapryly\b': 'CAPRYLYL',
-        
-        # LEAF ที่ถูกอ่านผิด
-        r'\bleal\b': 'LEAF',
-        r'\bLeaf\s+leal\b': 'LEAF',
-        
-        # EXTRACT ที่ถูกอ่านผิด
-        r'\bwer\s+Extract\b': 'EXTRACT',
-        r'\bwer\b(?=\s*,|\s*\.)': 'EXTRACT',
-        
-        # ชื่อสารที่อ่านผิด
-        r'\bexyiglycerin\b': 'ETHYLHEXYLGLYCERIN',
-        r'\bbirlower\b': 'SAFFLOWER',
-        r'\bAlternifolio\b': 'ALTERNIFOLIA',
-        r'\bCentelia\b': 'CENTELLA',
-        r'\bNobili\b': 'NOBILIS',
-        r'\bCameliia\b': 'CAMELLIA',
-        r'\blsomerized\b': 'ISOMERIZED',
-        r'\bPalmitoy\'\b': 'PALMITOYL',
-        
-        # ลบตัวอักษรเดี่ยวที่เป็นขยะ
-        r'\bAi,\s+': '',
-        r'\bM,\s+': '',
-        r'\bq\s+': '',
-        
-        # คำไทยที่ไม่ควรอยู่ในชื่อสาร
-        r'สหกรดตทานทา\s+': '',
-        r'ตร์ญ่\s+': '',
-        r'ไผดิอน\s+\d+': '',
-    }
-    
-    for pattern, replacement in replacements.items():
-        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-    
-    return text
+    """แก้ไขข้อผิดพลาดทั่วไปจาก OCR (ทุกกฎในรอบเดียว)"""
+    return OCR_FIXES.apply(text)
 
 def fix_thai_spaced_text(text: str) -> str:
-    """รวมอักษรไทยที่ถูก OCR แยกด้วยช่องว่าง และจัดการรอยต่อบรรทัด"""
-    
-    # 1. จัดการคำภาษาอังกฤษที่ถูกตัดบรรทัด
-    text = re.sub(r'(\w+)-\s*\n\s*(\w+)', r'\1\2', text)
-    
-    # 2. รวม ACID/GLYCOL ที่ถูกแยก (ต้องทำก่อนการแยก comma)
-    text = re.sub(r'\b(HYALURONIC|SALICYLIC|ASCORBIC|PALMITIC|STEARIC|CITRIC|LACTIC|GLYCOLIC|SAFFLOWER)\s+ACID\b', 
-                  r'\1 ACID', text, flags=re.IGNORECASE)
-    text = re.sub(r'\b(BUTYLENE|PROPYLENE|ETHYLENE|HEXYLENE|CAPRYLYL|DIPROPYLENE)\s+GLYCOL\b', 
-                  r'\1 GLYCOL', text, flags=re.IGNORECASE)
-    
-    # 3. รวมชื่อสารที่มักถูกแยก
-    common_compounds = [
-        (r'\b(MELALEUCA)\s+(ALTERNIFOLIA)\b', r'\1 \2'),
-        (r'\b(TEA)\s+(TREE)\b', r'\1 \2'),
-        (r'\b(SHEA)\s+(BUTTER)\b', r'\1 \2'),
-        (r'\b(ANTHEMIS)\s+(NOBILIS)\b', r'\1 \2'),
-        (r'\b(FUCUS)\s+(VESICULOSUS)\b', r'\1 \2'),
-        (r'\b(CAMELLIA)\s+(SINENSIS)\b', r'\1 \2'),
-    ]
-    
-    for pattern, replacement in common_compounds:
-        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-    
-    # 4. รวมอักษรไทยที่แยกช่องว่าง
-    text = re.sub(r'([ก-๙])\s+(?=[ก-๙])', r'\1', text)
-    
-    return text
+    """รวมอักษรไทยที่ถูก OCR แยกด้วยช่องว่าง และจัดการรอยต่อบรรทัด (ทุกกฎในรอบเดียว)"""
+    return TEXT_JOINS.apply(text)
+
+def correct_ocr_text(text: str) -> str:
+    """แก้ไข OCR errors แล้วรวมข้อความที่ถูกแยก"""
+    return fix_thai_spaced_text(fix_common_ocr_errors(text))
 
 # Stop Words
-STOP_WORDS = [
-    "วิธีใช้", "วิธีการใช้", "คำเตือน", "วิธีเก็บ", "การเก็บรักษา", 
-    "ผลิตโดย", "จัดจำหน่าย", "เลขที่", "BATCH", "LOT", "MFG", "EXP",
-    "บรรจุ", "ราคา", "ขนาด", "ข้อควรระวัง", "ประเภท", 
-    "MADE IN", "DISTRIBUTED", "MANUFACTURED", "IMPORTED",
-    "ระวัง", "ห้าม", "หมายเหตุ", "ห้ามใช้", "หยุดใช้", "ไผดิอน",
-    "DIRECTIONS", "DIRECTION", "HOW TO USE", "USAGE"
-]
+STOP_WORDS = _RULES["stop_words"]
+STOP_WORDS_RE = keyword_regex(STOP_WORDS)
 
 # คำขยะจาก OCR
-JUNK_WORDS = [
-    "wool", "Ai", "pid", "wer", "nr", "a4", "oa", "coe",
-    "rites", "oes", "แฟกซี", "Bae", "Oe", "Se", "Ay", "Yr"
-]
+JUNK_WORDS = _RULES["junk_words"]
+_JUNK_SET = {w.lower() for w in JUNK_WORDS}
 
 def clean_ingredient_text(text: str) -> str:
     """ล้างสัญลักษณ์และช่องว่างขยะ"""
@@ -138,14 +73,12 @@ def is_valid_ingredient(text: str) -> bool:
     
     # กรองคำขยะ
     text_lower = text.lower()
-    for junk in JUNK_WORDS:
-        if text_lower == junk.lower():
-            return False
+    if text_lower in _JUNK_SET:
+        return False
     
     # กรอง Stop Words
-    for stop in STOP_WORDS:
-        if stop.lower() in text_lower:
-            return False
+    if STOP_WORDS_RE.search(text):
+        return False
     
     # ไม่มีอักษรไทยปนอังกฤษ (ยกเว้นในวงเล็บ)
     text_no_paren = text.replace('(', '').replace(')', '')
@@ -196,101 +129,177 @@ def split_merged_ingredients(text: str) -> list:
     
     return result
 
-def extract_ingredients(ocr_text: str):
-    """ดึงส่วนผสมจาก OCR text"""
-    
-    # 1. แก้ไข OCR errors
-    text = fix_common_ocr_errors(ocr_text)
-    
-    # 2. รวมข้อความที่ถูกแยก
-    text = fix_thai_spaced_text(text)
-    
-    # 3. หาจุดเริ่มต้น
+# คำที่บอกจุดเริ่มต้นของรายการส่วนผสม (รวมแบบที่ OCR อ่านผิดบ่อย)
+INGREDIENT_KEYWORDS = [
+    "INGREDIENT", "ส่วนประกอบ", "ส่วนผสม", "สารสำคัญ", 
+    "ดนประกอบ", "สว่นประกอบ", "วนประกอบ"
+]
+
+def find_ingredient_start(text: str) -> int:
+    """ตำแหน่งหลัง keyword ส่วนผสมตัวสุดท้ายในข้อความ (-1 ถ้าไม่พบ)"""
     start_idx = -1
-    ingredient_keywords = [
-        "INGREDIENT", "ส่วนประกอบ", "ส่วนผสม", "สารสำคัญ", 
-        "ดนประกอบ", "สว่นประกอบ", "วนประกอบ"
-    ]
-    
-    for kw in ingredient_keywords:
+    for kw in INGREDIENT_KEYWORDS:
         matches = list(re.finditer(re.escape(kw), text, re.IGNORECASE))
         if matches:
             last_match = matches[-1]
             if last_match.start() > start_idx:
                 start_idx = last_match.end()
+    return start_idx
 
-    if start_idx == -1: 
-        return []
+def has_ingredient_section(ocr_text: str) -> bool:
+    """ข้อความ OCR นี้มี keyword ส่วนผสมหรือไม่ (แก้ OCR errors แบบเดียวกับ extract_ingredients ก่อน)"""
+    return find_ingredient_start(correct_ocr_text(ocr_text)) != -1
 
-    raw_content = text[start_idx:].strip()
-    raw_content = re.sub(r'^[:\s\-]+', '', raw_content)
+# คำต่อท้ายที่มักถูกแยกออกจากชื่อสาร (รวมกลับกับชื่อก่อนหน้า)
+SUFFIX_WORDS = {'EXTRACT', 'ACID', 'GLYCOL', 'OIL', 'BUTTER'}
 
-    # 4. แยกส่วนผสมด้วย comma, semicolon, newline
-    raw_ingredients = re.split(r',(?![^(]*\))|;|\n', raw_content)
+# แยกส่วนผสมด้วย comma (ที่ไม่อยู่ในวงเล็บ), semicolon และ newline
+_ITEM_SPLIT_RE = re.compile(r',(?![^(]*\))|;|\n')
 
-    ingredients = []
-    
-    for ing in raw_ingredients:
-        ing = clean_ingredient_text(ing)
-        if not ing: 
+def iter_corrected_lines(lines):
+    """
+    แก้ OCR errors ทีละบรรทัดจาก iterator ของบรรทัด OCR
+
+    กฎบางข้อรวมคำข้ามบรรทัด (เช่น "HYALU-" + "RONIC", "TEA" + "TREE")
+    จึงรอดูบรรทัดถัดไป 1 บรรทัด: ถ้าแก้รวมกันแล้วบรรทัดถูกรวม จะรอต่อจนกว่าจะแยกกันได้
+    """
+    pending = corrected = None
+    for line in lines:
+        if pending is None:
+            pending, corrected = line, correct_ocr_text(line)
             continue
 
-        # เช็ค Stop Words
-        stop_found = False
-        for stop in STOP_WORDS:
-            if stop.lower() in ing.lower():
-                # เก็บส่วนก่อน Stop Word
-                parts = re.split(stop, ing, flags=re.IGNORECASE)
-                if len(parts) > 0:
-                    clean_part = clean_ingredient_text(parts[0])
-                    if clean_part and is_valid_ingredient(clean_part):
-                        # ลองแยกเผื่อมีหลายส่วนผสมติดกัน
-                        sub_parts = split_merged_ingredients(clean_part)
-                        for sp in sub_parts:
-                            sp_clean = clean_ingredient_text(sp)
-                            if sp_clean and is_valid_ingredient(sp_clean):
-                                ingredients.append(sp_clean)
-                stop_found = True
-                break
-        
-        if stop_found: 
-            break
-        
-        # ตรวจสอบและแยกส่วนผสมที่ติดกัน
-        if is_valid_ingredient(ing):
-            # ลองแยกเผื่อมีหลายส่วนผสมในบรรทัดเดียว
-            sub_parts = split_merged_ingredients(ing)
-            
-            for part in sub_parts:
-                part_clean = clean_ingredient_text(part)
-                if part_clean and is_valid_ingredient(part_clean):
-                    ingredients.append(part_clean)
-
-    # 5. รวมส่วนผสมที่ถูกแยก (EXTRACT, ACID, etc. ที่อยู่คนละบรรทัด)
-    merged = []
-    i = 0
-    
-    while i < len(ingredients):
-        current = ingredients[i]
-        
-        # ถ้าเป็น EXTRACT/ACID/GLYCOL เดี่ยวๆ ให้รวมกับตัวก่อนหน้า
-        if current.upper() in ['EXTRACT', 'ACID', 'GLYCOL', 'OIL', 'BUTTER'] and len(merged) > 0:
-            merged[-1] = f"{merged[-1]} {current}"
-            i += 1
+        corrected_line = correct_ocr_text(line)
+        window = correct_ocr_text(f"{pending}\n{line}")
+        if window.count("\n") > corrected.count("\n") + corrected_line.count("\n"):
+            yield corrected
+            pending, corrected = line, corrected_line
+        else:
+            pending, corrected = f"{pending}\n{line}", window
+
+    if pending is not None:
+        yield corrected
+
+def _valid_parts(text: str):
+    """แยกส่วนผสมที่ติดกันใน 1 ช่อง แล้วคืนเฉพาะส่วนที่เป็นชื่อสารจริง"""
+    for part in split_merged_ingredients(text):
+        part_clean = clean_ingredient_text(part)
+        if part_clean and is_valid_ingredient(part_clean):
+            yield part_clean
+
+def iter_ingredients(lines):
+    """
+    ดึงส่วนผสมแบบ streaming - รับ iterator ของบรรทัด OCR แล้ว yield ชื่อสารทันทีที่ได้ครบ
+
+    เริ่มหลัง keyword ส่วนผสม และจบส่วนนั้นที่ stop word ตัวแรก
+    (ถ้ามี keyword อีกในบรรทัดถัดๆ ไป เช่นฉลาก 2 ภาษา จะดึงส่วนนั้นต่อ ชื่อที่ซ้ำจะไม่ถูก yield ซ้ำ)
+    รอ 1 รายการก่อน yield เพื่อรวมคำต่อท้าย (EXTRACT, ACID, ...) ที่ถูกแยกบรรทัด
+    """
+    in_section = False
+    held = None
+    seen = set()
+
+    def release():
+        key = held.upper()
+        if key not in seen:
+            seen.add(key)
+            return [held]
+        return []
+
+    # 1-2. แก้ไข OCR errors และรวมข้อความที่ถูกแยก
+    for text in iter_corrected_lines(lines):
+        # 3. หาจุดเริ่มต้น (keyword ตัวสุดท้ายในบรรทัด)
+        start_idx = find_ingredient_start(text)
+        if start_idx != -1:
+            if held is not None:
+                yield from release()
+                held = None
+            in_section = True
+            text = text[start_idx:]
+        elif not in_section:
             continue
-        
-        # ถ้าตัวถัดไปเป็น EXTRACT/ACID/GLYCOL ให้รวมกับตัวปัจจุบัน
-        if i + 1 < len(ingredients):
-            next_item = ingredients[i + 1]
-            if next_item.upper() in ['EXTRACT', 'ACID', 'GLYCOL', 'OIL', 'BUTTER']:
-                merged.append(f"{current} {next_item}")
-                i += 2
+
+        # 4. แยกส่วนผสมด้วย comma, semicolon, newline
+        for ing in _ITEM_SPLIT_RE.split(text):
+            ing = clean_ingredient_text(ing)
+            if not ing:
                 continue
-        
-        merged.append(current)
-        i += 1
-    
-    return merged
+
+            # เช็ค Stop Words (หา stop word ตัวแรกในข้อความ) - เก็บส่วนก่อน stop word แล้วจบส่วนนี้
+            stop = STOP_WORDS_RE.search(ing)
+            if stop:
+                ing = clean_ingredient_text(ing[:stop.start()])
+                in_section = False
+
+            if ing and is_valid_ingredient(ing):
+                for part in _valid_parts(ing):
+                    # 5. รวมส่วนผสมที่ถูกแยก (EXTRACT, ACID, etc. ที่อยู่คนละบรรทัด)
+                    if held is not None and part.upper() in SUFFIX_WORDS:
+                        held = f"{held} {part}"
+                        continue
+                    if held is not None:
+                        yield from release()
+                    held = part
+
+            if not in_section:
+                break
+
+        if not in_section and held is not None:
+            yield from release()
+            held = None
+
+    if held is not None:
+        yield from release()
+
+def extract_ingredients(ocr_text: str):
+    """ดึงส่วนผสมจาก OCR text"""
+    return list(iter_ingredients(ocr_text.splitlines()))
+
+def _confidence_tokens(text: str) -> list:
+    return re.findall(r'[A-Z0-9ก-๙]+', text.upper())
+
+def word_confidences(words: list) -> list:
+    """token ตามลำดับที่ OCR อ่าน -> [(token, confidence ของคำที่มี token นั้น)] (ตำแหน่งใน list = ตำแหน่งคำ)"""
+    return [(token, float(word["conf"])) for word in words for token in _confidence_tokens(word["text"])]
+
+def _find_tokens(positions: list, tokens: list, start: int) -> int:
+    """ตำแหน่งแรกตั้งแต่ start ที่ token ใน positions ตรงกับ tokens ติดกันทุกตัว (-1 ถ้าไม่มี)"""
+    for i in range(start, len(positions) - len(tokens) + 1):
+        if all(positions[i + j][0] == token for j, token in enumerate(tokens)):
+            return i
+    return -1
+
+def ingredient_confidences(ingredients: list, words: list) -> list:
+    """
+    confidence ของชื่อสารแต่ละตัว = confidence ต่ำสุดของคำในชื่อ ณ ตำแหน่งที่ชื่อนั้นอยู่ในผล OCR
+
+    ingredients ต้องเรียงตามลำดับในข้อความ (เหมือนที่ iter_ingredients yield) - หาชื่อถัดไปต่อจากชื่อก่อนหน้า
+    จึงไม่ยืม confidence ของคำเดียวกันที่อยู่ที่อื่นในฉลาก (เช่น "0id" ที่ถูกแก้เป็น "ACID" ไม่ได้ค่าของ ACID ตัวจริง)
+    คืน None ถ้าหาคำในชื่อเรียงติดกันในผล OCR ไม่เจอ (ถูกแก้/รวมคำระหว่าง extract) - ถือว่าไม่มั่นใจ
+    """
+    positions = word_confidences(words)
+    cursor = 0
+    confidences = []
+    for ingredient in ingredients:
+        tokens = _confidence_tokens(ingredient)
+        found = _find_tokens(positions, tokens, cursor) if tokens else -1
+        if found == -1:
+            confidences.append(None)
+            continue
+        cursor = found + len(tokens)
+        confidences.append(min(conf for _, conf in positions[found:cursor]))
+    return confidences
+
+def extract_ingredients_with_confidence(ocr_text: str, words: list) -> list:
+    """
+    เหมือน extract_ingredients แต่คืน [{"name", "confidence"}]
+    words: คำจาก OCR พร้อม confidence [{"text", "conf"}] ตามลำดับที่อ่าน
+    """
+    ingredients = extract_ingredients(ocr_text)
+    return [
+        {"name": ing, "confidence": confidence}
+        for ing, confidence in zip(ingredients, ingredient_confidences(ingredients, words))
+    ]
 
 def format_ingredients_output(ingredients: list) -> str:
     """จัดรูปแบบการแสดงผล"""
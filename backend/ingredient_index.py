@@ -0,0 +1,233 @@
+"""
+Trigram inverted index ของชื่อส่วนผสมที่รู้จัก (พจนานุกรม INCI + ALLERGEN_DB + ชื่อจากฉลากที่เคยสแกน)
+
+ชื่อแต่ละชื่อ (ตัวพิมพ์ใหญ่) ได้ id ตามลำดับที่เพิ่ม - postings ของแต่ละ trigram เป็น array('I') ของ id
+(4 bytes ต่อ id และเรียงจากน้อยไปมากเสมอเพราะเพิ่มต่อท้ายได้อย่างเดียว)
+
+ค้นหาสารที่แพ้ 1 ชื่อ: นับ trigram ร่วมกับทุกชื่อในครั้งเดียวด้วย np.bincount ของ postings ของ trigram ในคำค้น
+แล้วกรองด้วยจำนวนขั้นต่ำที่แต่ละเงื่อนไขของ fuzzy_match ต้องการ (q-gram lemma) - ชื่อที่ไม่ผ่านไม่มีทางตรงกันได้
+เหลือรายชื่อสั้นๆ ที่ค่อยตรวจด้วยเงื่อนไขจริง
+
+    index = get_ingredient_index()
+    index.add("NEW INGREDIENT")                    # เพิ่มทีละชื่อได้ตลอด
+    index.lookup("parabens")                       # [(ชื่อ, score, reason), ...] เหมือน fuzzy_match ทุกชื่อ
+"""
+import math
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+
+import config
+from allergen_db import ALLERGEN_DB
+from fuzzy_matcher import COMMON_WORDS, fuzzy_match, singular
+from inci_normalizer import load_names
+
+_Q = 3
+
+# ช่องว่างทุกแบบนับเป็น " " (ความยาวเท่าเดิม - substring/ระยะแก้คำไม่เปลี่ยน)
+_WHITESPACE = {ord(c): " " for c in "\t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003"
+               "\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"}
+
+
+def trigrams(text):
+    """trigram ที่ไม่ซ้ำกันของข้อความ (สั้นกว่า 3 ตัวไม่มี trigram)"""
+    return {text[i:i + _Q] for i in range(len(text) - _Q + 1)}
+
+
+def padded_trigrams(name):
+    """
+    trigram ของ " ชื่อ " - ทุกคำในชื่อมี " คำ " อยู่ในนั้น จึงเทียบระดับคำได้ด้วย
+    (trigram ของชื่อแบบไม่เติมช่องว่างเป็นส่วนหนึ่งของชุดนี้เสมอ)
+    """
+    return trigrams(f" {name.translate(_WHITESPACE)} ")
+
+
+def _min_lcs(length, other, threshold):
+    """ความยาว LCS น้อยที่สุดที่ทำให้ ratio ของ SequenceMatcher >= threshold ได้ (ratio = 2 * จำนวนที่ตรง / ความยาวรวม)"""
+    return np.ceil(threshold * (length + other) / 2 - 1e-9).astype(np.int64)
+
+
+def _similar_bounds(length, others, threshold):
+    """
+    ข้อความยาว length เทียบกับข้อความยาว others (array) ที่คล้ายกัน >= threshold:
+    คืน (feasible, deleted, inserted) - แปลงข้อความหนึ่งเป็นอีกข้อความด้วยการลบ deleted ตัว (ตัวละไม่เกิน 3 trigram)
+    และเพิ่ม inserted ตัว (ตัวละไม่เกิน 2 trigram ที่คร่อมตำแหน่งนั้น) - trigram ที่เหลืออยู่ต้องอยู่ในอีกข้อความ
+    ดังนั้น trigram ร่วม >= grams - 3 * deleted - 2 * inserted
+    """
+    lcs = _min_lcs(length, others, threshold)
+    return lcs <= np.minimum(length, others), length - lcs, others - lcs
+
+
+def _word_bound(grams, length, threshold):
+    """trigram ร่วมขั้นต่ำกับคำใดๆ ที่ยังคล้ายกับคำยาว length (grams trigram) ได้ (ไม่มีคำแบบนั้น = inf)"""
+    others = np.arange(1, int(length * 2 / threshold) + 2)
+    feasible, deleted, inserted = _similar_bounds(length, others, threshold)
+    bounds = grams - 3 * deleted[feasible] - 2 * inserted[feasible]
+    return bounds.min() if bounds.size else math.inf
+
+
+class TrigramIndex:
+    """
+    index ของชื่อส่วนผสม - add() ได้ตลอด (thread-safe), candidates()/lookup() ใช้กับชื่อที่มีอยู่ตอนค้นหา
+
+    max_names: จำนวนชื่อสูงสุด (กันชื่อขยะจาก OCR ทำให้โตไม่จำกัด - เกินแล้ว add ไม่เพิ่ม)
+    """
+
+    def __init__(self, names=(), max_names=None):
+        self.max_names = max_names
+        self._ids = {}
+        self._names = []
+        self._lengths = array('I')
+        self._gram_counts = array('I')     # จำนวน trigram (ไม่ซ้ำ) ของ " ชื่อ "
+        self._inner_counts = array('I')    # จำนวน trigram (ไม่ซ้ำ) ของชื่อ (ไม่เติมช่องว่าง)
+        self._postings = {}                # trigram -> array('I') ของ id
+        self._max_length = 0
+        self._arrays = None                # (จำนวนชื่อ, ความยาว, trigram, trigram ไม่เติมช่องว่าง) แบบ numpy
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name.upper().strip() in self._ids
+
+    def id(self, name):
+        """id ของชื่อ (ตัวพิมพ์ใหญ่) หรือ None"""
+        return self._ids.get(name)
+
+    def name(self, name_id):
+        return self._names[name_id]
+
+    def add(self, name):
+        """เพิ่มชื่อ (ถ้ายังไม่มี) คืน id หรือ None ถ้า index เต็ม"""
+        key = name.upper().strip()
+        with self._lock:
+            name_id = self._ids.get(key)
+            if name_id is not None or not key:
+                return name_id
+            if self.max_names and len(self._names) >= self.max_names:
+                return None
+            name_id = len(self._names)
+            grams = padded_trigrams(key)
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array('I')
+                postings.append(name_id)
+            self._lengths.append(len(key))
+            self._max_length = max(self._max_length, len(key))
+            self._gram_counts.append(len(grams))
+            self._inner_counts.append(len(trigrams(key.translate(_WHITESPACE))))
+            self._names.append(key)
+            self._ids[key] = name_id
+            return name_id
+
+    def _numbers(self, size):
+        """ความยาว/จำนวน trigram ของชื่อ id 0..size-1 เป็น int64 (ต้องถือ lock - คัดลอกใหม่เฉพาะตอนมีชื่อเพิ่ม)"""
+        if self._arrays is None or self._arrays[0] != size:
+            self._arrays = (size,) + tuple(np.array(values, dtype=np.int64)
+                                           for values in (self._lengths, self._gram_counts, self._inner_counts))
+        return self._arrays[1:]
+
+    def _shared(self, grams, size):
+        """จำนวน trigram ร่วม (ไม่ซ้ำ) ของ grams กับชื่อ id 0..size-1 (ต้องถือ lock)"""
+        lists = [np.frombuffer(p, dtype=f"u{p.itemsize}") for p in map(self._postings.get, grams) if p]
+        shared = np.bincount(np.concatenate(lists), minlength=size)[:size] if lists else np.zeros(size, np.int64)
+        del lists  # ปล่อย buffer ของ array ก่อนปล่อย lock (array ที่ถูก export buffer อยู่ append ไม่ได้)
+        return shared
+
+    def candidates(self, allergen, threshold=0.75):
+        """
+        id ของชื่อที่อาจตรงกับ allergen ตาม fuzzy_match(allergen, ชื่อ, threshold) - ชื่ออื่นไม่ตรงแน่นอน
+
+        bound ของแต่ละเงื่อนไข (s = trigram ร่วมระหว่าง " allergen " กับ " ชื่อ "):
+        - substring (1-3.5): ทุก trigram ของส่วนที่อยู่ในอีกชื่อต้องอยู่ในชื่อนั้น
+        - คล้ายกัน (4, 5): q-gram lemma ตาม _similar_bounds (ข้อ 5 เทียบกับ " คำ " ที่อยู่ใน " ชื่อ ")
+        bound ที่ขึ้นกับความยาวชื่ออย่างเดียวคิดเป็นตารางตามความยาวครั้งเดียว แล้วเทียบกับทุกชื่อด้วย index ของตาราง
+        """
+        start = time.perf_counter()
+        name = allergen.upper().strip()
+        words = name.split()
+        specific = ([w for w in dict.fromkeys(words) if w not in COMMON_WORDS]
+                    if len(words) > 1 else [])
+        with self._lock:
+            size = len(self._names)
+            max_length = self._max_length
+            li, ti, inner = self._numbers(size)
+            shared = self._shared(padded_trigrams(name), size)
+            word_shared = [(word, self._shared(padded_trigrams(word), size)) for word in specific]
+
+        if threshold <= 0:
+            ids = np.arange(size)
+        else:
+            never = np.iinfo(np.int64).max
+            la, ta = len(name), len(padded_trigrams(name))
+            lengths = np.arange(max_length + 1)
+            # ขั้นต่ำที่ขึ้นกับความยาวชื่ออย่างเดียว (ตามความยาว)
+            need = np.where((la <= lengths) & (lengths <= 2 * la),                      # เงื่อนไข 1-2
+                            len(trigrams(name.translate(_WHITESPACE))), never)
+            if la >= 5:                                                                 # เงื่อนไข 3.5
+                need = np.minimum(need, len(trigrams(singular(name).translate(_WHITESPACE))))
+            if len(words) == 1 and name not in COMMON_WORDS:                            # เงื่อนไข 5
+                need = np.minimum(need, _word_bound(ta, la, threshold))
+            feasible, deleted, inserted = _similar_bounds(la, lengths, threshold)      # เงื่อนไข 4
+            similar = np.where(feasible, ta - 3 * deleted - 2 * inserted, never)       # ฝั่ง allergen
+            lost = 3 * inserted + 2 * deleted                                           # ฝั่งชื่อ: ti - lost
+            # เทียบกับทุกชื่อ
+            candidate = shared >= need[li]
+            candidate |= (li <= la) & (la <= 2 * li) & (shared >= inner)                # เงื่อนไข 3
+            candidate |= (shared >= similar[li]) & (shared >= ti - lost[li])
+            for word, counts in word_shared:
+                candidate |= counts >= _word_bound(len(padded_trigrams(word)), len(word), threshold)
+            ids = np.flatnonzero(candidate)
+
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += time.perf_counter() - start
+        return ids
+
+    def lookup(self, allergen, threshold=0.75):
+        """[(ชื่อ, score, reason)] ของทุกชื่อใน index ที่ fuzzy_match(allergen, ชื่อ, threshold) ตรงกัน"""
+        found = []
+        for name_id in self.candidates(allergen, threshold).tolist():
+            result = fuzzy_match(allergen, self._names[name_id], threshold)
+            if result["match"]:
+                found.append((self._names[name_id], result["score"], result["reason"]))
+        return found
+
+    def stats(self):
+        with self._lock:
+            postings = sum(len(p) for p in self._postings.values())
+            return {
+                "names": len(self._names),
+                "trigrams": len(self._postings),
+                "postings": postings,
+                "postings_kb": round(postings * self._lengths.itemsize / 1024, 1),
+                "lookups": self.lookups,
+                "avg_lookup_ms": round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else 0.0
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """TrigramIndex ของพจนานุกรม INCI + ALLERGEN_DB (สร้างครั้งเดียวต่อ process)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            start = time.perf_counter()
+            names = list(ALLERGEN_DB)
+            if os.path.exists(config.INCI_NAMES_PATH):
+                names.extend(load_names(config.INCI_NAMES_PATH))
+            _index = TrigramIndex(names, max_names=config.INGREDIENT_INDEX_MAX_NAMES)
+            print(f"📖 สร้าง trigram index {len(_index)} ชื่อ ({time.perf_counter() - start:.2f}s)")
+        return _index
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import time
+import uuid
+
+import config
+
+
+class Job:
+    """งานวิเคราะห์ฉลาก 1 งาน พร้อม event ความคืบหน้าของแต่ละขั้นตอน"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued | running | done | error
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events = []
+        self.result = None
+        self.error = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def add_event(self, stage, data=None):
+        """บันทึก event และปลุก client ที่รอ stream อยู่ (ต้องเรียกใน event loop)"""
+        if self.status == "queued":
+            self.status = "running"
+        self.updated_at = time.time()
+        self.events.append({
+            "id": len(self.events) + 1,
+            "stage": stage,
+            "data": data or {},
+            "time": round(self.updated_at - self.created_at, 3)
+        })
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def finish(self, result):
+        self.result = result
+        self.status = "done"
+        self.add_event("done", result)
+
+    def fail(self, error):
+        self.error = error
+        self.status = "error"
+        self.add_event("error", {"message": error})
+
+    async def wait_for_change(self, timeout):
+        """รอจนมี event ใหม่ คืน False ถ้าหมดเวลา"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "events": self.events,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobStore:
+    """เก็บงานไว้ในหน่วยความจำ งานที่เสร็จแล้วจะถูกลบเมื่อเกิน TTL หรือเกินจำนวนสูงสุด"""
+
+    def __init__(self, ttl=None, max_jobs=None):
+        self.ttl = ttl if ttl is not None else config.JOB_TTL
+        self.max_jobs = max_jobs if max_jobs is not None else config.JOB_MAX
+        self._jobs = {}
+
+    def create(self):
+        self._cleanup()
+        job = Job()
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        self._jobs.pop(job_id, None)
+
+    def _cleanup(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.updated_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        # เกินจำนวนสูงสุด - ลบงานที่เสร็จแล้วที่เก่าที่สุดก่อน
+        if len(self._jobs) >= self.max_jobs:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.finished),
+                key=lambda job: job.updated_at
+            )
+            for job in finished[:len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[job.id]
+
+
+def format_sse(event):
+    """แปลง event เป็นรูปแบบ Server-Sent Events"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['stage']}\ndata: {data}\n\n"
+
+
+async def stream_job_events(job, last_event_id=0, heartbeat=None):
+    """
+    Generator สำหรับ SSE: ส่ง event ที่มีอยู่แล้วก่อน แล้วรอ event ใหม่จนงานเสร็จ
+    ส่ง comment keep-alive เป็นระยะเพื่อไม่ให้ proxy ตัด connection
+    """
+    if heartbeat is None:
+        heartbeat = config.SSE_HEARTBEAT
+    sent = last_event_id
+
+    while True:
+        while sent < len(job.events):
+            yield format_sse(job.events[sent])
+            sent += 1
+
+        if job.finished:
+            return
+
+        if not await job.wait_for_change(heartbeat):
+            yield ": keep-alive\n\n"
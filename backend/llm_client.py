@@ -0,0 +1,314 @@
+"""
+Client สำหรับ LLM server ในเครื่อง (Ollama HTTP API: POST /api/generate)
+
+ใช้ connection แบบ keep-alive ที่เก็บไว้ใน pool ร่วมกันทั้ง process แทนการเรียก `ollama run`
+ทีละครั้ง (ไม่ต้อง fork process / ต่อ server ใหม่ / โหลดโมเดลใหม่ทุก request)
+
+    client = get_client()
+    text = client.generate(prompt)                              # รอคำตอบทั้งหมด
+    data = client.generate(prompt, format=schema)               # บังคับให้ตอบเป็น JSON ตาม schema
+    for token in client.stream(prompt): ...                     # ทีละ token
+    client.generate(prompt, timeout=60, cancel=CancelToken())
+
+ทุก request ขอคำตอบแบบ stream เพื่อให้ตรวจ deadline และการยกเลิกได้ระหว่างที่โมเดลยังตอบอยู่
+(ยกเลิก = ปิด connection ซึ่งทำให้ server หยุด generate)
+"""
+import http.client
+import json
+import queue
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import config
+
+
+class LLMError(Exception):
+    """เรียก LLM server ไม่สำเร็จ"""
+
+
+class LLMTimeout(LLMError):
+    """เกิน deadline ของ request"""
+
+
+class LLMCancelled(LLMError):
+    """ถูกยกเลิกระหว่างรอคำตอบ"""
+
+
+class CancelToken:
+    """
+    ใช้ยกเลิก request ที่กำลังรอคำตอบจาก thread อื่น (เช่น เมื่อ client ตัดการเชื่อมต่อ)
+
+    cancel() ปิด socket ของ request ที่ใช้ token นี้อยู่ทันที - ไม่ต้องรอ token ถัดไปจาก server
+    (ใช้ threading.Event แทนได้ แต่จะตรวจเฉพาะระหว่าง token)
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets = set()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            _shutdown(sock)
+
+    set = cancel
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def _attach(self, sock):
+        with self._lock:
+            self._sockets.add(sock)
+        if self.is_set():
+            _shutdown(sock)
+
+    def _detach(self, sock):
+        with self._lock:
+            self._sockets.discard(sock)
+
+
+def _shutdown(sock):
+    # shutdown ปลุก thread ที่ค้างอยู่ใน recv ได้ (close เฉยๆ ไม่ปลุก)
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+# error ที่เกิดเมื่อ server ปิด connection keep-alive ที่ว่างอยู่ไปแล้ว - ต่อใหม่แล้วส่งซ้ำได้
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class LLMClient:
+    """
+    HTTP client ของ LLM server พร้อม pool ของ connection แบบ keep-alive
+
+    url:        เช่น "http://127.0.0.1:11434"
+    keep_alive: ให้ server เก็บโมเดลไว้ใน memory นานเท่าไรหลัง request (เช่น "30m", -1 = ตลอด)
+    pool_size:  จำนวน connection ว่างสูงสุดที่เก็บไว้ใช้ซ้ำ
+    timeout:    deadline default ต่อ request (วินาที)
+    """
+
+    def __init__(self, url, model, keep_alive="30m", pool_size=4, timeout=300):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.base_path = parts.path.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "connections_opened": 0, "reused": 0,
+                       "timeouts": 0, "cancelled": 0, "errors": 0}
+
+    # ------------------------------------------------------------------ pool
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _acquire(self):
+        """connection ว่างจาก pool (ใช้ล่าสุดก่อน) หรือสร้างใหม่ - คืน (connection, ใช้ซ้ำหรือไม่)"""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._count("connections_opened")
+            return cls(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """ปิด connection ว่างทั้งหมด"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, idle_connections=self._idle.qsize())
+
+    # --------------------------------------------------------------- request
+
+    def _body(self, prompt, model, format, options):
+        body = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive
+        }
+        if format is not None:
+            body["format"] = format
+        if options:
+            body["options"] = options
+        return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def _set_timeout(conn, seconds):
+        conn.timeout = seconds
+        if conn.sock is not None:
+            conn.sock.settimeout(seconds)
+
+    def _send(self, body, deadline, cancel):
+        """ส่ง request แล้วคืน (connection, response) - connection เก่าที่ server ปิดไปแล้วจะต่อใหม่ 1 ครั้ง"""
+        while True:
+            conn, reused = self._acquire()
+            self._set_timeout(conn, max(0.001, deadline - time.monotonic()))
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                if isinstance(cancel, CancelToken):
+                    cancel._attach(conn.sock)
+                conn.request("POST", f"{self.base_path}/api/generate", body,
+                             {"Content-Type": "application/json"})
+                response = conn.getresponse()
+            except _STALE_ERRORS:
+                self._discard(conn, cancel)
+                if reused and not (cancel is not None and cancel.is_set()):
+                    continue
+                raise
+            except BaseException:
+                self._discard(conn, cancel)
+                raise
+            if reused:
+                self._count("reused")
+            return conn, response
+
+    @staticmethod
+    def _discard(conn, cancel):
+        if isinstance(cancel, CancelToken) and conn.sock is not None:
+            cancel._detach(conn.sock)
+        conn.close()
+
+    def stream(self, prompt, model=None, format=None, options=None, timeout=None, deadline=None, cancel=None):
+        """
+        yield ข้อความทีละ token ระหว่างที่โมเดลตอบ
+
+        timeout:  วินาทีนับจากตอนนี้ (default = timeout ของ client)
+        deadline: เวลาสิ้นสุดแบบ time.monotonic() (ใช้แทน timeout เมื่อหลายขั้นตอนแบ่ง budget เดียวกัน)
+        cancel:   CancelToken (หรือ threading.Event) - ยกเลิกแล้วปิด connection และ raise LLMCancelled
+        """
+        if deadline is None:
+            deadline = time.monotonic() + (timeout or self.timeout)
+        self._count("requests")
+        body = self._body(prompt, model, format, options)
+
+        def check():
+            if cancel is not None and cancel.is_set():
+                raise LLMCancelled("ยกเลิกระหว่างรอคำตอบ")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeout("เกินเวลาระหว่างรอคำตอบ")
+            return remaining
+
+        conn = sock = None
+        done = False
+        try:
+            check()
+            conn, response = self._send(body, deadline, cancel)
+            sock = conn.sock
+            if response.status != 200:
+                detail = response.read().decode("utf-8", "replace")[:200]
+                raise LLMError(f"LLM server ตอบ HTTP {response.status}: {detail}")
+
+            while True:
+                self._set_timeout(conn, check())
+                try:
+                    line = response.readline()
+                except socket.timeout:
+                    raise LLMTimeout("เกินเวลาระหว่างรอคำตอบ") from None
+                if not line:
+                    check()  # ถูกยกเลิก (socket ถูก shutdown) หรือ server ปิดเอง
+                    raise LLMError("LLM server ปิด connection ก่อนตอบเสร็จ")
+                if not line.strip():
+                    continue
+
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise LLMError(f"LLM server error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    response.read()  # อ่านให้หมดก่อนคืน connection เข้า pool
+                    done = True
+                    return
+        except LLMTimeout:
+            self._count("timeouts")
+            raise
+        except LLMCancelled:
+            self._count("cancelled")
+            raise
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            if cancel is not None and cancel.is_set():
+                self._count("cancelled")
+                raise LLMCancelled("ยกเลิกระหว่างรอคำตอบ") from None
+            if isinstance(e, socket.timeout):
+                self._count("timeouts")
+                raise LLMTimeout("เกินเวลาระหว่างรอคำตอบ") from None
+            self._count("errors")
+            raise LLMError(f"เรียก LLM server ไม่สำเร็จ: {e}") from e
+        except LLMError:
+            self._count("errors")
+            raise
+        finally:
+            if sock is not None and isinstance(cancel, CancelToken):
+                cancel._detach(sock)
+            if conn is not None:
+                if done and not response.will_close:
+                    self._release(conn)
+                else:
+                    # ยังอ่านไม่จบ (ยกเลิก/เกินเวลา/error) - ปิดทิ้งเพื่อให้ server หยุด generate
+                    conn.close()
+
+    def generate(self, prompt, model=None, format=None, options=None, timeout=None, deadline=None,
+                 cancel=None, on_token=None):
+        """
+        คำตอบทั้งหมดของโมเดล (str) - ถ้าส่ง format (เช่น "json" หรือ JSON schema) คืนค่าที่ parse แล้ว
+        on_token(ข้อความ) ถูกเรียกทุก token ที่ได้รับ
+        """
+        tokens = []
+        for token in self.stream(prompt, model=model, format=format, options=options,
+                                 timeout=timeout, deadline=deadline, cancel=cancel):
+            tokens.append(token)
+            if on_token is not None:
+                on_token(token)
+        text = "".join(tokens)
+        if format is None:
+            return text
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise LLMError(f"LLM ตอบไม่เป็น JSON: {e} ({text[:200]!r})") from e
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """LLMClient ตาม config (สร้างครั้งเดียวต่อ process - connection ใน pool ใช้ร่วมกันทุก thread)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                config.LLM_URL,
+                config.LLM_MODEL,
+                keep_alive=config.LLM_KEEP_ALIVE,
+                pool_size=config.LLM_POOL_SIZE,
+                timeout=config.LLM_TIMEOUT
+            )
+        return _client
@@ -0,0 +1,351 @@
+"""
+ตัวจัดคิวการเรียก LLM (อยู่หน้า llm_client) - 1 ตัวต่อ process
+
+- prompt เดียวกันที่กำลังรอคำตอบอยู่ (เช่นหลายคนสแกนสินค้าเดียวกันพร้อมกัน) เรียก LLM ครั้งเดียว
+  แล้วแบ่งคำตอบให้ทุกคนที่รอ (single-flight - เฉพาะภายใน process เดียวกัน)
+- จำกัดจำนวน generation พร้อมกันไม่เกินที่ server รับได้ (LLM_MAX_CONCURRENT)
+- คิวเรียงตามความสำคัญ: "interactive" (ผู้ใช้รออยู่) ก่อน "background" (งานที่อาจถูกทิ้ง เช่นวิเคราะห์ล่วงหน้า)
+  ก่อน "batch" (precompute_explanations.py)
+
+จำนวน generation และลำดับความสำคัญใช้ร่วมกันทุก process บนเครื่องเดียวกันผ่านไฟล์ lock ใน LLM_SLOTS_DIR
+(worker แบบ ALLERGUARD_EXECUTOR=process และ precompute_explanations.py ที่รันแยก) - ดู SharedSlots
+
+    scheduler = get_scheduler()
+    text = scheduler.generate(prompt, priority="interactive", deadline=...)
+    for token in scheduler.stream(prompt): ...
+"""
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - จำกัดได้เฉพาะภายใน process
+    fcntl = None
+
+import config
+from llm_client import LLMCancelled, LLMTimeout, get_client
+
+# ลำดับความสำคัญ (น้อย = ได้ก่อน)
+PRIORITIES = {"interactive": 0, "background": 1, "batch": 2}
+
+# รอคิวแล้วตรวจการยกเลิกทุกกี่วินาที
+_POLL_SECONDS = 0.5
+
+# ถึงคิวแล้วแต่ช่องที่ใช้ร่วมกับ process อื่นเต็ม - ลองใหม่ทุกกี่วินาที
+_SHARED_POLL_SECONDS = 0.05
+
+
+class SharedSlots:
+    """
+    ช่อง generation ที่ใช้ร่วมกันทุก process ที่ใช้ directory เดียวกัน (flock - process ตายแล้ว lock ถูกปล่อยเอง)
+
+    - slot-<i>.lock (i < max_concurrent): ถือ lock ของไฟล์ไหนอยู่ = กำลัง generate 1 งาน
+    - waiting-<ระดับ>.lock: process ที่มีงานระดับนี้รอคิวอยู่ถือ shared lock ไว้
+      งานระดับที่ต่ำกว่าจะไม่เอาช่องว่างไปตราบที่ยังมีใครถือ lock ของระดับที่สูงกว่า
+
+    flock ผูกกับไฟล์ที่เปิดแต่ละครั้ง - thread ใน process เดียวกันที่เปิดไฟล์แยกกันก็กันกันเองได้
+    ทุก method เรียกภายใต้ lock ของ LLMScheduler
+    """
+
+    def __init__(self, directory, max_concurrent):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_concurrent = max_concurrent
+        self._waiting = {}    # ระดับ -> [จำนวนงานที่รอใน process นี้, fd ที่ถือ shared lock]
+
+    def _open(self, name):
+        return os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT, 0o666)
+
+    def _try_lock(self, name, mode):
+        """fd ที่ได้ lock แล้ว หรือ None ถ้ามีคนถือ lock ที่ขัดกันอยู่"""
+        fd = self._open(name)
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    def enter(self, level):
+        """มีงานระดับ level เข้าคิวใน process นี้"""
+        waiting = self._waiting.setdefault(level, [0, None])
+        if waiting[0] == 0:
+            waiting[1] = self._open(f"waiting-{level}.lock")
+            fcntl.flock(waiting[1], fcntl.LOCK_SH)
+        waiting[0] += 1
+
+    def leave(self, level):
+        waiting = self._waiting[level]
+        waiting[0] -= 1
+        if waiting[0] == 0:
+            os.close(waiting[1])
+            waiting[1] = None
+
+    def higher_waiting(self, level):
+        """มีงานที่สำคัญกว่า level รอคิวอยู่ใน process ใดก็ตาม"""
+        for higher in range(level):
+            fd = self._try_lock(f"waiting-{higher}.lock", fcntl.LOCK_EX)
+            if fd is None:
+                return True
+            os.close(fd)
+        return False
+
+    def acquire(self):
+        """fd ของช่องที่ว่าง (ปล่อยด้วย release) หรือ None ถ้าเต็ม"""
+        for i in range(self.max_concurrent):
+            fd = self._try_lock(f"slot-{i}.lock", fcntl.LOCK_EX)
+            if fd is not None:
+                return fd
+        return None
+
+    @staticmethod
+    def release(fd):
+        os.close(fd)
+
+
+class _ClassStats:
+    """สถิติของ 1 ระดับความสำคัญ"""
+
+    def __init__(self):
+        self.requests = 0
+        self.coalesced = 0
+        self.generated = 0
+        self.errors = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.generation = 0.0
+        self.max_generation = 0.0
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "generated": self.generated,
+            "errors": self.errors,
+            "avg_queue_wait_s": round(self.queue_wait / self.generated, 3) if self.generated else 0.0,
+            "max_queue_wait_s": round(self.max_queue_wait, 3),
+            "avg_generation_s": round(self.generation / self.generated, 3) if self.generated else 0.0,
+            "max_generation_s": round(self.max_generation, 3)
+        }
+
+
+class _Flight:
+    """การเรียก LLM 1 ครั้งที่มีหลายคนรอคำตอบเดียวกัน (priority = ความสำคัญในคิวของคนที่เรียกจริง)"""
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMScheduler:
+    """
+    คิวของ LLMClient
+
+    max_concurrent: จำนวน generation พร้อมกันสูงสุด (ควรเท่ากับ OLLAMA_NUM_PARALLEL ของ server)
+    slots_dir: directory ของ SharedSlots - ใช้ร่วมกับ process อื่นที่ใช้ directory เดียวกัน
+        (None หรือไม่มี fcntl = จำกัดเฉพาะภายใน process นี้)
+    """
+
+    def __init__(self, client, max_concurrent=4, slots_dir=None):
+        self.client = client
+        self.max_concurrent = max(1, max_concurrent)
+        self._shared = SharedSlots(slots_dir, self.max_concurrent) if slots_dir and fcntl is not None else None
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []            # heap ของ (ระดับความสำคัญ, ลำดับที่เข้าคิว)
+        self._sequence = itertools.count()
+        self._flights = {}            # key ของ prompt -> _Flight ที่กำลังรอคำตอบ
+        self._flights_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {name: _ClassStats() for name in PRIORITIES}
+
+    # ----------------------------------------------------------------- queue
+
+    @contextmanager
+    def _slot(self, priority, deadline, cancel):
+        """
+        รอจนได้ช่องว่าง (ตามลำดับความสำคัญ แล้วตามลำดับที่เข้าคิว) - yield เวลาที่รอ (วินาที)
+        มี SharedSlots: ถึงคิวใน process นี้แล้วต้องได้ช่องที่ใช้ร่วมกันด้วย และไม่มีงานที่สำคัญกว่ารอใน process อื่น
+        """
+        ticket = (PRIORITIES[priority], next(self._sequence))
+        start = time.monotonic()
+        shared_slot = None
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            if self._shared is not None:
+                self._shared.enter(ticket[0])
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        raise LLMCancelled("ยกเลิกระหว่างรอคิว LLM")
+                    poll = _POLL_SECONDS
+                    if self._waiting[0] == ticket and self._active < self.max_concurrent:
+                        if self._shared is None:
+                            break
+                        if not self._shared.higher_waiting(ticket[0]):
+                            shared_slot = self._shared.acquire()
+                            if shared_slot is not None:
+                                break
+                        poll = _SHARED_POLL_SECONDS
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMTimeout("เกินเวลาระหว่างรอคิว LLM")
+                    self._cond.wait(min(remaining, poll))
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            finally:
+                if self._shared is not None:
+                    self._shared.leave(ticket[0])
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._cond.notify_all()  # ยังมีช่องว่าง - คิวถัดไปเข้าได้เลย
+        try:
+            yield time.monotonic() - start
+        finally:
+            with self._cond:
+                self._active -= 1
+                if shared_slot is not None:
+                    self._shared.release(shared_slot)
+                self._cond.notify_all()
+
+    def _record(self, priority, **values):
+        with self._stats_lock:
+            stats = self._stats[priority]
+            for name, value in values.items():
+                setattr(stats, name, getattr(stats, name) + value)
+            if "queue_wait" in values:
+                stats.max_queue_wait = max(stats.max_queue_wait, values["queue_wait"])
+            if "generation" in values:
+                stats.max_generation = max(stats.max_generation, values["generation"])
+
+    # --------------------------------------------------------------- request
+
+    @staticmethod
+    def _key(prompt, model, format, options):
+        data = json.dumps([model, prompt, format, options], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _generate(self, priority, prompt, deadline, cancel, **kwargs):
+        with self._slot(priority, deadline, cancel) as waited:
+            start = time.monotonic()
+            try:
+                return self.client.generate(prompt, deadline=deadline, cancel=cancel, **kwargs)
+            except Exception:
+                self._record(priority, errors=1)
+                raise
+            finally:
+                self._record(priority, generated=1, queue_wait=waited, generation=time.monotonic() - start)
+
+    def generate(self, prompt, priority="interactive", model=None, format=None, options=None, timeout=None,
+                 deadline=None, cancel=None, on_token=None):
+        """
+        เหมือน LLMClient.generate แต่ผ่านคิว - prompt (และ model/format/options) เดียวกันที่กำลังรอคำตอบอยู่
+        จะรอคำตอบเดียวกันแทนการเรียกซ้ำ (ยกเว้นส่ง on_token ซึ่งต้องได้ token ของตัวเอง)
+        รอเฉพาะคนที่เรียกด้วย priority เท่ากันหรือสำคัญกว่า - request ที่สำคัญกว่าไม่ต้องรอคิวของงาน background
+        แต่เรียกเองและกลายเป็นคนที่ request ถัดๆ ไปรอแทน
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority ต้องเป็น {', '.join(PRIORITIES)}")
+        if deadline is None:
+            deadline = time.monotonic() + (timeout or self.client.timeout)
+        kwargs = {"model": model, "format": format, "options": options}
+        self._record(priority, requests=1)
+
+        if on_token is not None:
+            return self._generate(priority, prompt, deadline, cancel, on_token=on_token, **kwargs)
+
+        key = self._key(prompt, model, format, options)
+        while True:
+            with self._flights_lock:
+                flight = self._flights.get(key)
+                leader = flight is None or PRIORITIES[flight.priority] > PRIORITIES[priority]
+                if leader:
+                    flight = self._flights[key] = _Flight(priority)
+
+            if leader:
+                try:
+                    flight.result = self._generate(priority, prompt, deadline, cancel, **kwargs)
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self._flights_lock:
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                    flight.done.set()
+                return flight.result
+
+            self._record(priority, coalesced=1)
+            while not flight.done.wait(min(max(deadline - time.monotonic(), 0), _POLL_SECONDS)):
+                if cancel is not None and cancel.is_set():
+                    raise LLMCancelled("ยกเลิกระหว่างรอคำตอบ")
+                if time.monotonic() >= deadline:
+                    raise LLMTimeout("เกินเวลาระหว่างรอคำตอบ")
+
+            if flight.error is None:
+                return copy.deepcopy(flight.result)
+            # คนที่เรียกจริงหมดเวลา/ยกเลิกไปก่อน แต่คนนี้ยังมีเวลา - เรียกใหม่เอง
+            if (isinstance(flight.error, (LLMTimeout, LLMCancelled)) and time.monotonic() < deadline
+                    and not (cancel is not None and cancel.is_set())):
+                continue
+            raise flight.error
+
+    def stream(self, prompt, priority="interactive", timeout=None, deadline=None, cancel=None, **kwargs):
+        """เหมือน LLMClient.stream แต่รอคิวก่อน (ไม่รวม request ที่ซ้ำกัน - แต่ละคนต้องได้ token ของตัวเอง)"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority ต้องเป็น {', '.join(PRIORITIES)}")
+        if deadline is None:
+            deadline = time.monotonic() + (timeout or self.client.timeout)
+        self._record(priority, requests=1)
+        with self._slot(priority, deadline, cancel) as waited:
+            start = time.monotonic()
+            try:
+                yield from self.client.stream(prompt, deadline=deadline, cancel=cancel, **kwargs)
+            except Exception:
+                self._record(priority, errors=1)
+                raise
+            finally:
+                self._record(priority, generated=1, queue_wait=waited, generation=time.monotonic() - start)
+
+    def stats(self):
+        with self._cond:
+            active, waiting = self._active, len(self._waiting)
+        with self._stats_lock:
+            classes = {name: stats.snapshot() for name, stats in self._stats.items()}
+        return {
+            "max_concurrent": self.max_concurrent,
+            "shared_slots_dir": self._shared.directory if self._shared is not None else None,
+            "active": active,
+            "queued": waiting,
+            "priorities": classes,
+            "client": self.client.stats()
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    LLMScheduler ตาม config (สร้างครั้งเดียวต่อ process - single-flight อยู่ภายใน process
+    ส่วนจำนวน generation และลำดับความสำคัญใช้ร่วมกับ process อื่นผ่าน LLM_SLOTS_DIR)
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(get_client(), max_concurrent=config.LLM_MAX_CONCURRENT,
+                                      slots_dir=config.LLM_SLOTS_DIR or None)
+        return _scheduler
@@ -0,0 +1,70 @@
+"""
+จัดการ memo ผล normalize ของ LLM (ALLERGUARD_NORMALIZE_MEMO / ALLERGUARD_NORMALIZE_MEMO_PATH)
+
+    python normalize_memo.py stats
+    python normalize_memo.py export memo.json          # ชื่อจาก OCR -> {"corrected", "confidence"}
+    python normalize_memo.py import memo.json          # โหลดกลับ (เช่น ย้ายไปเครื่องใหม่)
+    python normalize_memo.py evict --max-entries 50000 # ลบรายการที่หมดอายุ/ใช้ล่าสุดนานที่สุด
+    python normalize_memo.py clear
+"""
+import argparse
+import json
+
+from ai_normalize import NORMALIZE_MODEL, memo_key
+from result_cache import get_normalize_memo
+
+
+def export_memo(memo, path):
+    """เขียน memo ทั้งหมดเป็น JSON คืนจำนวนรายการ"""
+    entries = {}
+    for key, value in memo.items():
+        model, _, ingredient = key.split(":", 1)[1].partition("|")
+        entries.setdefault(model, {})[ingredient] = value
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    return sum(len(v) for v in entries.values())
+
+
+def import_memo(memo, path):
+    """โหลด JSON จาก export_memo (เฉพาะของโมเดลที่ใช้อยู่) คืนจำนวนรายการ"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f).get(NORMALIZE_MODEL, {})
+    for ingredient, value in entries.items():
+        memo.set(memo_key(ingredient), value)
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AllerGUARD normalize memo")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("export").add_argument("path")
+    sub.add_parser("import").add_argument("path")
+    evict = sub.add_parser("evict")
+    evict.add_argument("--max-entries", type=int, default=None, help="default = ALLERGUARD_NORMALIZE_MEMO_MAX_ENTRIES")
+    sub.add_parser("clear")
+    args = parser.parse_args()
+
+    memo = get_normalize_memo()
+    if not hasattr(memo, "items"):
+        print("❌ ปิด memo อยู่ (ALLERGUARD_NORMALIZE_MEMO=off)")
+        return
+
+    if args.command == "stats":
+        print(f"📦 memo ({memo.backend}): {len(memo)} รายการ")
+    elif args.command == "export":
+        print(f"✅ export {export_memo(memo, args.path)} รายการ → {args.path}")
+    elif args.command == "import":
+        print(f"✅ import {import_memo(memo, args.path)} รายการ จาก {args.path}")
+    elif args.command == "evict":
+        before = len(memo)
+        if hasattr(memo, "evict"):
+            memo.evict(args.max_entries)
+        print(f"🧹 ลบ {before - len(memo)} รายการ (เหลือ {len(memo)})")
+    elif args.command == "clear":
+        memo.clear()
+        print("🧹 ล้าง memo แล้ว")
+
+
+if __name__ == "__main__":
+    main()
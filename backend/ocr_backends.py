@@ -0,0 +1,173 @@
+import threading
+
+import config
+import ocr_tess_test
+from ingredient_extractor import extract_ingredients
+
+# ชื่อ backend -> class (เพิ่ม backend ใหม่ด้วย @register_backend("ชื่อ"))
+OCR_BACKENDS = {}
+
+# instance ที่สร้างแล้วใน process นี้ (สร้างครั้งเดียว ใช้ซ้ำทุก request)
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_backend(name):
+    def decorator(cls):
+        cls.name = name
+        OCR_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+class OCRBackend:
+    """
+    Interface ของ OCR backend
+
+    recognize(image) รับ array (BGR), path หรือ bytes ของภาพ แล้วคืน:
+        {"text": "ข้อความดิบ", "confidence": 0-100 หรือ None, "backend": "ชื่อ backend",
+         "words": [{"text": "คำ", "conf": 0-100}, ...],
+         "info": {...ข้อมูลเพิ่มเติมของ backend เช่น scale ที่ใช้...}}
+
+    recognize_iter(image, info) yield ผลทีละส่วน (บรรทัด/แถบ) {"text", "words"}
+    ให้ดึงส่วนผสมได้ระหว่างที่ยัง OCR ส่วนที่เหลืออยู่ - ค่า default yield ผลของ recognize ทีเดียว
+    """
+
+    name = ""
+
+    def warm_up(self):
+        """โหลดโมเดลล่วงหน้า (เรียกตอน worker เริ่มทำงาน)"""
+
+    def recognize(self, image):
+        raise NotImplementedError
+
+    def recognize_iter(self, image, info=None):
+        result = self.recognize(image)
+        if info is not None:
+            info.update(result.get("info", {}), backend=result["backend"])
+        yield {"text": result["text"], "words": result.get("words", [])}
+
+
+@register_backend("tesseract")
+class TesseractBackend(OCRBackend):
+    """Tesseract (ocr_tess_test) - engine/โหมดตาม ALLERGUARD_OCR_ENGINE / ALLERGUARD_OCR_MODE"""
+
+    def warm_up(self):
+        # tesserocr handle แยกต่อ thread - warm_up ถูกเรียกในแต่ละ worker thread
+        ocr_tess_test.warm_up()
+
+    def recognize(self, image):
+        info = {}
+        texts, words = [], []
+        for chunk in self.recognize_iter(image, info):
+            texts.append(chunk["text"])
+            words.extend(chunk["words"])
+
+        confidences = [w["conf"] for w in words]
+        return {
+            "text": "\n".join(texts).strip(),
+            "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+            "backend": self.name,
+            "words": words,
+            "info": info
+        }
+
+    def recognize_iter(self, image, info=None):
+        if info is not None:
+            info["backend"] = self.name
+        for line in ocr_tess_test.iter_ocr_lines(image, info=info):
+            yield {
+                "text": line["text"],
+                "words": [{"text": word["text"], "conf": word["conf"]} for word in line["words"]]
+            }
+
+
+@register_backend("easyocr")
+class EasyOCRBackend(OCRBackend):
+    """EasyOCR (en + th) - โหลดโมเดลครั้งเดียวต่อ process"""
+
+    def __init__(self):
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _get_reader(self):
+        with self._lock:
+            if self._reader is None:
+                import easyocr
+                self._reader = easyocr.Reader(['en', 'th'], gpu=config.EASYOCR_GPU)
+                print("🔥 โหลด EasyOCR แล้ว")
+            return self._reader
+
+    def warm_up(self):
+        self._get_reader()
+
+    def recognize(self, image):
+        reader = self._get_reader()
+        with self._lock:
+            result = reader.readtext(image)
+
+        texts = [r[1] for r in result]  # เอาเฉพาะข้อความ
+        confidences = [r[2] for r in result]
+        return {
+            "text": "\n".join(texts),
+            "confidence": 100 * sum(confidences) / len(confidences) if confidences else 0.0,
+            "backend": self.name,
+            "words": [{"text": text, "conf": 100 * conf} for text, conf in zip(texts, confidences)],
+            "info": {}
+        }
+
+
+@register_backend("ensemble")
+class EnsembleBackend(OCRBackend):
+    """
+    รัน backend เร็วก่อน แล้วรัน backend ช้าเฉพาะเมื่อผลไม่ดีพอ
+    (ดึงส่วนผสมได้น้อยกว่าเกณฑ์ หรือ confidence ต่ำกว่าเกณฑ์)
+    """
+
+    def __init__(self):
+        self.fast = get_backend(config.OCR_ENSEMBLE_FAST)
+        self.slow = get_backend(config.OCR_ENSEMBLE_SLOW)
+
+    def warm_up(self):
+        self.fast.warm_up()
+        self.slow.warm_up()
+
+    def recognize(self, image):
+        fast = self.fast.recognize(image)
+        fast_count = len(extract_ingredients(fast["text"]))
+        confidence = fast["confidence"]
+
+        good_enough = fast_count >= config.OCR_ENSEMBLE_MIN_INGREDIENTS and (
+            confidence is None or confidence >= config.OCR_ENSEMBLE_MIN_CONFIDENCE
+        )
+        if good_enough:
+            return dict(fast, backend=f"{self.name}:{self.fast.name}")
+
+        print(f"🔁 {self.fast.name} ได้ {fast_count} ส่วนผสม (confidence {confidence}) - ลอง {self.slow.name}")
+        slow = self.slow.recognize(image)
+        slow_count = len(extract_ingredients(slow["text"]))
+
+        best = slow if slow_count >= fast_count else fast
+        return dict(best, backend=f"{self.name}:{best['backend']}")
+
+
+def get_backend(name=None):
+    """OCR backend ตาม config (สร้างครั้งเดียวต่อ process แล้วใช้ซ้ำ)"""
+    name = name or config.OCR_BACKEND
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"❌ ไม่รู้จัก OCR backend '{name}' (มี: {', '.join(OCR_BACKENDS)})")
+
+    # ไม่ถือ lock ระหว่างสร้าง เพราะ ensemble ต้องเรียก get_backend ซ้อน
+    backend = _instances.get(name)
+    if backend is None:
+        created = OCR_BACKENDS[name]()
+        with _instances_lock:
+            backend = _instances.setdefault(name, created)
+    return backend
+
+
+def warm_up():
+    """initializer ของ worker: สร้างและ warm up backend ที่ใช้อยู่"""
+    backend = get_backend()
+    backend.warm_up()
+    print(f"🔥 OCR backend พร้อม: {backend.name}")
@@ -0,0 +1,93 @@
+"""
+Benchmark ความเร็ว OCR ต่อภาพ บน sample_images/
+
+    python ocr_benchmark.py                      # เทียบ pytesseract กับ tesserocr (OCR ทั้งภาพ)
+    python ocr_benchmark.py --modes full two_pass  # เทียบ OCR ทั้งภาพกับแบบ 2 รอบ
+    python ocr_benchmark.py --modes full tiled --strips 4  # เทียบ OCR ทั้งภาพกับแบบแบ่งแถบขนาน
+    python ocr_benchmark.py --repeat 5
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+
+import ocr_tess_test
+from ocr_tess_test import load_image, ocr_image
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample_images")
+
+
+def benchmark_engine(engine, mode, images, repeat, strips=None):
+    """คืนเวลา (วินาที) ต่อภาพ: {ชื่อไฟล์: [เวลาแต่ละรอบ]}"""
+    timings = {}
+    for name, img in images.items():
+        timings[name] = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ocr_image(img, engine=engine, mode=mode, strips=strips)
+            timings[name].append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AllerGUARD OCR benchmark")
+    parser.add_argument("--images", default=SAMPLE_DIR, help="โฟลเดอร์ภาพตัวอย่าง")
+    parser.add_argument("--repeat", type=int, default=3, help="จำนวนรอบต่อภาพ")
+    parser.add_argument("--modes", nargs="+", default=["full"], help="โหมด OCR ที่จะวัด (full, two_pass, tiled)")
+    parser.add_argument("--strips", type=int, default=None, help="จำนวนแถบสำหรับโหมด tiled (default = จำนวน CPU)")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+    if not paths:
+        print(f"❌ ไม่พบภาพใน {args.images}")
+        return
+
+    # decode ล่วงหน้า - วัดเฉพาะ preprocess + OCR
+    images = {os.path.basename(p): load_image(p) for p in paths}
+
+    engines = ["pytesseract"]
+    if ocr_tess_test.tesserocr is not None:
+        # โหลด engine ก่อนจับเวลา (เหมือนตอน server warm up)
+        ocr_tess_test.get_engine()
+        engines.append("tesserocr")
+    else:
+        print("⚠️ ไม่ได้ติดตั้ง tesserocr - วัดเฉพาะ pytesseract\n")
+
+    variants = [(engine, mode) for mode in args.modes for engine in engines]
+    labels = [f"{engine}/{mode}" for engine, mode in variants]
+
+    results = {}
+    for label, (engine, mode) in zip(labels, variants):
+        print(f"⏳ กำลังวัด {label} ({len(images)} ภาพ x {args.repeat} รอบ)...")
+        results[label] = benchmark_engine(engine, mode, images, args.repeat, args.strips)
+
+    width = 45 + 22 * len(labels)
+    print("\n" + "=" * width)
+    header = f"{'ภาพ':<45}" + "".join(f"{label:>22}" for label in labels)
+    print(header)
+    print("=" * width)
+    for name in images:
+        row = f"{name:<45}"
+        for label in labels:
+            row += f"{statistics.median(results[label][name]):>21.2f}s"
+        print(row)
+
+    print("-" * width)
+    medians = {
+        label: statistics.median(t for times in results[label].values() for t in times)
+        for label in labels
+    }
+    row = f"{'median ต่อภาพ':<45}"
+    for label in labels:
+        row += f"{medians[label]:>21.2f}s"
+    print(row)
+
+    baseline = labels[0]
+    for label in labels[1:]:
+        if medians[label] > 0:
+            print(f"🚀 {label} เร็วกว่า {baseline} {medians[baseline] / medians[label]:.2f} เท่า")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import re
+
+import config
+
+
+def trie_pattern(words):
+    """
+    สร้าง regex (ไม่มี group) ที่ match คำใดก็ได้ใน words จาก trie ของตัวอักษร
+
+    regex แบบ trie ไม่ต้องลองทีละคำที่แต่ละตำแหน่ง - เวลาแทบไม่เพิ่มตามจำนวนคำ
+    (เช่น ["acid", "acetate"] → "ac(?:etate|id)")
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        is_end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        alternation = "(?:" + "|".join(branches) + ")"
+        return alternation + "?" if is_end else alternation
+
+    return build(trie)
+
+
+def keyword_regex(keywords):
+    """regex ที่หาคำใน keywords ตำแหน่งแรกสุดในข้อความ (ไม่สนตัวพิมพ์, เป็นส่วนหนึ่งของคำก็ได้)"""
+    keywords = {k.lower() for k in keywords if k}
+    if not keywords:
+        return re.compile(r"(?!)")
+    return re.compile(trie_pattern(keywords), re.IGNORECASE)
+
+
+def _parse_template(replacement, offset):
+    """แปลง replacement ที่มี \\1, \\2 ให้ชี้ไปที่ group ใน regex รวม (group ของกฎเริ่มที่ offset)"""
+    parts = []
+    for i, piece in enumerate(re.split(r"\\(\d)", replacement)):
+        if i % 2:
+            parts.append(offset + int(piece))
+        elif piece:
+            parts.append(piece)
+    if all(isinstance(p, str) for p in parts):
+        return "".join(parts)
+    return parts
+
+
+def _join_rules(rules):
+    """
+    รวมกฎเป็น alternation เดียวตามลำดับเดิม
+    กฎที่ติดกันและขึ้นต้นด้วย \\b ถูกรวมใต้ \\b ตัวเดียว - ตำแหน่งกลางคำถูกข้ามทันที
+    ไม่ต้องลองทีละกฎ (ข้อความส่วนใหญ่อยู่กลางคำ)
+    """
+    parts = []
+    run = []
+    for word_start, pattern in rules:
+        if word_start:
+            run.append(pattern)
+            continue
+        if run:
+            parts.append(r"\b(?:" + "|".join(run) + ")")
+            run = []
+        parts.append(pattern)
+    if run:
+        parts.append(r"\b(?:" + "|".join(run) + ")")
+    return "|".join(parts)
+
+
+class CorrectionEngine:
+    """
+    แก้ข้อความตามกฎทั้งหมดในรอบเดียว
+
+    กฎทุกข้อถูกรวมเป็น regex เดียว (compile ครั้งเดียว) แล้วไล่ข้อความครั้งเดียว
+    แทนการเรียก re.sub ทีละกฎ
+
+    patterns: [[regex, replacement], ...] - ลองตามลำดับ กฎที่อยู่ก่อนชนะเมื่อเริ่มที่ตำแหน่งเดียวกัน
+              (replacement ใช้ \\1, \\2 อ้างถึง group ของกฎนั้นได้)
+    words:    {"คำผิด": "คำที่ถูก"} - แทนทั้งคำ ไม่สนตัวพิมพ์ (รวมเป็น trie จึงมีได้หลายพันคำ)
+    """
+
+    def __init__(self, patterns=(), words=None):
+        self.words = {k.lower(): v for k, v in (words or {}).items()}
+        self._actions = {}
+        rules = []  # (เริ่มที่ขอบคำหรือไม่, regex ของกฎ)
+        group = 1
+
+        for pattern, replacement in patterns:
+            word_start = pattern.startswith(r"\b")
+            if word_start:
+                pattern = pattern[2:]
+            rules.append((word_start, f"({pattern})"))
+            self._actions[group] = _parse_template(replacement, group)
+            group += 1 + re.compile(pattern).groups
+
+        # กฎแบบ regex อยู่ก่อน เพื่อให้กฎที่เจาะจงกว่า (เช่น "Capryly wool") ชนะคำเดี่ยว
+        self._word_group = None
+        if self.words:
+            rules.append((True, "(" + trie_pattern(self.words) + r")\b"))
+            self._word_group = group
+
+        self.regex = re.compile(_join_rules(rules), re.IGNORECASE) if rules else None
+        self.rule_count = len(self._actions) + len(self.words)
+
+    @classmethod
+    def from_rules(cls, rules):
+        return cls(rules.get("patterns", []), rules.get("words", {}))
+
+    def _replace(self, match):
+        group = match.lastindex
+        if group == self._word_group:
+            return self.words[match.group(group).lower()]
+
+        action = self._actions[group]
+        if isinstance(action, str):
+            return action
+        return "".join(p if isinstance(p, str) else (match.group(p) or "") for p in action)
+
+    def apply(self, text):
+        if self.regex is None:
+            return text
+        return self.regex.sub(self._replace, text)
+
+
+def load_rules(path=None):
+    """โหลดตารางกฎจากไฟล์ JSON (ALLERGUARD_OCR_RULES)"""
+    path = path or config.OCR_RULES_PATH
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
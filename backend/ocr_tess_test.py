@@ -1,33 +1,612 @@
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
 import cv2
+import numpy as np
 import pytesseract
 
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+import config
+from ingredient_extractor import has_ingredient_section
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# path ของ tesseract ตั้งผ่าน config (ว่าง = หาจาก PATH)
+if config.TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = config.TESSERACT_CMD
+
+OCR_LANG = "eng+tha"
+TESSERACT_CONFIG = r'--oem 3 --psm 4'
+
+# Tesseract API handle แยกต่อ thread (PyTessBaseAPI ใช้ข้าม thread พร้อมกันไม่ได้)
+_engines = threading.local()
+
+# process pool สำหรับ OCR แบบแบ่งแถบ (สร้างเมื่อใช้ครั้งแรก)
+_strip_pool = None
+_strip_pool_lock = threading.Lock()
+
+def load_image(image):
+    """
+    โหลดภาพเป็น array (BGR)
+
+    รับได้ทั้ง path ของไฟล์, bytes ของไฟล์ภาพ (เช่นจาก upload) หรือ array ที่ decode แล้ว
+    """
+    if isinstance(image, np.ndarray):
+        return image
 
-def ocr_image(image_path):
-    img = cv2.imread(image_path)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("❌ ไฟล์ที่อัปโหลดไม่ใช่ภาพ หรือไฟล์เสีย")
+        return img
+
+    img = cv2.imread(str(image))
     if img is None:
         raise ValueError("❌ ไม่พบไฟล์ภาพ หรือ path ผิด")
-    
-    # --- เพิ่มส่วนนี้ ---
-    # ขยายภาพเป็น 2 เท่าเพื่อให้ Tesseract อ่านตัวอักษรเล็กๆ ได้ชัดขึ้น
-    img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    # ------------------
+    return img
+
+
+def get_engine_name(engine=None):
+    """เลือก OCR engine: "tesserocr" (ใช้ handle ค้างไว้ใน process) หรือ "pytesseract" (เรียก CLI ทุกครั้ง)"""
+    engine = engine or config.OCR_ENGINE
+    if engine == "auto":
+        return "tesserocr" if tesserocr is not None else "pytesseract"
+    if engine == "tesserocr" and tesserocr is None:
+        raise RuntimeError("❌ ไม่ได้ติดตั้ง tesserocr (pip install tesserocr)")
+    return engine
+
+
+def get_engine():
+    """
+    Tesseract API ของ thread นี้ - โหลด traineddata (eng+tha) ครั้งเดียวแล้วใช้ซ้ำทุก request
+    ตั้งค่าเหมือน TESSERACT_CONFIG (--oem 3 --psm 4)
+    """
+    api = getattr(_engines, "api", None)
+    if api is None:
+        kwargs = {"path": config.TESSDATA_PATH} if config.TESSDATA_PATH else {}
+        api = tesserocr.PyTessBaseAPI(
+            lang=OCR_LANG,
+            oem=tesserocr.OEM.DEFAULT,          # --oem 3
+            psm=tesserocr.PSM.SINGLE_COLUMN,    # --psm 4
+            **kwargs
+        )
+        _engines.api = api
+    return api
+
+
+def warm_up():
+    """โหลด OCR engine ล่วงหน้า (ใช้เป็น initializer ของ worker) ให้ request แรกไม่ต้องรอโหลดโมเดล"""
+    if get_engine_name() == "tesserocr":
+        get_engine()
+        print("🔥 โหลด Tesseract engine แล้ว")
+
+
+# flag ของ cv2 สำหรับ decode เป็นขาวดำแบบย่อขนาดไปในตัว (JPEG ย่อระหว่าง decode ได้เลย)
+_GRAY_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def load_gray(image, reduce=1):
+    """
+    โหลดภาพเป็นขาวดำ ย่อขนาดลง `reduce` เท่า (1, 2, 4, 8)
+
+    ใช้หน่วยความจำน้อยกว่าโหลดภาพสี 3 channel เต็มขนาดหลายเท่า
+    """
+    if isinstance(image, np.ndarray):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        if reduce > 1:
+            gray = cv2.resize(gray, None, fx=1 / reduce, fy=1 / reduce, interpolation=cv2.INTER_AREA)
+        return gray
+
+    flag = _GRAY_DECODE_FLAGS[reduce]
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        gray = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flag)
+        if gray is None:
+            raise ValueError("❌ ไฟล์ที่อัปโหลดไม่ใช่ภาพ หรือไฟล์เสีย")
+        return gray
+
+    gray = cv2.imread(str(image), flag)
+    if gray is None:
+        raise ValueError("❌ ไม่พบไฟล์ภาพ หรือ path ผิด")
+    return gray
+
+
+def estimate_text_height(gray):
+    """
+    ประมาณความสูงตัวอักษร (pixel) จาก connected components ของภาพขาวดำ
+    คืน None ถ้าพบตัวอักษรน้อยเกินไปที่จะประมาณได้
+    """
+    binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    # ตัวอักษรต้องเป็นส่วนน้อยของภาพ (รองรับฉลากพื้นเข้มตัวหนังสือสว่าง)
+    if np.count_nonzero(binary) > binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+
+    # เก็บเฉพาะ component ที่รูปร่างเหมือนตัวอักษร (ไม่ใช่จุด noise, เส้นขอบ หรือรูปภาพ)
+    is_char = (
+        (heights >= 3) & (heights <= gray.shape[0] * 0.05) &
+        (widths <= heights * 3) & (areas >= 6)
+    )
+    if np.count_nonzero(is_char) < 20:
+        return None
+    return float(np.median(heights[is_char]))
+
+
+def choose_scale(reduced_gray, reduce):
+    """
+    เลือก scale ที่เล็กที่สุดที่ทำให้ตัวอักษรสูงประมาณ OCR_TARGET_TEXT_HEIGHT pixel
+    (ช่วงที่ Tesseract อ่านแม่น) จากภาพที่ย่อมาแล้ว `reduce` เท่า
+
+    Returns:
+        (scale เทียบกับภาพเต็ม, ความสูงตัวอักษรบนภาพเต็ม หรือ None)
+    """
+    if not config.OCR_ADAPTIVE_SCALE:
+        return config.OCR_MAX_SCALE, None
+
+    text_height = estimate_text_height(reduced_gray)
+    if text_height is None:
+        # ประมาณไม่ได้ - ใช้ค่าเดิม (ขยายสูงสุด)
+        return config.OCR_MAX_SCALE, None
+
+    text_height *= reduce
+    scale = config.OCR_TARGET_TEXT_HEIGHT / text_height
+    scale = min(config.OCR_MAX_SCALE, max(config.OCR_MIN_SCALE, scale))
+    return round(scale, 2), text_height
+
+
+def decode_for_scale(image, scale):
+    """decode ภาพขาวดำที่ความละเอียดต่ำที่สุดที่ยังย่อ/ขยายเป็น `scale` ได้โดยไม่เสียรายละเอียด"""
+    reduce = 1
+    for r in (8, 4, 2):
+        if r * scale <= 1:
+            reduce = r
+            break
+    return load_gray(image, reduce), reduce
+
+
+def preprocess(img, scale=2.0):
+    """ย่อ/ขยายภาพตาม scale → ขาวดำ → ลด noise → threshold (Otsu)"""
+    # แปลงเป็นขาวดำก่อนขยาย ใช้หน่วยความจำน้อยกว่าขยายภาพสี 3 เท่า
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+    # ขยายภาพเพื่อให้ Tesseract อ่านตัวอักษรเล็กๆ ได้ชัดขึ้น (ภาพตัวอักษรใหญ่อยู่แล้วจะถูกย่อแทน)
+    if scale != 1:
+        interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     gray = cv2.GaussianBlur(gray, (3,3), 0)
     gray = cv2.threshold(
         gray, 0, 255,
         cv2.THRESH_BINARY + cv2.THRESH_OTSU
     )[1]
+    return gray
+
 
-    custom_config = r'--oem 3 --psm 4'
+def recognize(gray, engine=None):
+    """OCR ภาพที่ preprocess แล้ว (grayscale array) คืนข้อความดิบ"""
+    if get_engine_name(engine) == "tesserocr":
+        gray = np.ascontiguousarray(gray)
+        height, width = gray.shape[:2]
+        api = get_engine()
+        api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+        return api.GetUTF8Text()
 
-    text = pytesseract.image_to_string(
+    return pytesseract.image_to_string(
         gray,
-        lang="eng+tha",
-        config=custom_config
+        lang=OCR_LANG,
+        config=TESSERACT_CONFIG
+    )
+
+
+def recognize_data(gray, engine=None):
+    """
+    OCR แบบได้ตำแหน่งของแต่ละคำ (เหมือน pytesseract.image_to_data)
+
+    Returns:
+        list ของ {"text", "conf", "left", "top", "width", "height", "block", "par", "line"}
+        เรียงตามลำดับการอ่าน
+    """
+    words = []
+
+    if get_engine_name(engine) == "tesserocr":
+        gray = np.ascontiguousarray(gray)
+        height, width = gray.shape[:2]
+        api = get_engine()
+        api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+        api.Recognize()
+
+        RIL = tesserocr.RIL
+        block = par = line = 0
+        for word in tesserocr.iterate_level(api.GetIterator(), RIL.WORD):
+            if word.IsAtBeginningOf(RIL.BLOCK):
+                block += 1
+            if word.IsAtBeginningOf(RIL.PARA):
+                par += 1
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            text = word.GetUTF8Text(RIL.WORD)
+            box = word.BoundingBox(RIL.WORD)
+            if not text or not text.strip() or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            words.append({
+                "text": text.strip(),
+                "conf": float(word.Confidence(RIL.WORD)),
+                "left": x1, "top": y1, "width": x2 - x1, "height": y2 - y1,
+                "block": block, "par": par, "line": line
+            })
+        return words
+
+    data = pytesseract.image_to_data(
+        gray,
+        lang=OCR_LANG,
+        config=TESSERACT_CONFIG,
+        output_type=pytesseract.Output.DICT
+    )
+    for i, text in enumerate(data["text"]):
+        if not text or not text.strip():
+            continue
+        words.append({
+            "text": text.strip(),
+            "conf": float(data["conf"][i]),
+            "left": data["left"][i], "top": data["top"][i],
+            "width": data["width"][i], "height": data["height"][i],
+            "block": data["block_num"][i], "par": data["par_num"][i], "line": data["line_num"][i]
+        })
+    return words
+
+
+def group_lines(words):
+    """รวมคำเป็นบรรทัด: list ของ {"text", "words", "block", "left", "top", "right", "bottom"}"""
+    lines = []
+    index = {}
+    for word in words:
+        key = (word["block"], word["par"], word["line"])
+        if key not in index:
+            index[key] = len(lines)
+            lines.append({"words": [], "block": word["block"]})
+        lines[index[key]]["words"].append(word)
+
+    for line in lines:
+        ws = line["words"]
+        line["text"] = " ".join(w["text"] for w in ws)
+        line["left"] = min(w["left"] for w in ws)
+        line["top"] = min(w["top"] for w in ws)
+        line["right"] = max(w["left"] + w["width"] for w in ws)
+        line["bottom"] = max(w["top"] + w["height"] for w in ws)
+    return lines
+
+
+def recognize_lines(gray, engine=None):
+    """
+    OCR แบบได้ confidence ของแต่ละคำ (image_to_data) รวมเป็นบรรทัด
+
+    Returns:
+        list ของบรรทัด (ผลของ group_lines) - แต่ละคำใน line["words"] มี "conf" (0-100)
+    """
+    return group_lines(recognize_data(gray, engine))
+
+
+def _recognize_text(gray, engine=None):
+    return recognize(gray, engine).strip()
+
+
+def lines_to_text(lines):
+    """รวมบรรทัดจาก recognize_lines กลับเป็นข้อความ"""
+    return "\n".join(line["text"] for line in lines)
+
+
+def locate_ingredient_region(img, engine=None):
+    """
+    รอบแรก (ความละเอียดต่ำ): หาบรรทัดที่มี keyword ส่วนผสม และกล่องข้อความที่ตามมา
+
+    Returns:
+        (x0, y0, x1, y1) บนภาพที่ส่งเข้ามา หรือ None ถ้าไม่พบ keyword
+    """
+    height, width = img.shape[:2]
+    scale = min(1.0, config.OCR_LOCATE_MAX_SIDE / max(height, width))
+
+    small = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    if scale < 1.0:
+        small = cv2.resize(small, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    small = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+    lines = group_lines(recognize_data(small, engine))
+
+    # ใช้ keyword ตัวสุดท้าย (เหมือน extract_ingredients)
+    keyword_idx = None
+    for i, line in enumerate(lines):
+        if has_ingredient_section(line["text"]):
+            keyword_idx = i
+    if keyword_idx is None:
+        return None
+
+    keyword_line = lines[keyword_idx]
+    line_height = max(1, keyword_line["bottom"] - keyword_line["top"])
+    x0, y0 = keyword_line["left"], keyword_line["top"]
+    x1, y1 = keyword_line["right"], keyword_line["bottom"]
+
+    # ขยายลงไปตามบรรทัดถัดไปที่อยู่ต่อกัน (ช่องว่างไม่เกิน ~2 บรรทัด และซ้อนกันแนวนอน)
+    for line in lines[keyword_idx + 1:]:
+        if line["top"] < y0:
+            continue
+        if line["top"] - y1 > 2 * line_height:
+            break
+        if line["right"] < x0 - 2 * line_height or line["left"] > x1 + 2 * line_height:
+            if line["block"] != keyword_line["block"]:
+                continue
+        x0, x1 = min(x0, line["left"]), max(x1, line["right"])
+        y1 = max(y1, line["bottom"])
+
+    # เผื่อขอบ แล้วแปลงกลับเป็นพิกัดบนภาพเต็ม
+    margin = line_height
+    x0 = max(0, int((x0 - margin) / scale))
+    y0 = max(0, int((y0 - margin) / scale))
+    x1 = min(width, int((x1 + margin) / scale) + 1)
+    y1 = min(height, int((y1 + margin) / scale) + 1)
+    return x0, y0, x1, y1
+
+
+def split_strips(gray, strips, overlap=None):
+    """
+    แบ่งภาพ (ขาวดำ ตัวอักษรสีดำ) เป็นแถบแนวนอนสำหรับ OCR แบบขนาน
+
+    ตัดที่แถวว่าง (ไม่มีตัวอักษร) ที่ใกล้จุดแบ่งเท่าๆ กันที่สุด เพื่อไม่ให้ตัดกลางบรรทัด
+    ถ้าหาแถวว่างไม่เจอ จะตัดตรงจุดแบ่งและให้แถบซ้อนกัน `overlap` pixel
+    (บรรทัดที่ซ้ำกันในส่วนที่ซ้อนจะถูกตัดออกตอนรวมข้อความ)
+
+    Returns:
+        list ของ (y0, y1, overlapped) - overlapped = แถบนี้ซ้อนกับแถบก่อนหน้า
+    """
+    height = gray.shape[0]
+    if overlap is None:
+        overlap = config.OCR_STRIP_OVERLAP
+    strips = max(1, min(strips, height // config.OCR_MIN_STRIP_HEIGHT))
+    if strips == 1:
+        return [(0, height, False)]
+
+    # จำนวน pixel ดำในแต่ละแถว - แถวที่แทบไม่มีเลยคือช่องว่างระหว่างบรรทัด
+    ink = np.count_nonzero(gray < 128, axis=1)
+    blank = ink <= max(1, int(gray.shape[1] * 0.002))
+
+    window = height // (strips * 4)
+    bounds = []
+    prev = 0
+    for k in range(1, strips):
+        target = k * height // strips
+        lo, hi = max(prev + 1, target - window), min(height - 1, target + window)
+        candidates = np.flatnonzero(blank[lo:hi])
+        if len(candidates):
+            cut = lo + int(candidates[np.argmin(np.abs(candidates + lo - target))])
+            bounds.append((prev, cut, 0))
+        else:
+            cut = target
+            bounds.append((prev, cut, overlap))
+        prev = cut
+    bounds.append((prev, height, 0))
+
+    result = []
+    for i, (y0, y1, pad) in enumerate(bounds):
+        prev_pad = bounds[i - 1][2] if i > 0 else 0
+        result.append((max(0, y0 - prev_pad), min(height, y1 + pad), prev_pad > 0))
+    return result
+
+
+def _normalize_line(line):
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def stitch_strips(texts, overlapped=None):
+    """
+    รวมข้อความของแต่ละแถบตามลำดับ
+    ลบบรรทัดที่ซ้ำกันตรงรอยต่อที่แถบซ้อนกัน (overlapped[i] = แถบ i ซ้อนกับแถบก่อนหน้า)
+    """
+    parts = [text.splitlines() for text in texts]
+    return "\n".join(_stitch_lines(parts, overlapped, lambda line: line))
+
+
+def stitch_strip_lines(strip_lines, overlapped=None):
+    """เหมือน stitch_strips แต่รับบรรทัดแบบมี confidence (ผลของ recognize_lines) ของแต่ละแถบ"""
+    return _stitch_lines(strip_lines, overlapped, lambda line: line["text"])
+
+
+def _drop_overlap(lines, new_lines, line_text):
+    """ตัดบรรทัดต้นแถบใหม่ที่ซ้ำกับท้ายข้อความที่รวมไว้แล้ว (lines)"""
+    new_lines = list(new_lines)
+    head = [_normalize_line(line_text(l)) for l in new_lines if line_text(l).strip()][:3]
+    tail = [_normalize_line(line_text(l)) for l in lines if line_text(l).strip()][-3:]
+
+    # หาจำนวนบรรทัดที่ซ้ำมากที่สุด (ท้ายแถบก่อน = ต้นแถบนี้)
+    dup = 0
+    for k in range(min(len(head), len(tail)), 0, -1):
+        if all(
+            SequenceMatcher(None, a, b).ratio() >= 0.9
+            for a, b in zip(tail[-k:], head[:k])
+        ):
+            dup = k
+            break
+
+    # ข้ามบรรทัดที่ซ้ำ (นับเฉพาะบรรทัดที่ไม่ว่าง)
+    skipped = 0
+    while new_lines and skipped < dup:
+        if line_text(new_lines.pop(0)).strip():
+            skipped += 1
+    return new_lines
+
+
+def _stitch_lines(parts, overlapped, line_text):
+    lines = []
+    for i, new_lines in enumerate(parts):
+        if not (overlapped is None or overlapped[i]):
+            lines.extend(new_lines)
+        else:
+            lines.extend(_drop_overlap(lines, new_lines, line_text))
+    return lines
+
+
+def _get_strip_pool():
+    global _strip_pool
+    with _strip_pool_lock:
+        if _strip_pool is None:
+            _strip_pool = ProcessPoolExecutor(
+                max_workers=config.OCR_STRIP_WORKERS or os.cpu_count(),
+                initializer=warm_up
+            )
+        return _strip_pool
+
+
+def _recognize_strip(strip, engine, output="text"):
+    if output == "lines":
+        return recognize_lines(strip, engine)
+    return recognize(strip, engine)
+
+
+def iter_tiled_lines(gray, engine=None, strips=None):
+    """
+    เหมือน recognize_tiled(output="lines") แต่ yield บรรทัดของแต่ละแถบทันทีที่แถบนั้น (และแถบก่อนหน้า) OCR เสร็จ
+    ให้ขั้นตอนถัดไปเริ่มทำงานได้ระหว่างที่ยัง OCR แถบที่เหลืออยู่
+    """
+    strips = strips or config.OCR_STRIPS or os.cpu_count()
+    bounds = split_strips(gray, strips)
+    if len(bounds) == 1:
+        yield from recognize_lines(gray, engine)
+        return
+
+    pool = _get_strip_pool()
+    futures = [
+        pool.submit(_recognize_strip, np.ascontiguousarray(gray[y0:y1]), engine, "lines")
+        for y0, y1, _ in bounds
+    ]
+    lines = []
+    for future, (_, _, overlapped) in zip(futures, bounds):
+        new_lines = future.result()
+        if overlapped:
+            new_lines = _drop_overlap(lines, new_lines, lambda line: line["text"])
+        lines.extend(new_lines)
+        yield from new_lines
+
+
+def recognize_tiled(gray, engine=None, strips=None, output="text"):
+    """OCR ภาพใหญ่แบบแบ่งแถบ แล้ว OCR แต่ละแถบพร้อมกันหลาย core"""
+    strips = strips or config.OCR_STRIPS or os.cpu_count()
+    bounds = split_strips(gray, strips)
+    if len(bounds) == 1:
+        return _recognize_strip(gray, engine, output)
+
+    pool = _get_strip_pool()
+    futures = [
+        pool.submit(_recognize_strip, np.ascontiguousarray(gray[y0:y1]), engine, output)
+        for y0, y1, _ in bounds
+    ]
+    stitch = stitch_strip_lines if output == "lines" else stitch_strips
+    return stitch(
+        [f.result() for f in futures],
+        [overlapped for _, _, overlapped in bounds]
     )
-    return text.strip()
+
+
+def prepare_image(image, info):
+    """
+    decode ภาพสำหรับ OCR
+
+    Returns:
+        (ภาพขาวดำย่อ 2 เท่า, ภาพขาวดำที่ decode สำหรับ OCR, อัตราย่อของภาพนั้น, scale ที่ต้องขยายภาพนั้น)
+    """
+    # ภาพย่อ 2 เท่า (decode แบบย่อในตัว) ใช้ประมาณขนาดตัวอักษร และหาบริเวณส่วนผสม
+    reduced = load_gray(image, 2)
+    scale, text_height = choose_scale(reduced, 2)
+
+    base, reduce = decode_for_scale(image, scale)
+    info.update(
+        scale=scale,
+        text_height=round(text_height, 1) if text_height else None,
+        image_size=[base.shape[1] * reduce, base.shape[0] * reduce]
+    )
+    print(f"🔎 OCR scale {scale}x (ตัวอักษรสูง ~{info['text_height']} px)")
+    return reduced, base, reduce, scale * reduce
+
+
+def iter_ocr_lines(image, engine=None, mode=None, strips=None, info=None):
+    """
+    OCR ภาพฉลากแบบ streaming: yield บรรทัด (พร้อม confidence ของแต่ละคำ) ทีละส่วน
+
+    โหมด "tiled" yield บรรทัดของแต่ละแถบทันทีที่ OCR เสร็จ
+    โหมดอื่น OCR ทีเดียวทั้งภาพ/บริเวณ จึง yield ทุกบรรทัดเมื่อ OCR เสร็จ
+    """
+    mode = mode or config.OCR_MODE
+    if info is None:
+        info = {}
+
+    if mode == "tiled":
+        _, base, _, factor = prepare_image(image, info)
+        yield from iter_tiled_lines(preprocess(base, factor), engine, strips)
+        return
+
+    yield from ocr_image(image, engine, mode, strips, info, output="lines")
+
+
+def ocr_image(image, engine=None, mode=None, strips=None, info=None, output="text"):
+    """
+    OCR ภาพฉลาก - image เป็น path, bytes หรือ array ก็ได้
+
+    ความละเอียดที่ใช้ OCR เลือกจากขนาดตัวอักษรในภาพ (ALLERGUARD_OCR_ADAPTIVE_SCALE)
+    และ decode เป็นขาวดำที่ความละเอียดต่ำสุดที่พอ แทนการขยายภาพสีเต็มขนาด 2 เท่าทุกครั้ง
+
+    mode:
+        "full"     - ขยายและ OCR ทั้งภาพ
+        "two_pass" - หาบริเวณส่วนผสมจากภาพย่อก่อน แล้วขยาย + OCR เฉพาะบริเวณนั้น
+                     (ถ้าหา keyword ไม่เจอ จะ OCR ทั้งภาพแทน)
+        "tiled"    - ขยายทั้งภาพ แล้วแบ่งเป็น `strips` แถบ OCR พร้อมกันหลาย core
+
+    info: dict (ถ้าส่งมา) จะถูกใส่ข้อมูล scale / ความสูงตัวอักษร / ขนาดภาพที่ใช้
+
+    output:
+        "text"  - คืนข้อความดิบ
+        "lines" - คืน list ของบรรทัดพร้อม confidence ของแต่ละคำ (ดู recognize_lines)
+    """
+    mode = mode or config.OCR_MODE
+    if output == "lines":
+        read, as_text = recognize_lines, lines_to_text
+    else:
+        read, as_text = _recognize_text, str
+    if info is None:
+        info = {}
+
+    reduced, base, reduce, factor = prepare_image(image, info)
+
+    if mode == "tiled":
+        result = recognize_tiled(preprocess(base, factor), engine, strips, output)
+        return result.strip() if output == "text" else result
+
+    if mode == "two_pass":
+        region = locate_ingredient_region(reduced, engine)
+        if region is not None:
+            # พิกัดบนภาพย่อ 2 เท่า → พิกัดบนภาพ base
+            x0, y0, x1, y1 = (v * 2 // reduce for v in region)
+            result = read(preprocess(base[y0:y1, x0:x1], factor), engine)
+            if has_ingredient_section(as_text(result)):
+                info["region"] = [x0 * reduce, y0 * reduce, x1 * reduce, y1 * reduce]
+                print(f"✂️ OCR เฉพาะบริเวณส่วนผสม ({x1 - x0}x{y1 - y0} จาก {base.shape[1]}x{base.shape[0]})")
+                return result
+            print("⚠️ OCR บริเวณส่วนผสมไม่พบ keyword - OCR ทั้งภาพแทน")
+        else:
+            print("ℹ️ ไม่พบ keyword ส่วนผสมในรอบแรก - OCR ทั้งภาพ")
+
+    gray = preprocess(base, factor)
+    return read(gray, engine)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,110 @@
-from ocr_tess_test import ocr_image
-from ingredient_extractor import extract_ingredients
-from ai_normalize import normalize_ingredients
-from ai_reasoning import analyze_each_allergen
-from fuzzy_matcher import find_matching_allergens
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-def run_pipeline(image_path, user_allergies=None):
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import config
+from ocr_backends import get_backend
+from ingredient_extractor import iter_ingredients, ingredient_confidences
+from ai_normalize import normalize_low_confidence
+from ai_reasoning import analyze_each_allergen, explanation_name
+from fuzzy_matcher import find_matching_allergens, find_exact_allergens
+from ingredient_index import get_ingredient_index
+from llm_client import CancelToken
+from result_cache import get_cache, NullCache, image_hash, allergy_profile_key
+
+def emit_progress(on_progress, stage, **data):
+    """ส่ง event ความคืบหน้าของแต่ละขั้นตอน (error ใน callback ต้องไม่ทำให้ pipeline ล้ม)"""
+    if on_progress is None:
+        return
+    try:
+        on_progress(stage, data)
+    except Exception as e:
+        print(f"⚠️ ส่ง progress '{stage}' ไม่สำเร็จ: {e}")
+
+
+def image_cache_key(image):
+    """hash ของภาพสำหรับใช้เป็น key ของ cache (None ถ้าอ่านไฟล์ไม่ได้)"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return image_hash(image)
+
+    if isinstance(image, np.ndarray):
+        return image_hash(str(image.shape).encode() + image.tobytes())
+
+    try:
+        with open(image, "rb") as f:
+            return image_hash(f.read())
+    except OSError:
+        return None
+
+
+# อ่าน RSS ระหว่าง request ทุกกี่วินาที
+_MEMORY_SAMPLE_SECONDS = 0.02
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb():
+    """RSS ตอนนี้ของ process นี้ (MB) - รวม buffer ของ Tesseract/OpenCV (None ถ้าวัดไม่ได้)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return None
+
+
+@contextmanager
+def track_peak_memory(metrics):
+    """
+    วัด RSS ของ worker process ระหว่างรัน pipeline (thread อ่าน RSS ทุก _MEMORY_SAMPLE_SECONDS) ใส่ใน metrics:
+    - peak_rss_mb: RSS สูงสุดระหว่าง request นี้
+    - peak_rss_growth_mb: RSS สูงสุดลบ RSS ตอนเริ่ม request
+
+    วัดจาก RSS ปัจจุบัน (ไม่ใช่ high-water mark ทั้งชีวิตของ process) - worker ที่ถูกใช้ซ้ำก็วัดแต่ละ request ได้
+    แต่เป็นค่าของทั้ง process - ตรงกับ request นี้เฉพาะเมื่อ worker process รันทีละ 1 งาน
+    (ALLERGUARD_EXECUTOR=process หรือ PIPELINE_WORKERS=1) และ spike ที่สั้นกว่าช่วงอ่านอาจไม่ถูกนับ
+    """
+    start = current_rss_mb() if config.TRACK_MEMORY else None
+    if start is None:
+        yield
+        return
+
+    peak = start
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(_MEMORY_SAMPLE_SECONDS):
+            peak = max(peak, current_rss_mb())
+
+    sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        done.set()
+        sampler.join()
+        peak = max(peak, current_rss_mb())
+        metrics["peak_rss_mb"] = round(peak, 1)
+        metrics["peak_rss_growth_mb"] = round(peak - start, 1)
+
+
+def run_pipeline(image, user_allergies=None, on_progress=None, time_budget=None):
     """
     Pipeline หลักสำหรับตรวจสอบสารที่แพ้
+
+    image: path ของไฟล์ภาพ, bytes ของไฟล์ภาพ (จาก upload โดยตรง) หรือ array ที่ decode แล้ว
     
     Workflow:
     1️⃣ OCR อ่านภาพ
@@ -14,7 +112,147 @@ def run_pipeline(image_path, user_allergies=None):
     3️⃣ เปรียบเทียบกับสารที่ user แพ้ (ใช้ fuzzy matching)
     4️⃣ ส่งแต่ละสารที่แพ้ให้ AI วิเคราะห์ระดับความเสี่ยง + คำแนะนำ
     5️⃣ รวมผลลัพธ์และส่งกลับไปแสดงบนเว็บ
+
+    on_progress(stage, data): callback ที่ถูกเรียกเมื่อแต่ละขั้นตอนเสร็จ
+    stage = "ingredient" | "exact_match" | "ocr" | "extracted" | "normalized" | "matched" | "analysis"
+    ("ingredient" / "exact_match" ส่งทันทีที่ดึงชื่อสารได้ ระหว่างที่ยัง OCR ส่วนที่เหลืออยู่)
+
+    time_budget: เวลาสูงสุดของ request นี้ (วินาที, default = REQUEST_DEADLINE, 0 = ไม่จำกัด)
+    แต่ละขั้นตอนได้เวลาเท่าที่เหลือ - เหลือไม่พอจะข้าม LLM ของขั้นนั้น และระบุไว้ใน "degraded_stages"
+
+    ผลลัพธ์แต่ละขั้นตอนถูก cache ตาม hash ของภาพ (OCR, ส่วนผสม)
+    และ hash ของภาพ + รายการสารที่แพ้ (ผลวิเคราะห์สุดท้าย)
     """
+    metrics = {}
+    degraded = []
+    started = time.time()
+    if time_budget is None:
+        time_budget = config.REQUEST_DEADLINE
+    deadline = time.monotonic() + time_budget if time_budget else None
+    with track_peak_memory(metrics):
+        result = _run_pipeline(image, user_allergies, on_progress, metrics, deadline, degraded)
+    metrics["total_seconds"] = round(time.time() - started, 2)
+    metrics["time_budget"] = time_budget
+
+    # คัดลอก dict ก่อนใส่ metrics (ผลลัพธ์อาจเป็น object เดียวกับที่อยู่ใน cache)
+    return dict(result, metrics=metrics, degraded_stages=degraded)
+
+
+def remaining_time(deadline):
+    """เวลาที่เหลือก่อน deadline (วินาที) - ไม่มี deadline = ไม่จำกัด"""
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+
+_speculation_pool = None
+_speculation_pool_lock = threading.Lock()
+
+
+def _get_speculation_pool():
+    global _speculation_pool
+    with _speculation_pool_lock:
+        if _speculation_pool is None:
+            # request ละไม่เกิน 1 งาน - เท่าจำนวน worker ของ pipeline ก็พอ
+            _speculation_pool = ThreadPoolExecutor(
+                max_workers=max(1, config.PIPELINE_WORKERS),
+                thread_name_prefix="speculative"
+            )
+        return _speculation_pool
+
+
+class SpeculativeAnalysis:
+    """
+    วิเคราะห์สารที่ชื่อดิบจาก OCR ตรงกับสารที่แพ้อยู่แล้ว ใน thread แยกระหว่างที่ normalize ยังทำงาน
+
+    ผลของแต่ละสารถูกเก็บไว้จนกว่าจะ confirm() ด้วยผล match หลัง normalize
+    (เรียก LLM ด้วย priority "background" - normalize ของ request ต่างๆ ที่ผลขึ้นอยู่กับมันได้คิวก่อน)
+    แล้วส่งเฉพาะสารที่ยังตรงอยู่ - สารที่ normalize แล้วไม่ตรงแล้วถูกทิ้ง
+    """
+
+    def __init__(self, matches, ingredients, emit, deadline, use_llm):
+        self.matches = matches
+        self.names = {explanation_name(m["ingredient"]) for m in matches}
+        self._emit = emit
+        self._lock = threading.Lock()
+        self._pending = []
+        self._confirmed = None
+        self._cancel = CancelToken()
+        self._future = _get_speculation_pool().submit(
+            analyze_each_allergen, ingredients, matches,
+            on_section=self._on_section, deadline=deadline, use_llm=use_llm, cancel=self._cancel,
+            priority="background"
+        )
+
+    def _is_confirmed(self, entry):
+        # ผลของแต่ละสารใช้ชื่อสารตามที่ขอวิเคราะห์ (ทั้งโหมด parallel และ stream) - เทียบชื่อตรงตัวเท่านั้น
+        # (เทียบแบบ substring จะเก็บสารที่ถูกทิ้งไว้ เช่น "BENZOATE" เมื่อ "SODIUM BENZOATE" ยังตรงอยู่)
+        return explanation_name(entry.get("ingredient", "")) in self._confirmed
+
+    def _on_section(self, entry):
+        with self._lock:
+            if self._confirmed is None:
+                self._pending.append(entry)
+                return
+        if self._is_confirmed(entry):
+            self._emit(entry)
+
+    def confirm(self, names):
+        """ระบุสารที่ยังตรงหลัง normalize แล้วส่งผลที่เก็บไว้ของสารเหล่านั้น (ไม่เหลือเลย = ยกเลิกงาน)"""
+        with self._lock:
+            self._confirmed = set(names)
+            pending, self._pending = self._pending, []
+        if not self._confirmed:
+            self._cancel.cancel()
+        for entry in pending:
+            if self._is_confirmed(entry):
+                self._emit(entry)
+
+    def result(self):
+        """ผลวิเคราะห์ (รอจนเสร็จ) เฉพาะสารที่ confirm แล้ว"""
+        analysis = self._future.result()
+        return dict(analysis, analyzed_allergens=[
+            entry for entry in analysis.get("analyzed_allergens", []) if self._is_confirmed(entry)
+        ])
+
+
+def _reconcile_speculation(speculation, normalized_ingredients, matching_allergens, emit_section, deadline,
+                           use_llm):
+    """
+    รวมผลที่เริ่มวิเคราะห์ไว้ก่อน normalize กับ match จริงหลัง normalize
+    - match ที่เดาไว้ถูก: ใช้ผลที่เริ่มไว้ (ไม่ต้องถาม AI ใหม่)
+    - match ที่เพิ่งพบหลัง normalize: วิเคราะห์เพิ่มเฉพาะสารเหล่านั้น
+    - match ที่เดาไว้แต่ normalize แล้วไม่ตรง: ทิ้ง
+    """
+    confirmed = {explanation_name(m["ingredient"]) for m in matching_allergens} & speculation.names
+    new = [m for m in matching_allergens if explanation_name(m["ingredient"]) not in confirmed]
+    speculation.confirm(confirmed)
+    dropped = len(speculation.names) - len(confirmed)
+    print(f"🔁 ใช้ผลที่เริ่มวิเคราะห์ไว้ {len(confirmed)} สาร, ทิ้ง {dropped} สาร, วิเคราะห์เพิ่ม {len(new)} สาร")
+
+    parts = []
+    if new:
+        parts.append(analyze_each_allergen(
+            normalized_ingredients, new, on_section=emit_section, deadline=deadline, use_llm=use_llm
+        ))
+    if confirmed:
+        parts.insert(0, speculation.result())
+
+    stats = {}
+    for part in parts:
+        for key, value in part.get("stats", {}).items():
+            stats[key] = stats.get(key, 0) + value
+    stats.update(speculative=len(confirmed), speculative_dropped=dropped)
+    return {
+        "status": "error" if any(part.get("status") == "error" for part in parts) else "success",
+        "raw_output": "\n\n".join(part["raw_output"] for part in parts if part.get("raw_output")),
+        "analyzed_allergens": [entry for part in parts for entry in part.get("analyzed_allergens", [])],
+        "stats": stats
+    }
+
+
+def _run_pipeline(image, user_allergies, on_progress, metrics, deadline, degraded):
+
+    def emit_section(entry):
+        emit_progress(on_progress, "analysis_partial", allergen=entry)
     
     if user_allergies is None:
         user_allergies = []
@@ -23,13 +261,63 @@ def run_pipeline(image_path, user_allergies=None):
     print("🚀 เริ่มต้น AllerGUARD Pipeline")
     print("="*70)
 
+    image_key = image_cache_key(image)
+    cache = get_cache() if image_key else NullCache()
+    result_key = f"result:{image_key}:{allergy_profile_key(user_allergies)}"
+
+    # สแกนภาพเดิมด้วยรายการสารที่แพ้เดิม - ใช้ผลลัพธ์เดิมได้ทันที
+    cached_result = cache.get(result_key)
+    if cached_result is not None:
+        print("⚡ พบผลลัพธ์ใน cache")
+        emit_progress(on_progress, "normalized", ingredients=cached_result["cleaned_ingredients"], cached=True)
+        return cached_result
+
     # =========================================================================
     # 1️⃣ OCR อ่านภาพ
     # =========================================================================
     print("\n📸 STEP 1: OCR อ่านภาพ...")
+    cached_ocr = cache.get(f"ocr:{image_key}")
+    ocr_info = {}
+    if isinstance(cached_ocr, dict):
+        print("⚡ ใช้ผล OCR จาก cache")
+        ocr_chunks = [cached_ocr]
+    else:
+        # decode ในหน่วยความจำ ไม่ต้องเขียนไฟล์ชั่วคราว (backend เลือกความละเอียดที่ decode เอง)
+        ocr_chunks = get_backend().recognize_iter(image, ocr_info)
+
+    ocr_lines, ocr_words = [], []
+
+    def stream_ocr_lines():
+        for chunk in ocr_chunks:
+            ocr_words.extend(chunk["words"])
+            for line in chunk["text"].splitlines():
+                ocr_lines.append(line)
+                yield line
+
+    # ดึงส่วนผสมระหว่างที่ยัง OCR ส่วนที่เหลืออยู่ และแจ้งสารที่แพ้ที่ตรงแน่นอนได้ทันที
+    ingredients = []
     try:
-        raw_text = ocr_image(image_path)
+        lines = stream_ocr_lines()
+        for ingredient in iter_ingredients(lines):
+            ingredients.append(ingredient)
+            emit_progress(on_progress, "ingredient", name=ingredient)
+            for match in find_exact_allergens(user_allergies, ingredient):
+                print(f"⚡ พบ '{match['allergen']}' ใน '{ingredient}' ระหว่าง OCR")
+                emit_progress(on_progress, "exact_match", **match)
+        for _ in lines:  # OCR ส่วนที่เหลือหลังจบรายการส่วนผสม (เก็บไว้ใน cache)
+            pass
+
+        raw_text = "\n".join(ocr_lines).strip()
+        if not isinstance(cached_ocr, dict):
+            confidences = [w["conf"] for w in ocr_words]
+            metrics["ocr"] = dict(
+                ocr_info,
+                confidence=sum(confidences) / len(confidences) if confidences else None
+            )
+            print(f"🔤 OCR backend: {ocr_info.get('backend')}")
+            cache.set(f"ocr:{image_key}", {"text": raw_text, "words": ocr_words})
         print(f"✅ OCR สำเร็จ (อ่านได้ {len(raw_text)} ตัวอักษร)")
+        emit_progress(on_progress, "ocr", chars=len(raw_text))
     except Exception as e:
         print(f"❌ OCR ล้มเหลว: {e}")
         return {
@@ -46,8 +334,15 @@ def run_pipeline(image_path, user_allergies=None):
     # =========================================================================
     print("\n🧹 STEP 2: ดึงและ Normalize ชื่อสาร...")
     
-    # ดึงส่วนผสมจาก raw text
-    ingredients = extract_ingredients(raw_text)
+    # ส่วนผสมของภาพนี้เคย normalize แล้ว - ข้าม LLM ได้เลย
+    cached_ingredients = cache.get(f"ingredients:{image_key}")
+    
+    # confidence ของแต่ละสารจาก OCR (ใช้เลือกสารที่ต้อง normalize)
+    if cached_ingredients is not None:
+        ingredients = cached_ingredients["extracted"]
+        confidences = []
+    else:
+        confidences = ingredient_confidences(ingredients, ocr_words)
     
     if not ingredients:
         print("❌ ไม่พบส่วนผสมในฉลาก")
@@ -61,11 +356,47 @@ def run_pipeline(image_path, user_allergies=None):
         }
     
     print(f"✅ พบส่วนผสม {len(ingredients)} รายการ")
+    emit_progress(on_progress, "extracted", count=len(ingredients), ingredients=ingredients)
+
+    # สารที่ชื่อดิบตรงกับสารที่แพ้อยู่แล้ว - เริ่มวิเคราะห์ระหว่าง normalize (ตรวจอีกครั้งหลัง normalize)
+    speculation = None
+    if config.SPECULATIVE_ANALYSIS and user_allergies and cached_ingredients is None:
+        raw_names = [ing.upper() for ing in ingredients]
+        raw_matches = [
+            m for m in find_matching_allergens(user_allergies, raw_names)
+            if m["match_score"] >= config.SPECULATIVE_MIN_SCORE
+        ]
+        if raw_matches:
+            print(f"🚀 เริ่มวิเคราะห์ {len(raw_matches)} สารที่ตรงจากชื่อดิบ ระหว่าง normalize")
+            speculation = SpeculativeAnalysis(
+                raw_matches, raw_names, emit_section, deadline,
+                use_llm=remaining_time(deadline) >= config.ANALYSIS_MIN_BUDGET
+            )
     
     # Normalize ชื่อสาร (แก้ไข OCR errors)
     print("⏳ กำลัง normalize ชื่อสาร...")
+    # False = มีชื่อที่ใช้ชื่อดิบแทนผลจาก LLM (ถูกข้าม/ล้มเหลว/หมดเวลา) - ไม่ cache ผลของภาพนี้
+    normalize_complete = True
     try:
-        normalized_results = normalize_ingredients(ingredients)
+        if cached_ingredients is not None:
+            print("⚡ ใช้ผล normalize จาก cache")
+            normalized_results = [
+                {"original": original, "corrected": corrected}
+                for original, corrected in zip(cached_ingredients["extracted"], cached_ingredients["normalized"])
+            ]
+        else:
+            # สารที่ OCR ไม่มั่นใจ: แก้ด้วยพจนานุกรม INCI ก่อน ที่เหลือส่งให้ LLM (ถ้าเวลายังพอ)
+            use_llm = remaining_time(deadline) >= config.NORMALIZE_MIN_BUDGET
+            if not use_llm:
+                print(f"⏱️ เวลาเหลือ {remaining_time(deadline):.0f}s - ข้าม LLM normalize (ใช้ชื่อจาก OCR)")
+            normalized_results, metrics["normalize"] = normalize_low_confidence(
+                ingredients, confidences, config.NORMALIZE_MIN_CONFIDENCE,
+                deadline=deadline, use_llm=use_llm
+            )
+            stats = metrics["normalize"]
+            if stats["llm_skipped"] or stats["llm_timed_out"]:
+                degraded.append("normalize")
+            normalize_complete = not (stats["llm_skipped"] or stats["llm_failed"])
         
         # เก็บเฉพาะสารที่ normalize สำเร็จ
         normalized_ingredients = []
@@ -77,6 +408,16 @@ def run_pipeline(image_path, user_allergies=None):
                 normalized_ingredients.append(item["original"].upper())
         
         print(f"✅ Normalize สำเร็จ {len(normalized_ingredients)} รายการ")
+        if cached_ingredients is None and normalize_complete:
+            cache.set(f"ingredients:{image_key}", {
+                "extracted": ingredients,
+                "normalized": normalized_ingredients
+            })
+        if config.INGREDIENT_INDEX:
+            # ชื่อจากฉลากเข้า trigram index (ฉลากถัดไปที่มีชื่อเดียวกันใช้ผลที่ profile จำไว้ได้)
+            index = get_ingredient_index()
+            for name in normalized_ingredients:
+                index.add(name)
         
         # แสดง normalized ingredients
         print("\n📋 รายการสารที่ตรวจพบ:")
@@ -89,6 +430,9 @@ def run_pipeline(image_path, user_allergies=None):
         print(f"⚠️ Normalize ล้มเหลว: {e}")
         print("   → ใช้ชื่อดิบจาก OCR แทน")
         normalized_ingredients = [ing.upper() for ing in ingredients]
+        normalize_complete = False
+    
+    emit_progress(on_progress, "normalized", ingredients=normalized_ingredients)
     
     # =========================================================================
     # 3️⃣ เปรียบเทียบกับสารที่ user แพ้ (Fuzzy Matching)
@@ -110,9 +454,12 @@ def run_pipeline(image_path, user_allergies=None):
     
     # ใช้ Fuzzy Matching เพื่อหาสารที่แพ้
     matching_allergens = find_matching_allergens(user_allergies, normalized_ingredients)
+    emit_progress(on_progress, "matched", count=len(matching_allergens), matches=matching_allergens)
     
     if not matching_allergens:
         print("✅ ไม่พบสารที่คุณแพ้ในผลิตภัณฑ์นี้")
+        if speculation is not None:
+            speculation.confirm([])
         return {
             "status": "success",
             "message": "ปลอดภัย",
@@ -132,13 +479,35 @@ def run_pipeline(image_path, user_allergies=None):
     print("\n🧠 STEP 4: ให้ AI วิเคราะห์แต่ละสารที่แพ้...")
     print("⏳ กำลังรอ AI วิเคราะห์ (อาจใช้เวลา 1-3 นาที)...\n")
     
+    use_llm = remaining_time(deadline) >= config.ANALYSIS_MIN_BUDGET
+    if not use_llm:
+        print(f"⏱️ เวลาเหลือ {remaining_time(deadline):.0f}s - ข้าม AI วิเคราะห์ (ใช้คำอธิบายจาก cache/fallback)")
+
     try:
-        ai_analysis = analyze_each_allergen(
-            normalized_ingredients=normalized_ingredients,
-            matching_allergens=matching_allergens
-        )
+        if speculation is not None:
+            ai_analysis = _reconcile_speculation(
+                speculation, normalized_ingredients, matching_allergens, emit_section, deadline, use_llm
+            )
+        else:
+            ai_analysis = analyze_each_allergen(
+                normalized_ingredients=normalized_ingredients,
+                matching_allergens=matching_allergens,
+                on_section=emit_section,
+                deadline=deadline,
+                use_llm=use_llm
+            )
         
         print("✅ AI วิเคราะห์เสร็จแล้ว!")
+        stats = ai_analysis.get("stats")
+        if stats:
+            metrics["analysis"] = stats
+            if stats.get("llm_skipped") or (stats.get("llm_failed") and remaining_time(deadline) <= 0):
+                degraded.append("analysis")
+        emit_progress(
+            on_progress, "analysis",
+            status=ai_analysis.get("status"),
+            analyzed_allergens=ai_analysis.get("analyzed_allergens", [])
+        )
         
     except Exception as e:
         print(f"❌ AI วิเคราะห์ล้มเหลว: {e}")
@@ -155,14 +524,15 @@ def run_pipeline(image_path, user_allergies=None):
     
     # สร้าง detected_allergens สำหรับแสดงผล
     detected_allergens = []
-    
+
+    # ผลวิเคราะห์ของแต่ละสารใช้ชื่อสารตามที่ขอ - หาด้วยชื่อตรงตัว
+    # (เทียบแบบ substring จะได้คำอธิบายของ "SODIUM BENZOATE" มาใส่ "BENZOATE")
+    ai_details = {}
+    for a in ai_analysis.get("analyzed_allergens", []):
+        ai_details.setdefault(explanation_name(a.get("ingredient", "")), a)
+
     for match in matching_allergens:
-        ai_detail = next(
-            (a for a in ai_analysis.get("analyzed_allergens", []) 
-            if match["ingredient"].upper() in a.get("ingredient", "").upper() or 
-                a.get("ingredient", "").upper() in match["ingredient"].upper()),
-            None
-    )
+        ai_detail = ai_details.get(explanation_name(match["ingredient"]))
         if ai_detail:
             detected_allergens.append({
     "ingredient": match["ingredient"],
@@ -200,11 +570,17 @@ def run_pipeline(image_path, user_allergies=None):
     print(f"\n{recommendation}")
     print("="*70 + "\n")
     
-    return {
+    result = {
         "status": "success",
         "message": "วิเคราะห์สำเร็จ",
         "cleaned_ingredients": normalized_ingredients,
         "detected_allergens": detected_allergens,
         "recommendation": recommendation,
         "ai_analysis": ai_analysis.get("raw_output", "")
-    }
\ No newline at end of file
+    }
+    
+    # ไม่ cache ผลที่ AI ล้มเหลวหรือถูกข้ามเพราะหมดเวลา หรือใช้ชื่อดิบแทนผล normalize (ครั้งหน้าจะได้ลองใหม่)
+    if ai_analysis.get("status") != "error" and not degraded and normalize_complete:
+        cache.set(result_key, result)
+    
+    return result
\ No newline at end of file
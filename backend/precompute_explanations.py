@@ -0,0 +1,114 @@
+"""
+คำนวณคำอธิบาย/สารทางเลือกของสารที่แพ้บ่อยไว้ล่วงหน้า (รันนอกเวลาใช้งาน)
+request ที่พบสารเหล่านี้จะไม่ต้องรอ LLM
+
+    python precompute_explanations.py                       # ALLERGEN_DB + data/common_allergens.txt
+    python precompute_explanations.py --names more.txt      # เพิ่มรายชื่อ (1 ชื่อต่อบรรทัด)
+    python precompute_explanations.py --batch-size 4 --concurrency 2
+
+รันซ้ำได้: ข้ามสารที่มีในคลังแล้ว และบันทึกคลังทุกครั้งที่ batch เสร็จ (หยุดกลางคันแล้วรันต่อได้)
+ถ้าแก้ prompt หรือเปลี่ยนโมเดล version จะเปลี่ยน และคำนวณใหม่ทั้งหมด
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import config
+from ai_reasoning import EXPLANATION_VERSION, explain_ingredients, explanation_name
+from allergen_db import ALLERGEN_DB
+from explanation_store import ExplanationStore
+from inci_normalizer import load_names
+
+COMMON_ALLERGENS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "common_allergens.txt")
+
+
+def collect_names(extra_paths=()):
+    """ชื่อสารที่ต้องคำนวณ (ไม่ซ้ำ, ตามลำดับที่พบ)"""
+    names = list(ALLERGEN_DB)
+    for path in (COMMON_ALLERGENS_PATH, *extra_paths):
+        names.extend(load_names(path))
+    return list(dict.fromkeys(explanation_name(n) for n in names if n.strip()))
+
+
+def make_batches(names, batch_size):
+    """
+    แบ่งชื่อเป็น batch ละไม่เกิน batch_size ชื่อ (ตามลำดับ) โดยไม่ให้ชื่อที่มีอีกชื่ออยู่ข้างใน
+    (เช่น BENZOATE / SODIUM BENZOATE) อยู่ใน prompt เดียวกัน - AI มักตอบชื่อเต็มแทนชื่อสั้น
+    และคลังเก็บเฉพาะ section ที่ชื่อตรงกับที่ขอ
+    """
+    batches = []
+    open_batches = []
+    for name in names:
+        batch = next((b for b in open_batches if not any(name in other or other in name for other in b)), None)
+        if batch is None:
+            batch = []
+            batches.append(batch)
+            open_batches.append(batch)
+        batch.append(name)
+        if len(batch) >= batch_size:
+            open_batches.remove(batch)
+    return batches
+
+
+def _explain_batch(batch, timeout):
+    try:
+        return batch, explain_ingredients(batch, timeout=timeout), None
+    except Exception as e:
+        return batch, {}, e
+
+
+def precompute(names, store, path, batch_size=4, concurrency=2, timeout=None):
+    """ถาม LLM ทีละ batch (พร้อมกันไม่เกิน concurrency batch) คืน (จำนวนที่ได้, จำนวนที่ไม่สำเร็จ)"""
+    todo = [name for name in names if name not in store]
+    skipped = len(names) - len(todo)
+    print(f"📋 {len(names)} สาร - มีในคลังแล้ว {skipped}, ต้องคำนวณ {len(todo)}")
+    if not todo:
+        return 0, 0
+
+    batches = make_batches(todo, batch_size)
+    start = time.perf_counter()
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_explain_batch, batch, timeout) for batch in batches]
+        for future in as_completed(futures):
+            batch, explained, error = future.result()
+            for name, entry in explained.items():
+                store.add(name, entry)
+            done += len(explained)
+            failed += len(batch) - len(explained)
+            if explained:
+                store.save(path)
+
+            elapsed = time.perf_counter() - start
+            rate = (done + failed) / elapsed if elapsed else 0.0
+            remaining = len(todo) - done - failed
+            eta = f"{remaining / rate / 60:.1f} นาที" if rate else "?"
+            note = f" ❌ {error}" if error else (f" ⚠️ ตอบไม่ครบ {len(batch) - len(explained)} สาร"
+                                                 if len(explained) < len(batch) else "")
+            print(f"   [{done + failed}/{len(todo)}] {rate * 60:.1f} สาร/นาที, เหลือ ~{eta}{note}")
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ ได้ {done} สาร, ไม่สำเร็จ {failed} สาร ({elapsed:.0f}s) - รันซ้ำเพื่อลองสารที่ไม่สำเร็จอีกครั้ง")
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AllerGUARD precompute allergen explanations")
+    parser.add_argument("--store", default=config.EXPLANATION_STORE_PATH, help="default = ALLERGUARD_EXPLANATION_STORE")
+    parser.add_argument("--names", action="append", default=[], help="ไฟล์รายชื่อสารเพิ่มเติม (ใส่ได้หลายครั้ง)")
+    parser.add_argument("--batch-size", type=int, default=4, help="จำนวนสารต่อ prompt")
+    parser.add_argument("--concurrency", type=int, default=2, help="จำนวน prompt ที่ส่งพร้อมกัน")
+    parser.add_argument("--timeout", type=int, default=None, help="เวลาสูงสุดต่อ prompt (วินาที)")
+    parser.add_argument("--limit", type=int, default=None, help="คำนวณแค่ N สารแรก (ทดลอง)")
+    args = parser.parse_args()
+
+    store = ExplanationStore.load(args.store, EXPLANATION_VERSION)
+    store.model = config.LLM_MODEL
+    names = collect_names(args.names)[:args.limit]
+    print(f"📖 คลัง {args.store} (version {EXPLANATION_VERSION}, {len(store)} สาร)")
+    precompute(names, store, args.store, args.batch_size, args.concurrency, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+def image_hash(data):
+    """hash ของไฟล์ภาพ (bytes) ใช้เป็น key ของ cache - ภาพเดียวกันได้ key เดียวกันเสมอ"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def canonical_allergies(allergies):
+    """ทำให้รายการสารที่แพ้อยู่ในรูปแบบมาตรฐาน (ตัวพิมพ์ใหญ่, ไม่ซ้ำ, เรียงลำดับ)"""
+    return sorted({" ".join(str(a).upper().split()) for a in allergies if str(a).strip()})
+
+
+def allergy_profile_key(allergies):
+    """key ของรายการสารที่แพ้ - ลำดับ/ตัวพิมพ์/ช่องว่างไม่มีผล"""
+    data = json.dumps(canonical_allergies(allergies), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+class _CacheStats:
+    """นับ hit/miss แยกตามประเภท (prefix ของ key เช่น "ocr", "ingredients")"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, key, hit):
+        kind = key.split(":", 1)[0]
+        with self._lock:
+            counts = self._counts.setdefault(kind, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for kind, counts in self._counts.items():
+                total = counts["hits"] + counts["misses"]
+                result[kind] = dict(counts, hit_rate=round(counts["hits"] / total, 3) if total else 0.0)
+            return result
+
+
+class MemoryCache:
+    """LRU cache ในหน่วยความจำ + หมดอายุตาม TTL (ใช้ร่วมกันได้เฉพาะ thread ใน process เดียว)"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries=1000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = _CacheStats()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] is not None and item[0] < time.time():
+                del self._data[key]
+                item = None
+            if item is not None:
+                self._data.move_to_end(key)
+        self._stats.record(key, item is not None)
+        return item[1] if item is not None else None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """คืน (key, value) ทั้งหมดที่ยังไม่หมดอายุ"""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value) for key, (expires_at, value) in self._data.items()
+                if expires_at is None or expires_at >= now
+            ]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"backend": self.backend, "entries": len(self), "kinds": self._stats.snapshot()}
+
+
+class SQLiteCache:
+    """
+    Cache บน SQLite - ใช้ร่วมกันได้ระหว่างหลาย worker/process ผ่านไฟล์เดียวกัน
+
+    ค่าที่เก็บต้องแปลงเป็น JSON ได้
+    ลบรายการที่ใช้งานล่าสุดนานที่สุดเมื่อเกิน max_entries (LRU) และรายการที่หมดอายุตาม TTL
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, table="cache", max_entries=1000, ttl=None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._stats = _CacheStats()
+        self._writes = 0
+
+        conn = self._conn()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_access ON {self.table} (last_access)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connection ใช้ข้าม thread ไม่ได้ - แยก connection ต่อ thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None and row[1] is not None and row[1] < now:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            conn.commit()
+            row = None
+
+        self._stats.record(key, row is not None)
+        if row is None:
+            return None
+
+        conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        conn = self._conn()
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+        )
+        conn.commit()
+
+        # ไม่ต้อง evict ทุกครั้งที่เขียน
+        self._writes += 1
+        if self._writes % 20 == 0:
+            self.evict()
+
+    def evict(self, max_entries=None):
+        """ลบรายการที่หมดอายุ และรายการเก่าที่สุด (LRU) ที่เกินจำนวนสูงสุด"""
+        if max_entries is None:
+            max_entries = self.max_entries
+        conn = self._conn()
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (time.time(),)
+        )
+        conn.execute(f"""
+            DELETE FROM {self.table} WHERE key IN (
+                SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,))
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table}")
+        conn.commit()
+
+    def items(self):
+        """คืน (key, value) ทั้งหมดที่ยังไม่หมดอายุ"""
+        rows = self._conn().execute(
+            f"SELECT key, value FROM {self.table} WHERE expires_at IS NULL OR expires_at >= ?",
+            (time.time(),)
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def __len__(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self):
+        return {"backend": self.backend, "entries": len(self), "kinds": self._stats.snapshot()}
+
+
+class NullCache:
+    """ใช้เมื่อปิด cache"""
+
+    backend = "off"
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def stats(self):
+        return {"backend": self.backend}
+
+
+_cache = None
+_normalize_memo = None
+_explanation_cache = None
+_cache_lock = threading.Lock()
+
+
+def _build_cache(kind, path, table, max_entries, ttl):
+    """สร้าง cache ตามชนิดใน config: "sqlite" (ไฟล์ path, ตาราง table), "off" หรือ "memory" (ค่า default)"""
+    if kind == "sqlite":
+        return SQLiteCache(path, table=table, max_entries=max_entries, ttl=ttl)
+    if kind == "off":
+        return NullCache()
+    return MemoryCache(max_entries=max_entries, ttl=ttl)
+
+
+def get_cache():
+    """cache ของผลลัพธ์ pipeline ตาม config (สร้างครั้งเดียวต่อ process)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = _build_cache(config.CACHE_BACKEND, config.CACHE_PATH, "pipeline_cache",
+                                  config.CACHE_MAX_ENTRIES, config.CACHE_TTL)
+        return _cache
+
+
+def get_normalize_memo():
+    """memo ผล normalize ของ LLM ตาม config (สร้างครั้งเดียวต่อ process)"""
+    global _normalize_memo
+    with _cache_lock:
+        if _normalize_memo is None:
+            _normalize_memo = _build_cache(config.NORMALIZE_MEMO, config.NORMALIZE_MEMO_PATH, "normalize_memo",
+                                           config.NORMALIZE_MEMO_MAX_ENTRIES, config.NORMALIZE_MEMO_TTL or None)
+        return _normalize_memo
+
+
+def get_explanation_cache():
+    """cache คำอธิบาย/สารทางเลือกต่อสารของ ai_reasoning ตาม config (สร้างครั้งเดียวต่อ process)"""
+    global _explanation_cache
+    with _cache_lock:
+        if _explanation_cache is None:
+            _explanation_cache = _build_cache(config.EXPLANATION_CACHE, config.EXPLANATION_CACHE_PATH,
+                                              "explanation_cache", config.EXPLANATION_CACHE_MAX_ENTRIES,
+                                              config.EXPLANATION_CACHE_TTL or None)
+        return _explanation_cache
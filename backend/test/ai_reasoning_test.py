@@ -0,0 +1,156 @@
+"""
+ทดสอบการแยก/จับคู่คำตอบของ AI กับสารที่ขอ (ai_reasoning) ด้วย scheduler จำลอง - ไม่ต้องมี LLM
+section ที่ถูกตัดข้าม token, section ที่ผิดรูปแบบ/ขาดกลางคันเป็น fallback เฉพาะสารนั้น
+และคำอธิบายที่เก็บลง cache ต้องเป็นของสารที่ชื่อตรงกันเท่านั้น
+
+    python -m pytest test/ai_reasoning_test.py
+"""
+import time
+
+import ai_reasoning
+from ai_reasoning import (_analyze_parallel, _analyze_streaming, explain_ingredients, iter_sections,
+                          match_explanations)
+from llm_client import LLMTimeout
+
+
+def _section(name, description=None):
+    """section ในรูปแบบที่ create_analysis_prompt ขอ"""
+    return (f"{name}\n1. คำอธิบาย:\n{description or f'about {name}'}\n\n"
+            f"2. สารทางเลือกที่ปลอดภัยกว่า:\n   - ทางเลือก - ปลอดภัย\n")
+
+
+class FakeScheduler:
+    """
+    แทน LLMScheduler: generate คืน answers[ชื่อสารที่อยู่ใน prompt], stream ส่ง tokens ทีละตัว
+    (ค่าที่เป็น Exception ถูก raise แทน)
+    """
+
+    def __init__(self, answers=None, tokens=None):
+        self.answers = answers or {}
+        self.tokens = tokens or []
+
+    def generate(self, prompt, priority="interactive", deadline=None, cancel=None, **kwargs):
+        for name, answer in self.answers.items():
+            if f"- {name} (" in prompt:
+                if isinstance(answer, Exception):
+                    raise answer
+                return answer
+        return ""
+
+    def stream(self, prompt, priority="interactive", deadline=None, cancel=None, **kwargs):
+        for token in self.tokens:
+            if isinstance(token, Exception):
+                raise token
+            yield token
+
+
+def _with_scheduler(scheduler, func, *args):
+    original = ai_reasoning.get_scheduler
+    ai_reasoning.get_scheduler = lambda: scheduler
+    try:
+        return func(*args)
+    finally:
+        ai_reasoning.get_scheduler = original
+
+
+def _items(*names):
+    return [{"ingredient": name, "user_input": name} for name in names]
+
+
+def _stream(tokens, *names):
+    """รัน _analyze_streaming ด้วย tokens - คืน (ผลทุกสาร, ผลที่ส่งให้ client ตามลำดับ, error)"""
+    emitted = []
+    parsed, _, _, error = _with_scheduler(FakeScheduler(tokens=tokens), _analyze_streaming, _items(*names), [],
+                                          emitted.append, time.monotonic() + 5)
+    return parsed, emitted, error
+
+
+def test_separator_split_across_tokens():
+    tokens = ["RETINOL\n1. คำอธิบาย:\nabout RETINOL", "\n", "---", "\n", "LIMONENE\n1. คำอธิบาย:\nabout LIMONENE\n"]
+    assert list(iter_sections(iter(tokens))) == ["RETINOL\n1. คำอธิบาย:\nabout RETINOL",
+                                                 "LIMONENE\n1. คำอธิบาย:\nabout LIMONENE\n"]
+    assert list(iter_sections(iter(["A\n--", "-\nB"]))) == ["A", "B"]
+    parsed, emitted, error = _stream(tokens, "RETINOL", "LIMONENE")
+    assert error is None
+    assert [(e["ingredient"], e["description"]) for e in emitted] == [("RETINOL", "about RETINOL"),
+                                                                      ("LIMONENE", "about LIMONENE")]
+
+
+def test_section_at_start():
+    # คำตอบเริ่มด้วย "---" (ไม่มีขึ้นบรรทัดก่อน) หรือเริ่มที่ชื่อสารเลย
+    for first in ("---\n" + _section("RETINOL"), _section("RETINOL")):
+        parsed, emitted, error = _stream([first, "---\n", _section("LIMONENE")], "RETINOL", "LIMONENE")
+        assert error is None
+        assert [e["ingredient"] for e in emitted] == ["RETINOL", "LIMONENE"]
+        assert not any(e.get("fallback") for e in parsed)
+
+
+def test_malformed_middle_section():
+    tokens = [_section("RETINOL"), "---\n", "ขออภัย ไม่พบข้อมูล\n", "---\n", _section("LIMONENE")]
+    parsed, emitted, error = _stream(tokens, "RETINOL", "BENZOATE", "LIMONENE")
+    assert error is None
+    assert [(e["ingredient"], bool(e.get("fallback"))) for e in emitted] == [
+        ("RETINOL", False), ("LIMONENE", False), ("BENZOATE", True)]
+
+    answers = {"RETINOL": _section("RETINOL"), "BENZOATE": "ขออภัย ไม่พบข้อมูล", "LIMONENE": _section("LIMONENE")}
+    parsed, _, _, error = _with_scheduler(FakeScheduler(answers), _analyze_parallel, _items(*answers), [],
+                                          lambda entry: None, time.monotonic() + 5)
+    assert error is None
+    assert [(e["ingredient"], bool(e.get("fallback"))) for e in parsed] == [
+        ("RETINOL", False), ("BENZOATE", True), ("LIMONENE", False)]
+
+
+def test_timeout_mid_stream():
+    tokens = [_section("RETINOL"), "---\n", "LIMONENE\n1. คำอธิบาย:\nครึ่ง", LLMTimeout("timeout")]
+    parsed, emitted, error = _stream(tokens, "RETINOL", "LIMONENE")
+    assert error == "AI ตอบช้าเกินไป กรุณาลองใหม่อีกครั้ง"
+    # section ที่ได้ก่อน timeout ใช้ได้, ที่ขาดกลางคันเป็น fallback
+    assert [(e["ingredient"], bool(e.get("fallback"))) for e in emitted] == [("RETINOL", False), ("LIMONENE", True)]
+
+    answers = {"RETINOL": _section("RETINOL"), "LIMONENE": LLMTimeout("timeout")}
+    parsed, confirmed, _, error = _with_scheduler(FakeScheduler(answers), _analyze_parallel, _items(*answers), [],
+                                                  lambda entry: None, time.monotonic() + 5)
+    assert error == "AI ตอบช้าเกินไป กรุณาลองใหม่อีกครั้ง"
+    assert [(e["ingredient"], bool(e.get("fallback"))) for e in parsed] == [("RETINOL", False), ("LIMONENE", True)]
+    assert [e["ingredient"] for e in confirmed] == ["RETINOL"]
+
+
+def test_match_explanations_exact_only():
+    parsed = [{"ingredient": "SODIUM BENZOATE", "description": "about SODIUM BENZOATE", "alternatives": []}]
+    assert match_explanations(_items("BENZOATE", "SODIUM BENZOATE"), parsed) == {
+        "SODIUM BENZOATE": {"description": "about SODIUM BENZOATE", "alternatives": []}}
+    # ขอสารเดียวแล้วได้ section เดียว - เป็นของสารนั้นแม้ AI เขียนชื่อต่างไป
+    assert list(match_explanations(_items("BENZOATE"), parsed)) == ["BENZOATE"]
+
+
+def test_streaming_substring_not_confirmed():
+    # AI ไม่ตอบ BENZOATE แต่ตอบ "SODIUM BENZOATE" สองครั้ง - ครั้งที่สองจับคู่กับ BENZOATE เพื่อแสดงผลได้
+    # แต่ต้องไม่ถูกเก็บเป็นคำอธิบายของ BENZOATE
+    missing = _items("SODIUM BENZOATE", "BENZOATE")
+    tokens = [_section("SODIUM BENZOATE"), "---\n", _section("SODIUM BENZOATE", "other")]
+    parsed, confirmed, _, error = _with_scheduler(FakeScheduler(tokens=tokens), _analyze_streaming, missing, [],
+                                                  lambda entry: None, time.monotonic() + 5)
+    assert error is None
+    assert [e["ingredient"] for e in parsed] == ["SODIUM BENZOATE", "BENZOATE"]
+    assert [e["ingredient"] for e in confirmed] == ["SODIUM BENZOATE"]
+    assert list(match_explanations(missing, confirmed)) == ["SODIUM BENZOATE"]
+
+
+def test_parallel_substring_not_confirmed():
+    # ถามทีละสาร: section เดียวเป็นของสารนั้นเสมอ, หลาย section ที่ชื่อไม่ตรงใช้แสดงผลเท่านั้น
+    answers = {
+        "BENZOATE": _section("SODIUM BENZOATE") + "---\n" + _section("POTASSIUM SORBATE"),
+        "RETINOL": _section("VITAMIN A"),
+    }
+    missing = _items("BENZOATE", "RETINOL")
+    parsed, confirmed, _, _ = _with_scheduler(FakeScheduler(answers), _analyze_parallel, missing, [],
+                                              lambda entry: None, time.monotonic() + 5)
+    assert [e["ingredient"] for e in parsed] == ["BENZOATE", "RETINOL"]
+    assert [e["ingredient"] for e in confirmed] == ["RETINOL"]
+
+
+def test_explain_ingredients_exact_only():
+    # prompt เดียวหลายสาร: AI ตอบ BENZOATE ด้วยชื่อเต็ม - คลังต้องไม่ได้คำอธิบายนั้นเป็นของ BENZOATE
+    answer = _section("SODIUM BENZOATE") + "---\n" + _section("RETINOL")
+    explained = _with_scheduler(FakeScheduler({"BENZOATE": answer}), explain_ingredients, ["BENZOATE", "RETINOL"])
+    assert explained == {"RETINOL": {"description": "about RETINOL", "alternatives": ["ทางเลือก - ปลอดภัย"]}}
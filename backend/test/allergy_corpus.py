@@ -0,0 +1,58 @@
+"""
+ชุดข้อมูลที่ test ของ fuzzy matching ใช้ร่วมกัน (fuzzy_batch_test, ingredient_index_test)
+test cases ของ fuzzy_matcher + ชื่อจากพจนานุกรม INCI ที่สุ่มพิมพ์ผิด/พิมพ์ไม่ครบ/พหูพจน์
+"""
+import random
+
+import config
+from fuzzy_matcher import COMMON_WORDS
+from inci_normalizer import load_names
+
+MAIN_CASES = [
+    ("SALICY", "SALICYLIC ACID"),
+    ("salicylic acid", "SALICYLIC ACID"),
+    ("Salicylic 0cid", "SALICYLIC ACID"),
+    ("PARABENS", "METHYLPARABEN"),
+    ("GLYCOLIC", "GLYCOLIC ACID"),
+    ("RETINOL", "RETINOL"),
+    ("VITAMIN C", "ASCORBIC ACID"),
+    ("sorbic acid", "SALICYLIC ACID"),
+    ("sorbic acid", "SORBIC ACID"),
+]
+
+EDGE_CASES = [
+    ("", "RETINOL"), ("RETINOL", ""), ("", ""), ("  retinol ", "RETINOL"),
+    ("ACID", "SALICYLIC ACID"), ("OIL", "CASTOR OIL"), ("acid", "ACID"),
+    ("SULFATES", "SODIUM LAURYL SULFATE"), ("FRAGRANCES", "FRAGRANCE"), ("PARABENES", "PROPYLPARABEN"),
+    ("CITRUS OIL", "CITRUS AURANTIUM DULCIS PEEL OIL"), ("LAURYL  SULFATE", "SODIUM LAURETH SULFATE"),
+    ("S", "S"), ("ES", "XES"), ("MIXES", "MIX ES"), ("SODIUM", "SODIUM  HYDROXIDE"),
+]
+
+
+def mutate(name, rng):
+    """ชื่อแบบที่ user อาจพิมพ์: ตัวเล็ก, พิมพ์ผิด 1-2 ตัว, พิมพ์ไม่ครบ, พหูพจน์, แค่คำเดียว"""
+    kind = rng.randrange(6)
+    if kind == 0:
+        return name.lower()
+    if kind == 1:
+        chars = list(name)
+        for _ in range(rng.randint(1, 2)):
+            chars[rng.randrange(len(chars))] = rng.choice("ABCDEIO0S ")
+        return "".join(chars)
+    if kind == 2:
+        return name[:max(3, int(len(name) * rng.uniform(0.4, 0.9)))]
+    if kind == 3:
+        return name + rng.choice(["S", "ES"])
+    if kind == 4:
+        return rng.choice(name.split())
+    return name
+
+
+def corpus(seed=7, allergens=80, labels=40, label_size=60):
+    """(ชื่อสารที่แพ้แบบที่ user พิมพ์, รายการส่วนผสมของฉลากสุ่ม) - seed เดียวกันได้ชุดเดียวกัน"""
+    rng = random.Random(seed)
+    names = load_names(config.INCI_NAMES_PATH)
+    user_allergies = [mutate(rng.choice(names), rng) for _ in range(allergens)]
+    user_allergies += sorted(COMMON_WORDS)[:3] + ["PARABENS", "FRAGRANCE", "sorbic acid"]
+    label_lists = [rng.sample(names, label_size) for _ in range(labels)]
+    return user_allergies, label_lists
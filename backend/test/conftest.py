@@ -0,0 +1,11 @@
+"""
+ตั้งค่าที่ใช้ร่วมกันของ test ทุกไฟล์ (pytest โหลดไฟล์นี้ก่อน test ใน directory นี้)
+
+    python -m pytest test                 # รันจาก backend/
+    python -m pytest test/fuzzy_batch_test.py
+"""
+import os
+import sys
+
+# import โมดูลใน backend/ ได้ ไม่ว่าจะรัน pytest จาก directory ไหน
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,115 @@
+"""
+ทดสอบว่า fuzzy_batch ให้ผลเหมือน fuzzy_match ทีละคู่ (match, score, reason) ทุกคู่
+ทั้งแบบคำนวณทุกคู่ (match_pairs) และแบบ CompiledAllergyProfile ที่ตัดคู่ด้วย index bigram
+ชุดทดสอบ: test cases ของ fuzzy_matcher + ชื่อจากพจนานุกรม INCI ที่สุ่มพิมพ์ผิด/พิมพ์ไม่ครบ/พหูพจน์
+
+    python -m pytest test/fuzzy_batch_test.py
+"""
+import time
+
+import config
+from fuzzy_batch import CompiledAllergyProfile, _unique_upper, get_profile, get_profile_cache, match_pairs
+from fuzzy_matcher import find_matching_allergens, fuzzy_match
+
+from allergy_corpus import EDGE_CASES, MAIN_CASES, corpus
+
+
+def _batch_results(allergens, ingredients, threshold, profile=False):
+    pairs = (CompiledAllergyProfile(allergens).match_pairs(ingredients, threshold) if profile
+             else match_pairs(allergens, ingredients, threshold))
+    return {(a, i): (score, reason) for a, i, score, reason in pairs}
+
+
+def _check_pairs(allergens, ingredients, threshold, profile=False):
+    batch = _batch_results(allergens, ingredients, threshold, profile)
+    for a, allergen in enumerate(allergens):
+        for i, ingredient in enumerate(ingredients):
+            expected = fuzzy_match(allergen, ingredient, threshold)
+            got = batch.get((a, i))
+            if expected["match"]:
+                assert got == (expected["score"], expected["reason"]), (allergen, ingredient, expected, got)
+            else:
+                assert got is None, (allergen, ingredient, got)
+    return len(batch)
+
+
+def test_main_cases():
+    for threshold in (0.75, 0.85):
+        for profile in (False, True):
+            _check_pairs([a for a, _ in MAIN_CASES], sorted({i for _, i in MAIN_CASES}), threshold, profile)
+
+
+def test_edge_cases():
+    for threshold in (0.75, 0.85):
+        for profile in (False, True):
+            _check_pairs([a for a, _ in EDGE_CASES], [i for _, i in EDGE_CASES], threshold, profile)
+
+
+def test_regression_corpus():
+    user_allergies, label_lists = corpus()
+    matched = sum(_check_pairs(user_allergies, ingredients, 0.85) for ingredients in label_lists[:10])
+    assert matched > 50, matched
+
+
+def test_profile_prunes_without_changing_results():
+    user_allergies, label_lists = corpus(seed=5)
+    profile = CompiledAllergyProfile(user_allergies)
+    kept = total = 0
+    for ingredients in label_lists:
+        for threshold in (0.75, 0.85):
+            expected = match_pairs(user_allergies, ingredients, threshold)
+            assert profile.match_pairs(ingredients, threshold) == expected
+        names, _ = _unique_upper(ingredients)
+        candidates = profile.candidates(names, 0.85)
+        kept += candidates.sum()
+        total += candidates.size
+    print(f"   index เหลือ {kept / total:.1%} ของคู่ (สารที่แพ้ x ส่วนผสม)")
+    assert kept / total < 0.5
+
+
+def test_profile_cache():
+    get_profile_cache().clear()
+    profile = get_profile(["Retinol", "PARABENS"])
+    assert get_profile(["Retinol", "PARABENS"]) is profile
+    assert get_profile(["PARABENS", "Retinol"]) is not profile  # ลำดับมีผลกับผลลัพธ์
+    assert profile.match(["METHYLPARABEN", "RETINOL", "AQUA"], 0.85) == [
+        ("Retinol", "RETINOL", 1.0, "ตรงทุกตัวอักษร"),
+        ("PARABENS", "METHYLPARABEN", fuzzy_match("PARABENS", "METHYLPARABEN", 0.85)["score"],
+         fuzzy_match("PARABENS", "METHYLPARABEN", 0.85)["reason"]),
+    ]
+    assert get_profile_cache().stats()["kinds"]["profile"]["hits"] == 1
+
+
+def test_find_matching_allergens_same_output():
+    user_allergies, label_lists = corpus(seed=11)
+    label_lists.append(["Retinol", "RETINOL", "retinol", "METHYLPARABEN", "METHYLPARABEN", "PROPYLPARABEN"])
+    user_allergies += ["retinol", "PARABENS", "RETINOL"]
+    original = config.FUZZY_ENGINE
+    try:
+        for ingredients in label_lists:
+            config.FUZZY_ENGINE = "loop"
+            expected = find_matching_allergens(user_allergies, ingredients)
+            config.FUZZY_ENGINE = "batch"
+            assert find_matching_allergens(user_allergies, ingredients) == expected
+    finally:
+        config.FUZZY_ENGINE = original
+
+
+def test_speed():
+    user_allergies, label_lists = corpus(seed=3, allergens=40, labels=10)
+    start = time.perf_counter()
+    for ingredients in label_lists:
+        [fuzzy_match(a, i, 0.85) for a in user_allergies for i in ingredients]
+    loop_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for ingredients in label_lists:
+        match_pairs(user_allergies, ingredients, 0.85)
+    batch_seconds = time.perf_counter() - start
+    profile = CompiledAllergyProfile(user_allergies)
+    start = time.perf_counter()
+    for ingredients in label_lists:
+        profile.match_pairs(ingredients, 0.85)
+    profile_seconds = time.perf_counter() - start
+    print(f"   loop {loop_seconds * 100:.1f} ms/ฉลาก, batch {batch_seconds * 100:.1f} ms/ฉลาก "
+          f"({loop_seconds / batch_seconds:.1f}x), profile {profile_seconds * 100:.1f} ms/ฉลาก "
+          f"({loop_seconds / profile_seconds:.1f}x) - {len(user_allergies)} สารที่แพ้ x 60 ส่วนผสม")
@@ -0,0 +1,115 @@
+"""
+ทดสอบผลของ extract_ingredients กับข้อความ OCR ตัวอย่าง (กันผลเปลี่ยนโดยไม่ตั้งใจ)
+
+SAME_AS_BEFORE: ผลต้องเหมือนตัวดึงแบบเดิม (ก่อนเปลี่ยนเป็น streaming) ทุกตัว
+CHANGED: กรณีที่ตั้งใจให้ผลต่างจากเดิม (ผลเดิมอยู่ใน comment)
+
+หมายเหตุ: "S: " หน้าชื่อแรกมาจาก keyword "INGREDIENT" ที่ไม่รวม S - เป็นแบบนี้มาตั้งแต่ตัวดึงแบบเดิม
+
+    python -m pytest test/ingredient_extractor_test.py
+"""
+
+from ingredient_extractor import extract_ingredients, extract_ingredients_with_confidence, iter_ingredients
+
+SAME_AS_BEFORE = {
+    "simple": (
+        "INGREDIENTS: WATER, BUTYLENE GLYCOL, SODIUM HYALURONATE, CITRIC ACID",
+        ["S: WATER", "BUTYLENE GLYCOL", "SODIUM HYALURONATE", "CITRIC ACID"],
+    ),
+    # คำต่อท้าย (EXTRACT, ACID) ที่ถูกตัดไปบรรทัดถัดไปรวมกลับกับชื่อก่อนหน้า
+    "suffix_across_lines": (
+        "INGREDIENTS: AQUA, CAMELLIA SINENSIS LEAF\nEXTRACT, SALICYLIC\nACID, GLYCERIN",
+        ["S: AQUA", "CAMELLIA SINENSIS LEAF EXTRACT", "SALICYLIC ACID", "GLYCERIN"],
+    ),
+    "suffix_own_line": (
+        "INGREDIENTS: AQUA, CENTELLA ASIATICA\nEXTRACT\nGLYCERIN",
+        ["S: AQUA", "CENTELLA ASIATICA EXTRACT", "GLYCERIN"],
+    ),
+    # คำที่ถูกตัดบรรทัด (HYALU- / RONATE, TEA / TREE) ต้องรวมกันผ่าน lookahead 1 บรรทัด
+    "hyphen_across_lines": (
+        "INGREDIENTS: AQUA, SODIUM HYALU-\nRONATE, GLYCERIN",
+        ["S: AQUA", "SODIUM HYALURONATE", "GLYCERIN"],
+    ),
+    "tea_tree_across_lines": (
+        "INGREDIENTS: AQUA, MELALEUCA ALTERNIFOLIA (TEA\nTREE) LEAF OIL, GLYCERIN",
+        ["S: AQUA", "MELALEUCA ALTERNIFOLIA (TEA TREE) LEAF OIL", "GLYCERIN"],
+    ),
+    # stop word กลางรายการ: เก็บส่วนก่อน stop word แล้วจบ
+    "stop_word_mid_item": (
+        "INGREDIENTS: AQUA, GLYCERIN, FRAGRANCE MADE IN THAILAND, LIMONENE",
+        ["S: AQUA", "GLYCERIN", "FRAGRANCE"],
+    ),
+    "stop_word_line": (
+        "Ingredients: Water, Glycerin\nNiacinamide, Parfum\nDirections: apply to face, Linalool",
+        ["s: Water", "Glycerin", "Niacinamide", "Parfum"],
+    ),
+    "lot_after_list": (
+        "INGREDIENTS: AQUA, PARFUM\nLOT 2301 EXP 2026",
+        ["S: AQUA", "PARFUM"],
+    ),
+    # ไทย: ชื่อที่ถูกตัดบรรทัดรวมข้าม newline (รอบรรทัดถัดไปใน lookahead), อักษรที่ OCR แยกช่องว่างรวมกลับ
+    "thai_wrapped": (
+        "ส่วนประกอบ: น้ำ, สารสกัดจากใบ\nชาเขียว, กลีเซอรีน",
+        ["น้ำ", "สารสกัดจากใบชาเขียว", "กลีเซอรีน"],
+    ),
+    "thai_spaced": (
+        "ส่วนประกอบ: น้ ำ, กลี เซอ รีน",
+        ["น้ำ", "กลีเซอรีน"],
+    ),
+    "no_keyword": (
+        "HOW TO USE: apply daily\nAQUA, GLYCERIN",
+        [],
+    ),
+}
+
+CHANGED = {
+    # ฉลาก 2 ภาษา: ดึงทั้งสองส่วน (เดิมเก็บแค่ส่วนหลัง keyword ตัวสุดท้าย)
+    # เดิม: ["S: AQUA", "GLYCERIN", "NIACINAMIDE", "PHENOXYETHANOL"]
+    "bilingual_thai_first": (
+        "ส่วนประกอบ: น้ำ, กลีเซอรีน, ไนอะซินาไมด์\nวิธีใช้: ทาบางๆ\n"
+        "INGREDIENTS: AQUA, GLYCERIN, NIACINAMIDE, PHENOXYETHANOL\nHOW TO USE: apply daily",
+        ["น้ำ", "กลีเซอรีน", "ไนอะซินาไมด์", "S: AQUA", "GLYCERIN", "NIACINAMIDE", "PHENOXYETHANOL"],
+    ),
+    # เดิม: ["น้ำ", "กลีเซอรีน"]
+    "bilingual_english_first": (
+        "INGREDIENTS: AQUA, GLYCERIN\nHOW TO USE: apply\nส่วนประกอบ: น้ำ, กลีเซอรีน\nคำเตือน: ห้ามใช้",
+        ["S: AQUA", "GLYCERIN", "น้ำ", "กลีเซอรีน"],
+    ),
+    # ชื่อที่ซ้ำ (ไม่สนตัวพิมพ์) ไม่ถูกดึงซ้ำ
+    # เดิม: ["S: AQUA", "GLYCERIN", "aqua", "GLYCERIN"]
+    "duplicates": (
+        "INGREDIENTS: AQUA, GLYCERIN, aqua, GLYCERIN",
+        ["S: AQUA", "GLYCERIN", "aqua"],
+    ),
+}
+
+
+def _check(cases):
+    for name, (text, expected) in cases.items():
+        got = extract_ingredients(text)
+        assert got == expected, (name, got)
+
+
+def test_same_as_before():
+    _check(SAME_AS_BEFORE)
+
+
+def test_intended_changes():
+    _check(CHANGED)
+
+
+def test_streaming_lines_same_as_whole_text():
+    for text, expected in list(SAME_AS_BEFORE.values()) + list(CHANGED.values()):
+        assert list(iter_ingredients(iter(text.splitlines()))) == expected, text
+
+
+def test_confidence_by_position():
+    # "pid" ถูกแก้เป็น ACID - ต้องไม่ได้ confidence ของ ACID ตัวจริงใน CITRIC ACID
+    words = [{"text": text, "conf": conf} for text, conf in
+             [("INGREDIENTS:", 90), ("CITRIC", 95), ("ACID,", 97), ("SALICYLIC", 88), ("pid,", 30),
+              ("AQUA,", 99), ("CITRIC", 60), ("EXTRACT", 70)]]
+    got = extract_ingredients_with_confidence("INGREDIENTS: CITRIC ACID, SALICYLIC pid, AQUA, CITRIC EXTRACT", words)
+    assert got == [{"name": "S: CITRIC ACID", "confidence": None},
+                   {"name": "SALICYLIC ACID", "confidence": None},
+                   {"name": "AQUA", "confidence": 99.0},
+                   {"name": "CITRIC EXTRACT", "confidence": 60.0}], got
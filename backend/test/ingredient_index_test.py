@@ -0,0 +1,102 @@
+"""
+ทดสอบ ingredient_index: candidates ต้องไม่ตัดชื่อที่ fuzzy_match ตรงกันทิ้ง (lookup = fuzzy_match ทุกชื่อ)
+เพิ่มชื่อทีละชื่อได้, postings เรียงตาม id, และ CompiledAllergyProfile ที่ใช้ index ให้ผลเหมือน match_pairs
+
+    python -m pytest test/ingredient_index_test.py
+"""
+import random
+import time
+
+import config
+from fuzzy_batch import CompiledAllergyProfile, match_pairs
+from fuzzy_matcher import COMMON_WORDS, fuzzy_match
+from ingredient_index import TrigramIndex
+from inci_normalizer import load_names
+
+from allergy_corpus import EDGE_CASES, MAIN_CASES, corpus, mutate
+
+
+def _full_scan(index, allergen, threshold):
+    return [(name, result["score"], result["reason"])
+            for name in index._names
+            for result in [fuzzy_match(allergen, name, threshold)] if result["match"]]
+
+
+def test_lookup_same_as_full_scan():
+    rng = random.Random(3)
+    names = load_names(config.INCI_NAMES_PATH)
+    index = TrigramIndex(names[:1500] + [i for _, i in MAIN_CASES + EDGE_CASES])
+    allergens = [a for a, _ in MAIN_CASES + EDGE_CASES] + sorted(COMMON_WORDS)
+    allergens += [mutate(rng.choice(names), rng) for _ in range(60)]
+    for allergen in allergens:
+        for threshold in (0.75, 0.85):
+            assert index.lookup(allergen, threshold) == _full_scan(index, allergen, threshold), allergen
+
+
+def test_prunes():
+    index = TrigramIndex(load_names(config.INCI_NAMES_PATH))
+    for allergen in ("PARABENS", "SALICY", "LIMONENE", "sorbic acid"):
+        assert len(index.candidates(allergen, 0.85)) < len(index) * 0.1, allergen
+
+
+def test_incremental_add():
+    index = TrigramIndex(["RETINOL"], max_names=3)
+    assert index.add(" retinol ") == 0
+    assert index.add("METHYLPARABEN") == 1
+    assert index.lookup("PARABENS", 0.85) == _full_scan(index, "PARABENS", 0.85) != []
+    assert index.add("") is None
+    assert index.add("AQUA") == 2
+    assert index.add("GLYCERIN") is None     # เต็มแล้ว
+    assert len(index) == 3 and "aqua" in index and "GLYCERIN" not in index
+    assert index.id("METHYLPARABEN") == 1 and index.name(1) == "METHYLPARABEN"
+    stats = index.stats()
+    assert stats["names"] == 3 and stats["postings"] == sum(len(p) for p in index._postings.values())
+
+
+def test_postings_sorted():
+    index = TrigramIndex(load_names(config.INCI_NAMES_PATH)[:500])
+    index.candidates("PARABENS")             # อ่าน postings ระหว่างเพิ่มชื่อได้ (ไม่ค้าง buffer)
+    index.add("NEW PARABEN")
+    for postings in index._postings.values():
+        assert list(postings) == sorted(set(postings))
+        assert postings.itemsize == 4
+
+
+def test_profile_with_index_same_results():
+    user_allergies, label_lists = corpus(seed=13)
+    index = TrigramIndex(load_names(config.INCI_NAMES_PATH)[:2000])
+    profile = CompiledAllergyProfile(user_allergies, ingredient_index=index)
+    label_lists.append(["NOT AN INGREDIENT", " methylparaben", "Retinol", "RETINOL"])
+    for _ in range(2):                       # รอบสองใช้ผลที่ profile จำไว้
+        for ingredients in label_lists:
+            for threshold in (0.75, 0.85):
+                assert profile.match_pairs(ingredients, threshold) == match_pairs(user_allergies, ingredients,
+                                                                                  threshold)
+            for name in ingredients:
+                index.add(name)              # ชื่อใหม่หลังสร้าง profile ต้องยังถูกต้อง
+
+
+def test_speed():
+    rng = random.Random(1)
+    names = load_names(config.INCI_NAMES_PATH)
+    variants = list(names)
+    while len(variants) < 30000:
+        chars = list(rng.choice(names))
+        chars[rng.randrange(len(chars))] = rng.choice("ABCDEFGHIKLMNOPRSTUY")
+        variants.append("".join(chars) + rng.choice(["", " EXTRACT", " OIL", " ACID"]))
+    start = time.perf_counter()
+    index = TrigramIndex(variants)
+    build_seconds = time.perf_counter() - start
+    allergens = ["PARABENS", "SALICY", "sorbic acid", "LIMONENE", "vitamin c", "SODIUM", "FRAGRANCE", "lanolin"]
+    timings = []
+    for _ in range(20):
+        for allergen in allergens:
+            start = time.perf_counter()
+            index.candidates(allergen, 0.85)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    stats = index.stats()
+    print(f"   {stats['names']} ชื่อ, postings {stats['postings_kb']} KB, สร้าง {build_seconds:.2f}s, "
+          f"ค้นหา median {median * 1000:.2f} ms")
+    assert median < 0.005
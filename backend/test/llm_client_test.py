@@ -0,0 +1,206 @@
+"""
+ทดสอบ llm_client กับ server จำลอง (http.server ในเครื่อง ตอบแบบ Ollama /api/generate)
+ไม่ต้องมี Ollama หรือโมเดลจริง
+
+    python -m pytest test/llm_client_test.py
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_client import CancelToken, LLMCancelled, LLMClient, LLMError, LLMTimeout
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    """
+    ตอบ prompt ตามคำสั่งในตัว prompt:
+        "slow"  - ส่ง token ทุก 0.2 วินาที (20 token)
+        "hang"  - ไม่ตอบอะไรเลยจนกว่า connection จะถูกปิด
+        "error" - ตอบ HTTP 500
+        "json"  - ตอบ JSON ตาม format ที่ขอ
+        "drop"  - ตอบปกติแล้วปิด connection (เหมือน server ปิด keep-alive ที่ว่างนาน)
+        อื่นๆ   - ตอบ prompt กลับทีละคำ
+    """
+
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _token(self, text, done=False):
+        self._chunk(json.dumps({"response": text, "done": done}).encode() + b"\n")
+
+    def do_POST(self):
+        FakeOllama.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeOllama.requests.append(body)
+        prompt = body["prompt"]
+
+        if prompt == "error":
+            message = b'{"error": "model not found"}'
+            self.send_response(500)
+            self.send_header("Content-Length", str(len(message)))
+            self.end_headers()
+            self.wfile.write(message)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if prompt == "hang":
+                time.sleep(5)
+            elif prompt == "slow":
+                for i in range(20):
+                    self._token(f"t{i} ")
+                    time.sleep(0.2)
+            elif prompt == "json":
+                for piece in ('{"results": ', '[{"corrected": ', '"Salicylic Acid"}]}'):
+                    self._token(piece)
+            else:
+                for word in prompt.split():
+                    self._token(word + " ")
+            self._token("", done=True)
+            self._chunk(b"")
+            if prompt == "drop":
+                self.close_connection = True
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture(scope="module")
+def url():
+    """server จำลองตัวเดียวสำหรับทุก test ใน module"""
+    server, server_url = start_server()
+    yield server_url
+    server.shutdown()
+
+
+def test_generate_reuses_connection(url):
+    client = LLMClient(url, "fake-model", keep_alive="10m")
+    FakeOllama.connections.clear()
+    for _ in range(5):
+        assert client.generate("hello pooled world").strip() == "hello pooled world"
+    assert len(FakeOllama.connections) == 1, FakeOllama.connections
+    stats = client.stats()
+    assert stats["connections_opened"] == 1 and stats["reused"] == 4, stats
+
+    body = FakeOllama.requests[-1]
+    assert body["model"] == "fake-model" and body["keep_alive"] == "10m" and body["stream"] is True
+
+
+def test_json_format(url):
+    client = LLMClient(url, "fake-model")
+    schema = {"type": "object"}
+    result = client.generate("json", format=schema)
+    assert result == {"results": [{"corrected": "Salicylic Acid"}]}, result
+    assert FakeOllama.requests[-1]["format"] == schema
+
+
+def test_streaming_tokens(url):
+    client = LLMClient(url, "fake-model")
+    tokens = list(client.stream("one two three"))
+    assert tokens == ["one ", "two ", "three "], tokens
+
+    received = []
+    client.generate("a b", on_token=received.append)
+    assert received == ["a ", "b "], received
+
+
+def test_deadline(url):
+    client = LLMClient(url, "fake-model")
+    start = time.monotonic()
+    try:
+        client.generate("slow", timeout=0.5)
+        raise AssertionError("ควร timeout")
+    except LLMTimeout:
+        pass
+    assert time.monotonic() - start < 1.5
+
+    # deadline ก่อนได้ header ก็ต้อง timeout (ไม่ใช่ error อื่น)
+    try:
+        client.generate("hang", deadline=time.monotonic() + 0.3)
+        raise AssertionError("ควร timeout")
+    except LLMTimeout:
+        pass
+    # connection ที่ timeout ถูกปิดทิ้ง - request ถัดไปยังใช้ได้
+    assert client.generate("still works").strip() == "still works"
+
+
+def test_cancel(url):
+    client = LLMClient(url, "fake-model")
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+    start = time.monotonic()
+    try:
+        client.generate("hang", timeout=10, cancel=token)
+        raise AssertionError("ควรถูกยกเลิก")
+    except LLMCancelled:
+        pass
+    assert time.monotonic() - start < 1.5, "ยกเลิกแล้วต้องหยุดทันที ไม่รอ server"
+
+    # ยกเลิกระหว่าง stream (ใช้ threading.Event ธรรมดา - ตรวจระหว่าง token)
+    event = threading.Event()
+    tokens = []
+    try:
+        for t in client.stream("slow", cancel=event):
+            tokens.append(t)
+            if len(tokens) == 2:
+                event.set()
+        raise AssertionError("ควรถูกยกเลิก")
+    except LLMCancelled:
+        pass
+    assert len(tokens) == 2
+    assert client.stats()["cancelled"] == 2
+
+
+def test_http_error(url):
+    client = LLMClient(url, "fake-model")
+    try:
+        client.generate("error")
+        raise AssertionError("ควร error")
+    except LLMError as e:
+        assert "500" in str(e)
+    assert client.generate("ok").strip() == "ok"
+
+
+def test_stale_connection(url):
+    """server ปิด connection ที่ว่างอยู่ - client ต่อใหม่แล้วส่งซ้ำเองโดยไม่ error"""
+    client = LLMClient(url, "fake-model")
+    assert client.generate("drop").strip() == "drop"
+    time.sleep(0.1)
+    assert client.generate("second").strip() == "second"
+    assert client.stats()["connections_opened"] == 2
+
+
+def test_concurrent(url):
+    client = LLMClient(url, "fake-model", pool_size=4)
+    results = [None] * 8
+
+    def run(i):
+        results[i] = client.generate(f"request {i}").strip()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [f"request {i}" for i in range(8)], results
+    assert client.stats()["idle_connections"] <= 4
@@ -0,0 +1,232 @@
+"""
+ทดสอบ llm_scheduler กับ client จำลอง (ไม่ต้องมี Ollama)
+
+    python -m pytest test/llm_scheduler_test.py
+"""
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from llm_client import CancelToken, LLMCancelled, LLMTimeout
+from llm_scheduler import LLMScheduler, fcntl
+
+
+class FakeClient:
+    """ตอบ prompt กลับหลังรอ delay วินาที - บันทึกลำดับและจำนวน generation ที่ทำพร้อมกัน"""
+
+    timeout = 30
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, deadline=None, cancel=None, format=None, **kwargs):
+        with self._lock:
+            self.calls.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            end = time.monotonic() + self.delay
+            while time.monotonic() < end:
+                if cancel is not None and cancel.is_set():
+                    raise LLMCancelled("cancelled")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise LLMTimeout("timeout")
+                time.sleep(0.01)
+            return {"echo": prompt} if format else f"answer: {prompt}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def stream(self, prompt, **kwargs):
+        yield from self.generate(prompt, **kwargs).split()
+
+    def stats(self):
+        return {}
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=t) for t in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_coalesce_identical_prompts():
+    client = FakeClient()
+    scheduler = LLMScheduler(client, max_concurrent=4)
+    results = [None] * 6
+    run_threads([lambda i=i: results.__setitem__(i, scheduler.generate("same")) for i in range(6)])
+    assert results == ["answer: same"] * 6, results
+    assert client.calls == ["same"], client.calls
+    stats = scheduler.stats()["priorities"]["interactive"]
+    assert stats["requests"] == 6 and stats["coalesced"] == 5 and stats["generated"] == 1, stats
+
+
+def test_coalesced_json_is_copied():
+    scheduler = LLMScheduler(FakeClient(), max_concurrent=2)
+    results = [None] * 2
+    run_threads([lambda i=i: results.__setitem__(i, scheduler.generate("json", format="json")) for i in range(2)])
+    assert results[0] == results[1] and results[0] is not results[1]
+
+
+def test_concurrency_cap():
+    client = FakeClient(delay=0.1)
+    scheduler = LLMScheduler(client, max_concurrent=2)
+    run_threads([lambda i=i: scheduler.generate(f"p{i}") for i in range(6)])
+    assert len(client.calls) == 6 and client.max_active == 2, client.max_active
+
+
+def test_priority_order():
+    client = FakeClient(delay=0.1)
+    scheduler = LLMScheduler(client, max_concurrent=1)
+    blocker = threading.Thread(target=lambda: scheduler.generate("blocker"))
+    blocker.start()
+    time.sleep(0.02)
+
+    threads = []
+    for prompt, priority in [("batch", "batch"), ("background", "background"), ("interactive", "interactive")]:
+        threads.append(threading.Thread(target=lambda p=prompt, c=priority: scheduler.generate(p, priority=c)))
+        threads[-1].start()
+        time.sleep(0.01)
+    for t in [blocker, *threads]:
+        t.join()
+    assert client.calls == ["blocker", "interactive", "background", "batch"], client.calls
+
+
+def test_queue_deadline_and_cancel():
+    client = FakeClient(delay=0.5)
+    scheduler = LLMScheduler(client, max_concurrent=1)
+    blocker = threading.Thread(target=lambda: scheduler.generate("blocker"))
+    blocker.start()
+    time.sleep(0.02)
+
+    try:
+        scheduler.generate("late", timeout=0.1)
+        raise AssertionError("ควร timeout ระหว่างรอคิว")
+    except LLMTimeout:
+        pass
+
+    token = CancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    try:
+        scheduler.generate("cancelled", cancel=token)
+        raise AssertionError("ควรถูกยกเลิกระหว่างรอคิว")
+    except LLMCancelled:
+        pass
+    blocker.join()
+    assert client.calls == ["blocker"] and scheduler.stats()["queued"] == 0
+
+
+def test_follower_retries_when_leader_cancelled():
+    client = FakeClient(delay=0.3)
+    scheduler = LLMScheduler(client, max_concurrent=2)
+    token = CancelToken()
+    errors, results = [], []
+
+    def leader():
+        try:
+            scheduler.generate("shared", cancel=token)
+        except LLMCancelled as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=leader),
+               threading.Thread(target=lambda: results.append(scheduler.generate("shared")))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads[1].start()
+    time.sleep(0.05)
+    token.cancel()
+    for t in threads:
+        t.join()
+    assert len(errors) == 1 and results == ["answer: shared"], (errors, results)
+    assert client.calls == ["shared", "shared"]
+
+
+def test_interactive_does_not_follow_background():
+    client = FakeClient(delay=0.1)
+    scheduler = LLMScheduler(client, max_concurrent=1)
+    finished = []
+
+    def call(priority):
+        scheduler.generate("shared", priority=priority)
+        finished.append(priority)
+
+    threads = [threading.Thread(target=lambda: scheduler.generate("blocker")),
+               threading.Thread(target=call, args=("background",)),
+               threading.Thread(target=call, args=("interactive",)),
+               threading.Thread(target=call, args=("batch",))]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    for t in threads:
+        t.join()
+    # interactive เรียกเองก่อน background ที่รอคิวอยู่ และ batch รอคำตอบของ interactive
+    assert client.calls == ["blocker", "shared", "shared"], client.calls
+    assert sorted(finished[:2]) == ["batch", "interactive"] and finished[2] == "background", finished
+    assert scheduler.stats()["priorities"]["batch"]["coalesced"] == 1
+
+
+def test_stream_uses_slot():
+    client = FakeClient(delay=0.05)
+    scheduler = LLMScheduler(client, max_concurrent=1)
+    assert list(scheduler.stream("a b")) == ["answer:", "a", "b"]
+    assert scheduler.stats()["active"] == 0
+
+
+def test_shared_cap_across_schedulers():
+    if fcntl is None:
+        return
+    client = FakeClient(delay=0.1)
+    with tempfile.TemporaryDirectory() as slots:
+        # scheduler 2 ตัวที่ใช้ directory เดียวกัน = 2 process (flock แยกตามไฟล์ที่เปิด)
+        schedulers = [LLMScheduler(client, max_concurrent=2, slots_dir=slots) for _ in range(2)]
+        run_threads([lambda i=i: schedulers[i % 2].generate(f"p{i}") for i in range(8)])
+    assert len(client.calls) == 8 and client.max_active == 2, client.max_active
+
+
+def test_shared_priority_across_schedulers():
+    if fcntl is None:
+        return
+    client = FakeClient(delay=0.2)
+    with tempfile.TemporaryDirectory() as slots:
+        server = LLMScheduler(client, max_concurrent=1, slots_dir=slots)
+        batch_job = LLMScheduler(client, max_concurrent=1, slots_dir=slots)   # เช่น precompute_explanations.py
+        threads = [threading.Thread(target=lambda: batch_job.generate("batch 1", priority="batch"))]
+        threads[0].start()
+        time.sleep(0.05)
+        threads.append(threading.Thread(target=lambda: batch_job.generate("batch 2", priority="batch")))
+        threads[1].start()
+        time.sleep(0.02)
+        threads.append(threading.Thread(target=lambda: server.generate("scan")))
+        threads[2].start()
+        for t in threads:
+            t.join()
+    assert client.calls == ["batch 1", "scan", "batch 2"], client.calls
+
+
+def test_shared_slot_held_by_other_process():
+    if fcntl is None:
+        return
+    with tempfile.TemporaryDirectory() as slots:
+        holder = subprocess.Popen([sys.executable, "-c", (
+            "import fcntl, os, sys, time\n"
+            f"fd = os.open(os.path.join({slots!r}, 'slot-0.lock'), os.O_RDWR | os.O_CREAT)\n"
+            "fcntl.flock(fd, fcntl.LOCK_EX)\n"
+            "print('locked', flush=True)\n"
+            "time.sleep(0.5)\n"
+        )], stdout=subprocess.PIPE, text=True)
+        assert holder.stdout.readline().strip() == "locked"
+        scheduler = LLMScheduler(FakeClient(delay=0), max_concurrent=1, slots_dir=slots)
+        start = time.monotonic()
+        assert scheduler.generate("after") == "answer: after"
+        waited = time.monotonic() - start
+        holder.wait()
+        holder.stdout.close()
+    assert waited >= 0.3, waited    # รอจน process อื่นปล่อยช่อง (process จบแล้ว lock ถูกปล่อยเอง)
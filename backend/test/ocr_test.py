@@ -1,15 +1,14 @@
-import easyocr
+import os
+import sys
 
-def ocr_image(image_path):
-    reader = easyocr.Reader(['en', 'th'])
-    result = reader.readtext(image_path)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ocr_backends import get_backend
 
-    texts = []
-    for r in result:
-        texts.append(r[1])  # เอาเฉพาะข้อความ
 
-    full_text = "\n".join(texts)
-    return full_text
+def ocr_image(image_path):
+    # ใช้ EasyOCR backend ที่โหลดโมเดลไว้แล้ว (ไม่สร้าง Reader ใหม่ทุกครั้ง)
+    return get_backend("easyocr").recognize(image_path)["text"]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,21 @@
+"""
+ทดสอบการแบ่ง batch ของ precompute_explanations: ชื่อที่มีอีกชื่ออยู่ข้างในต้องไม่อยู่ใน prompt เดียวกัน
+
+    python -m pytest test/precompute_explanations_test.py
+"""
+
+from precompute_explanations import make_batches
+
+
+def test_overlapping_names_split():
+    names = ["BENZOATE", "SODIUM BENZOATE", "RETINOL", "PARABEN", "METHYLPARABEN", "LIMONENE", "LINALOOL"]
+    batches = make_batches(names, 3)
+    assert sorted(name for batch in batches for name in batch) == sorted(names)
+    for batch in batches:
+        assert len(batch) <= 3
+        assert not any(a != b and a in b for a in batch for b in batch), batch
+
+
+def test_batches_keep_order():
+    names = [f"NAME {i:02d}" for i in range(10)]
+    assert make_batches(names, 4) == [names[:4], names[4:8], names[8:]]
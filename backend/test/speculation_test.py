@@ -0,0 +1,125 @@
+"""
+ทดสอบการรวมผลวิเคราะห์ที่เริ่มไว้ก่อน normalize (SpeculativeAnalysis / _reconcile_speculation)
+ใช้ analyze_each_allergen จำลอง - ไม่ต้องมี LLM
+
+    python -m pytest test/speculation_test.py
+"""
+import threading
+
+import pipeline
+from pipeline import SpeculativeAnalysis, _reconcile_speculation
+
+
+class FakeAnalysis:
+    """
+    แทน analyze_each_allergen: ตอบทุกสารด้วยชื่อที่ขอ (เหมือนโหมด parallel)
+    release: ถ้าให้มา จะรอจนกว่าจะ set (หรือถูกยกเลิก) ก่อนตอบ
+    """
+
+    def __init__(self, release=None):
+        self.release = release
+        self.calls = []
+        self.priorities = []
+        self.cancelled = False
+
+    def __call__(self, normalized_ingredients, matching_allergens, on_section=None, deadline=None, use_llm=True,
+                cancel=None, priority="interactive"):
+        names = [m["ingredient"] for m in matching_allergens]
+        self.calls.append(names)
+        self.priorities.append(priority)
+        if self.release is not None:
+            while not self.release.wait(0.01):
+                if cancel is not None and cancel.is_set():
+                    self.cancelled = True
+                    break
+        analyzed = [{"ingredient": name, "description": f"about {name}", "alternatives": []} for name in names]
+        for entry in analyzed:
+            if on_section is not None:
+                on_section(entry)
+        return {"status": "success", "raw_output": " | ".join(names), "analyzed_allergens": analyzed,
+                "stats": {"sent_to_llm": len(names)}}
+
+
+def _match(name, allergen=None):
+    return {"allergen": allergen or name, "ingredient": name, "match_score": 1.0, "reason": "ตรงทุกตัวอักษร"}
+
+
+def _run(speculated, matched, release=None):
+    """เริ่ม speculation ด้วย speculated แล้ว reconcile กับ matched - คืน (ผล, ชื่อที่ส่งให้ client, fake)"""
+    fake = FakeAnalysis(release)
+    original = pipeline.analyze_each_allergen
+    pipeline.analyze_each_allergen = fake
+    emitted = []
+    try:
+        speculation = SpeculativeAnalysis([_match(n) for n in speculated], speculated,
+                                          lambda entry: emitted.append(entry["ingredient"]), None, True)
+        if release is not None:
+            release.set()
+        result = _reconcile_speculation(speculation, matched, [_match(n) for n in matched],
+                                        lambda entry: emitted.append(entry["ingredient"]), None, True)
+    finally:
+        pipeline.analyze_each_allergen = original
+    return result, emitted, fake
+
+
+def test_confirmed_uses_speculative_result():
+    result, emitted, fake = _run(["RETINOL", "LIMONENE"], ["RETINOL", "LIMONENE"])
+    assert fake.calls == [["RETINOL", "LIMONENE"]]          # ไม่ต้องวิเคราะห์ใหม่
+    assert [e["ingredient"] for e in result["analyzed_allergens"]] == ["RETINOL", "LIMONENE"]
+    assert sorted(emitted) == ["LIMONENE", "RETINOL"]
+    assert result["stats"]["speculative"] == 2 and result["stats"]["speculative_dropped"] == 0
+
+
+def test_dropped_substring_name_not_kept():
+    # ชื่อดิบ "BENZOATE" ถูก normalize ทิ้ง แต่ "SODIUM BENZOATE" ยังตรง - ผลของ BENZOATE ต้องไม่ถูกส่ง/เก็บ
+    result, emitted, _ = _run(["BENZOATE", "SODIUM BENZOATE"], ["SODIUM BENZOATE"])
+    assert [e["ingredient"] for e in result["analyzed_allergens"]] == ["SODIUM BENZOATE"]
+    assert emitted == ["SODIUM BENZOATE"]
+    assert result["stats"]["speculative"] == 1 and result["stats"]["speculative_dropped"] == 1
+
+
+def test_new_match_analyzed_separately():
+    result, emitted, fake = _run(["RETINOL"], ["RETINOL", "METHYLPARABEN"])
+    # วิเคราะห์เพิ่มเฉพาะสารใหม่ (thread ของ speculation อาจเรียกทีหลัง - ไม่สนลำดับการเรียก)
+    assert sorted(zip(map(tuple, fake.calls), fake.priorities)) == [(("METHYLPARABEN",), "interactive"),
+                                                                     (("RETINOL",), "background")]
+    assert [e["ingredient"] for e in result["analyzed_allergens"]] == ["RETINOL", "METHYLPARABEN"]
+    assert sorted(emitted) == ["METHYLPARABEN", "RETINOL"]
+    assert result["raw_output"] == "RETINOL\n\nMETHYLPARABEN"
+    assert result["stats"]["sent_to_llm"] == 2 and result["stats"]["speculative"] == 1
+
+
+def test_all_dropped_cancels():
+    release = threading.Event()
+    fake = FakeAnalysis(release)
+    original = pipeline.analyze_each_allergen
+    pipeline.analyze_each_allergen = fake
+    emitted = []
+    try:
+        speculation = SpeculativeAnalysis([_match("BENZOATE")], ["BENZOATE"], emitted.append, None, True)
+        speculation.confirm([])                              # normalize แล้วไม่มีสารที่ตรงเลย
+        speculation._future.result(timeout=5)
+    finally:
+        release.set()
+        pipeline.analyze_each_allergen = original
+    assert fake.cancelled
+    assert emitted == []
+
+
+def test_entries_held_until_confirm():
+    release = threading.Event()
+    fake = FakeAnalysis()
+    original = pipeline.analyze_each_allergen
+    pipeline.analyze_each_allergen = fake
+    emitted = []
+    try:
+        speculation = SpeculativeAnalysis([_match("RETINOL"), _match("BENZOATE")], ["RETINOL", "BENZOATE"],
+                                          lambda entry: emitted.append(entry["ingredient"]), None, True)
+        speculation._future.result(timeout=5)
+        assert emitted == []                                 # ยังไม่ confirm - เก็บไว้ก่อน
+        speculation.confirm({"RETINOL"})
+        assert emitted == ["RETINOL"]
+        assert [e["ingredient"] for e in speculation.result()["analyzed_allergens"]] == ["RETINOL"]
+    finally:
+        release.set()
+        pipeline.analyze_each_allergen = original
@@ -0,0 +1,225 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+
+
+class QueueFullError(Exception):
+    """คิวงานเต็ม - ให้ client ลองใหม่ภายหลัง"""
+
+    def __init__(self, retry_after):
+        super().__init__("pipeline queue is full")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, args, kwargs):
+    """รันใน worker - คืนเวลาที่เริ่มรันจริงด้วย เพื่อคำนวณเวลารอคิว"""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, result
+
+
+def _wait_barrier(barrier):
+    """งานว่างที่บังคับให้ thread pool สร้าง thread ครบทุกตัว"""
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+
+
+class _QueueProgress:
+    """callback ที่ pickle ได้ สำหรับส่ง progress จาก process worker กลับมาทาง queue"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __call__(self, stage, data):
+        self.queue.put((stage, data))
+
+
+class PipelinePool:
+    """
+    Worker pool สำหรับรันงาน sync ที่ใช้เวลานาน (OCR, LLM) นอก event loop
+
+    - รันได้พร้อมกัน `workers` งาน
+    - รอคิวได้อีก `queue_size` งาน ถ้าเกินจะ raise QueueFullError ทันที
+      (ไม่ปล่อยให้ connection ค้างรอ)
+    """
+
+    def __init__(self, workers, queue_size, executor_type="thread", retry_after=30, initializer=None):
+        """initializer: ฟังก์ชันที่รันครั้งเดียวในแต่ละ worker (เช่นโหลด OCR engine)"""
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.executor_type = executor_type
+        self.retry_after = retry_after
+
+        if executor_type == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=initializer
+            )
+        else:
+            self.executor_type = "thread"
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="pipeline",
+                initializer=initializer
+            )
+
+        self._manager = None  # multiprocessing.Manager สำหรับส่ง progress (process mode)
+
+        self._lock = threading.Lock()
+        self._pending = 0      # งานที่รับเข้ามาแล้วแต่ยังไม่เสร็จ (รันอยู่ + รอคิว)
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    @classmethod
+    def from_config(cls, initializer=None):
+        return cls(
+            workers=config.PIPELINE_WORKERS,
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            executor_type=config.PIPELINE_EXECUTOR,
+            retry_after=config.PIPELINE_RETRY_AFTER,
+            initializer=initializer
+        )
+
+    def warm_up(self):
+        """
+        สร้าง worker ให้ครบทุกตัวตั้งแต่ start server (initializer จะทำงานในแต่ละ worker)
+        ไม่รอให้เสร็จ - request ที่เข้ามาระหว่างนี้จะต่อคิวตามปกติ
+        """
+        if self.executor_type == "thread":
+            barrier = threading.Barrier(self.workers, timeout=120)
+            for _ in range(self.workers):
+                self._executor.submit(_wait_barrier, barrier)
+        else:
+            for _ in range(self.workers):
+                self._executor.submit(time.sleep, 0)
+
+    async def run(self, fn, *args, **kwargs):
+        """ส่งงานเข้า pool แล้วรอผล (ไม่ block event loop)"""
+        return await self.submit(fn, *args, **kwargs)
+
+    def submit(self, fn, *args, on_progress=None, **kwargs):
+        """
+        รับงานเข้าคิวทันที (raise QueueFullError ถ้าคิวเต็ม) แล้วคืน asyncio.Future ของผลลัพธ์
+
+        on_progress(stage, data) จะถูกเรียกใน event loop เสมอ
+        ไม่ว่า worker จะเป็น thread หรือ process
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise QueueFullError(self.retry_after)
+            self._pending += 1
+
+        return asyncio.ensure_future(self._run_admitted(fn, args, kwargs, on_progress))
+
+    async def _run_admitted(self, fn, args, kwargs, on_progress):
+        submitted = time.time()
+        loop = asyncio.get_running_loop()
+
+        relay = None
+        if on_progress is not None:
+            if self.executor_type == "process":
+                relay = self._start_progress_relay(loop, on_progress)
+                kwargs = dict(kwargs, on_progress=_QueueProgress(relay[0]))
+            else:
+                kwargs = dict(
+                    kwargs,
+                    on_progress=lambda stage, data: loop.call_soon_threadsafe(on_progress, stage, data)
+                )
+
+        try:
+            future = self._executor.submit(_timed_call, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+                self._failed += 1
+            if relay is not None:
+                relay[0].put(None)
+            raise
+        # คืนช่องตอนงานใน worker จบจริง - ถ้าคนรอถูกยกเลิก (client หลุด) งานที่รันอยู่ยังใช้ worker ต่อจนเสร็จ
+        future.add_done_callback(lambda done: self._finish(done, submitted))
+
+        try:
+            _, result = await asyncio.wrap_future(future)
+        finally:
+            if relay is not None:
+                relay[0].put(None)
+                await loop.run_in_executor(None, relay[1].join)
+        return result
+
+    def _finish(self, future, submitted):
+        """บันทึกผลของงานที่จบใน executor แล้ว (เสร็จ, error หรือถูกยกเลิกก่อนได้รัน) แล้วคืนช่องในคิว"""
+        finished = time.time()
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                return
+            started, _ = future.result()
+            wait = max(0.0, started - submitted)
+            run_time = max(0.0, finished - started)
+            self._completed += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._wait_last = wait
+            self._run_total += run_time
+            self._run_max = max(self._run_max, run_time)
+
+    def _start_progress_relay(self, loop, on_progress):
+        """thread ที่อ่าน progress จาก process worker แล้วส่งต่อเข้า event loop"""
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        queue = self._manager.Queue()
+
+        def relay():
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+                loop.call_soon_threadsafe(on_progress, *item)
+
+        thread = threading.Thread(target=relay, name="progress-relay", daemon=True)
+        thread.start()
+        return queue, thread
+
+    def stats(self):
+        """สถิติสำหรับปรับขนาด pool (queue depth, เวลารอ, เวลารัน)"""
+        with self._lock:
+            running = min(self._pending, self.workers)
+            done = self._completed
+            return {
+                "executor": self.executor_type,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": running,
+                "queued": self._pending - running,
+                "completed": done,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_seconds": {
+                    "avg": round(self._wait_total / done, 3) if done else 0.0,
+                    "max": round(self._wait_max, 3),
+                    "last": round(self._wait_last, 3)
+                },
+                "run_seconds": {
+                    "avg": round(self._run_total / done, 3) if done else 0.0,
+                    "max": round(self._run_max, 3)
+                }
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()